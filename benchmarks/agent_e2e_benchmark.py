@@ -0,0 +1,352 @@
+"""Offline end-to-end latency, steps, tool calls and tokens per question.
+
+Builds the agent the way setup_agent in chainlit-app.py does (prompt with the
+schema digest, trimming state modifier, SQL toolkit with the local query
+checker and async query tool, optional fast model for tool steps, prompt
+caching client) without AWS:
+
+- Bedrock is the FakeBedrockRuntime stub behind the real ChatBedrock, replaying
+  the scripted ReAct trajectories in benchmarks/agent_corpus.json
+- the data lake is the windfarm parquet data from cdk/example-data.zip loaded
+  into SQLite, queried through FakeAthenaClient and the async Athena executor
+
+Runs the QUESTIONS of chainlit-app.py and the rest of the corpus, each
+conversation in its own thread, and writes the per-question measurements and
+their p50/p95 as JSON so runs can be compared over time. Model and query
+latencies are zero unless given, which measures the app's own overhead.
+
+    python benchmarks/agent_e2e_benchmark.py --repeat 3 --output results.json
+    python benchmarks/agent_e2e_benchmark.py --llm-profile 0.45 0.00001 0.008 --query-latency 1.5
+"""
+import argparse
+import ast
+import asyncio
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytz  # noqa: E402
+from langchain_aws import ChatBedrock  # noqa: E402
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit  # noqa: E402
+from langchain_core.messages import SystemMessage  # noqa: E402
+from langchain_core.tools import tool  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from utils.agent_graph import FAST_MODEL_ID, FAST_MODEL_TAG, create_agent  # noqa: E402
+from utils.athena_executor import AthenaQueryExecutor, with_async_query_tool  # noqa: E402
+from utils.blocking import run_blocking  # noqa: E402
+from utils.message_compaction import COMPACTION_TAG  # noqa: E402
+from utils.message_trimming import (  # noqa: E402
+    CONTEXT_BUDGET_OPTIONS, RESPONSE_MAX_TOKENS, configured_state_modifier, context_budget)
+from utils.metrics import TurnMetrics, current_turn  # noqa: E402
+from utils.metrics_callbacks import MetricsCallbackHandler  # noqa: E402
+from utils.prompt_caching import PromptCachingClient  # noqa: E402
+from utils.result_cache import result_cache  # noqa: E402
+from utils.schema_cache import CachedSQLDatabase, SchemaCache  # noqa: E402
+from utils.sql_validator import with_local_query_checker  # noqa: E402
+from fake_athena import FakeAthenaClient  # noqa: E402
+from fake_bedrock import FakeBedrockRuntime, text_reply, tool_use_reply  # noqa: E402
+from local_data_lake import EXAMPLE_DATA_ZIP, build_sqlite  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "chainlit-app.py")
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "agent_corpus.json")
+DEFAULT_MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+TIMEZONE = pytz.timezone("Australia/Sydney")
+
+# The BusinessOrientedPrompt from cdk/cdk/prompts_stack.py, the app's default prompt
+PROMPT_TEMPLATE = """
+You are a data analyst that analyses data in a database, and provides stats and analysis to users.
+You have access to a {dialect} database, which contains multiple tables of data.
+The current date and time is: {current_datetime}
+The current Unix epoch time (in milliseconds) is: {current_epoch}
+
+Follow the below steps when querying the database:
+
+1. If you need to query the database, list the tables first and their columns and the first couple of rows to see what you can query then create a syntactically correct {dialect} query to run.
+
+2. Use the LIMIT and DISTINCT clause in your SQL queries where possible to minimise the amount of data returned.
+
+3. If you get an error while executing a query, rewrite the query and try again.
+
+4. Look at the results of the query and return the answer to the question directly in plain english sentences.
+
+5. At the end of your answer output the final SQL you used. Do not include SQL that returned errors.
+
+
+Here are some extra tips you can use if you get stuck:
+- Do not use the DATE_SUB function in your query, use the date_add function instead using the following format:
+SELECT assetid
+        FROM example-data-crawler
+        WHERE CAST(sensortimestamp AS timestamp) > date_add('hour', -24, CAST(CURRENT_TIMESTAMP AS timestamp));
+Use the FLOAT type in DDL statements like CREATE TABLE and the REAL type in SQL functions like SELECT CAST.
+
+- Always convert unix epoch time to local time in your answers.
+- Do NOT use XML tags
+
+
+"""
+
+
+def app_questions(path=APP_PATH):
+    # The fixed QUESTIONS of the app, read without importing it (it needs its environment)
+    with open(path) as f:
+        module = ast.parse(f.read())
+    for node in module.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "QUESTIONS" for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"No QUESTIONS in {path}")
+
+
+def load_conversations(path, selection):
+    with open(path) as f:
+        conversations = json.load(f)["conversations"]
+    questions = app_questions()
+    fixed = [c for c in conversations if [turn["question"] for turn in c["turns"]] == questions]
+    if not fixed:
+        raise ValueError(f"{path} has no conversation scripting the QUESTIONS of chainlit-app.py")
+    if selection == "fixed":
+        return fixed
+    if selection == "corpus":
+        return [c for c in conversations if c not in fixed]
+    return conversations
+
+
+class ScriptedReplies:
+    # The Bedrock respond callback: finds the question being answered and replies
+    # with the next step of its trajectory, counting the assistant turns since it
+
+    def __init__(self, conversations):
+        self.turns = {turn["question"]: turn for c in conversations for turn in c["turns"]}
+
+    def __call__(self, body):
+        step = 0
+        question = None
+        for message in reversed(body["messages"]):
+            content = message["content"]
+            blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content
+            if message["role"] == "assistant":
+                step += 1
+                continue
+            texts = [block["text"] for block in blocks if block["type"] == "text"]
+            if texts:
+                question = texts[-1]
+                break
+
+        turn = self.turns.get(question)
+        if turn is None:
+            return text_reply("I can only answer the questions in the benchmark corpus.")
+        if step < len(turn["steps"]):
+            return [block for call in turn["steps"][step] for block in tool_use_reply(call["name"], call["args"])]
+        return text_reply(turn["answer"])
+
+
+def build_database(database_path, query_latency):
+    engine = create_engine(f"sqlite:///{database_path}")
+    athena_executor = AthenaQueryExecutor(FakeAthenaClient(database_path, latency=query_latency), database="default")
+    return CachedSQLDatabase(engine, schema_cache=SchemaCache(str(engine.url), cache_dir=None),
+                             athena_executor=athena_executor)
+
+
+def build_agent(db, client, model_id, fast_tool_steps, context_budget_option, session):
+    # Mirrors setup_agent in chainlit-app.py, with `session` in place of cl.user_session
+    current_datetime = datetime.now(TIMEZONE)
+    system_content = PROMPT_TEMPLATE.format(
+        dialect="trino",
+        current_datetime=current_datetime.strftime("%Y-%m-%d %H:%M:%S %Z"),
+        current_epoch=int(current_datetime.timestamp() * 1000),
+    )
+    schema_digest = db.schema_digest()
+    session["schema_digest"] = schema_digest
+    if schema_digest:
+        system_content = f"{system_content}\n\n{schema_digest}"
+    session["system_message"] = SystemMessage(content=system_content)
+    session["max_tokens"] = context_budget(context_budget_option)
+
+    model_kwargs = {
+        "max_tokens": RESPONSE_MAX_TOKENS, "temperature": 0.1,
+        "top_k": 250, "top_p": 0.9, "stop_sequences": ["\n\nHuman"],
+    }
+    model = ChatBedrock(client=client, model_id=model_id, model_kwargs=model_kwargs)
+    fast_model = None
+    if fast_tool_steps and model_id != FAST_MODEL_ID:
+        fast_model = ChatBedrock(client=client, model_id=FAST_MODEL_ID, model_kwargs=model_kwargs)
+
+    toolkit = SQLDatabaseToolkit(db=db, llm=model)
+    sql_tools = with_local_query_checker(with_async_query_tool(toolkit.get_tools(), db), db)
+
+    @tool
+    def epoch_to_local(epoch_time: int):
+        """Use this to convert Unix epoch time (in milliseconds) to local time."""
+        local_time = datetime.fromtimestamp(epoch_time / 1000, TIMEZONE)
+        return f"The local time for epoch {epoch_time} (milliseconds) in {TIMEZONE} is {local_time}"
+
+    return create_agent(model, sql_tools + [epoch_to_local], state_modifier=configured_state_modifier(model),
+                        checkpointer=MemorySaver(), fast_model=fast_model)
+
+
+async def set_schema_context(db, question, session):
+    # As set_schema_context in chainlit-app.py
+    if session.get("schema_digest"):
+        return
+    table_names = await run_blocking(db.relevant_tables, question) or session.get("schema_tables", [])
+    session["schema_tables"] = table_names
+    session["schema_context"] = None
+    if table_names:
+        table_info = await run_blocking(db.get_table_info, table_names)
+        session["schema_context"] = f"These are the tables most relevant to the question.\n\n{table_info}"
+
+
+def message_text(message):
+    # As message_text in chainlit-app.py
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block.get("text", "") for block in message.content
+        if isinstance(block, dict) and block.get("type") in ("text", "text_delta")
+    )
+
+
+async def run_turn(agent, db, question, thread_id, session):
+    # What on_message and stream_agent_answer do for a question, minus the UI
+    turn = TurnMetrics()
+    current_turn.set(turn)
+    start = time.perf_counter()
+    first_token = None
+    answer = ""
+    await set_schema_context(db, question, session)
+    # As agent_config in chainlit-app.py
+    system_message = session["system_message"]
+    if session.get("schema_context"):
+        system_message = SystemMessage(content=f"{system_message.content}\n\n{session['schema_context']}")
+    config = {"callbacks": [MetricsCallbackHandler(turn)], "recursion_limit": 50,
+              "configurable": {"thread_id": thread_id, "system_message": system_message,
+                               "max_tokens": session["max_tokens"], "enable_trimming": True}}
+    async for event in agent.astream_events({"messages": [("human", question)]}, config=config, version="v2"):
+        tags = event.get("tags", [])
+        if event["metadata"].get("langgraph_node") != "agent" or FAST_MODEL_TAG in tags or COMPACTION_TAG in tags:
+            continue
+        if event["event"] == "on_chat_model_stream":
+            chunk = event["data"]["chunk"]
+            if message_text(chunk) and not chunk.tool_call_chunks:
+                first_token = first_token or time.perf_counter()
+        elif event["event"] == "on_chat_model_end" and not event["data"]["output"].tool_calls:
+            answer = message_text(event["data"]["output"])
+    turn.finish()
+    totals = turn.totals
+    return {
+        "latency_ms": round(turn.duration * 1000, 2),
+        "first_token_ms": round((first_token - start) * 1000, 2) if first_token else None,
+        "steps": totals["llm_calls"],
+        "tool_calls": totals["tool_calls"],
+        "tool_errors": totals["tool_errors"],
+        "athena_queries": totals["athena_queries"],
+        "input_tokens": totals["input_tokens"],
+        "total_input_tokens": totals["input_tokens"] + totals["cache_read_tokens"] + totals["cache_write_tokens"],
+        "output_tokens": totals["output_tokens"],
+        "cache_read_tokens": totals["cache_read_tokens"],
+        "cache_write_tokens": totals["cache_write_tokens"],
+    }, answer
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarise(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99),
+            "mean": round(sum(values) / len(values), 2), "max": max(values)}
+
+
+async def run_benchmark(args, conversations, database_path):
+    runtime = FakeBedrockRuntime(
+        respond=ScriptedReplies(conversations), latency=args.llm_profile[0],
+        input_token_seconds=args.llm_profile[1], output_token_seconds=args.llm_profile[2])
+    client = PromptCachingClient(runtime, enabled=not args.no_prompt_caching)
+    db = build_database(database_path, args.query_latency)
+
+    results = []
+    for repeat in range(args.repeat):
+        for conversation in conversations:
+            session = {}
+            agent = await run_blocking(build_agent, db, client, args.model_id, args.fast_tool_steps,
+                                       args.context_budget, session)
+            thread_id = f"{conversation['name']}-{repeat}"
+            for index, turn in enumerate(conversation["turns"]):
+                measurements, answer = await run_turn(agent, db, turn["question"], thread_id, session)
+                results.append({"conversation": conversation["name"], "turn": index, "repeat": repeat,
+                                "question": turn["question"], **measurements,
+                                "answered_as_scripted": answer == turn["answer"]})
+    return results, len(runtime.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--set", choices=["fixed", "corpus", "all"], default="all",
+                        help="The app's QUESTIONS, the rest of the corpus, or both")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--fast-tool-steps", action="store_true",
+                        help="Route tool steps to FAST_MODEL_ID, as the Model Routing setting does")
+    parser.add_argument("--context-budget", default=CONTEXT_BUDGET_OPTIONS[0], choices=CONTEXT_BUDGET_OPTIONS)
+    parser.add_argument("--no-prompt-caching", action="store_true")
+    parser.add_argument("--llm-profile", type=float, nargs=3, default=[0.0, 0.0, 0.0],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    parser.add_argument("--query-latency", type=float, default=0.0, help="Seconds each Athena query runs")
+    parser.add_argument("--data", default=EXAMPLE_DATA_ZIP)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.corpus, args.set)
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "example-data.db")
+        rows = build_sqlite(database_path, args.data)
+        start = time.perf_counter()
+        turns, bedrock_requests = asyncio.run(run_benchmark(args, conversations, database_path))
+        wall_seconds = time.perf_counter() - start
+
+    metrics = ["latency_ms", "first_token_ms", "steps", "tool_calls", "tool_errors",
+               "input_tokens", "total_input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"]
+    report = {
+        "benchmark": "agent_e2e",
+        "timestamp": datetime.now(pytz.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "data")},
+        "tables": rows,
+        "summary": {
+            "questions": len(turns),
+            "wall_seconds": round(wall_seconds, 2),
+            "bedrock_requests": bedrock_requests,
+            "answered_as_scripted": sum(turn["answered_as_scripted"] for turn in turns),
+            "result_cache": result_cache.stats(),
+            **{metric: summarise([turn[metric] for turn in turns]) for metric in metrics},
+        },
+        "turns": turns,
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    summary = report["summary"]
+    print(f"{summary['questions']} questions in {summary['wall_seconds']}s: latency p50 "
+          f"{summary['latency_ms']['p50']}ms p95 {summary['latency_ms']['p95']}ms, "
+          f"{summary['steps']['mean']} steps, {summary['tool_calls']['mean']} tool calls, "
+          f"{summary['total_input_tokens']['mean']} input tokens per question", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
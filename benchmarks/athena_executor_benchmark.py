@@ -0,0 +1,82 @@
+"""Many concurrent Athena queries: thread-per-query polling vs the async executor.
+
+The blocking path mimics PyAthena: each query holds an executor thread and polls
+GetQueryExecution every second. The async path uses utils.athena_executor.
+
+    python benchmarks/athena_executor_benchmark.py --queries 40 --latency 2
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_athena import FakeAthenaClient  # noqa: E402
+from utils.athena_executor import AthenaQueryExecutor  # noqa: E402
+
+QUERY = "SELECT assetid, AVG(temperature) FROM windfarm GROUP BY assetid"
+
+
+def build_sqlite(path):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE windfarm (assetid TEXT, temperature REAL)")
+    connection.executemany("INSERT INTO windfarm VALUES (?, ?)",
+                           [(f"turbine-{i % 5}", 40 + i % 7) for i in range(500)])
+    connection.commit()
+    connection.close()
+
+
+def blocking_query(client):
+    query_execution_id = client.start_query_execution(QueryString=QUERY)["QueryExecutionId"]
+    while client.get_query_execution(QueryExecutionId=query_execution_id)[
+            "QueryExecution"]["Status"]["State"] in ("QUEUED", "RUNNING"):
+        time.sleep(1.0)
+    return client.get_query_results(QueryExecutionId=query_execution_id)
+
+
+async def run_blocking_path(client, queries, workers):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        await asyncio.gather(*(loop.run_in_executor(pool, blocking_query, client) for _ in range(queries)))
+
+
+async def run_async_path(client, queries):
+    executor = AthenaQueryExecutor(client, database="default")
+    await asyncio.gather(*(executor.execute(QUERY) for _ in range(queries)))
+
+
+def report(label, client, start):
+    print(f"{label:<22} wall={time.perf_counter() - start:6.2f}s  "
+          f"GetQueryExecution calls={client.calls['get_query_execution']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=2.0)
+    # Default executor size on a 1 vCPU task: min(32, cpus + 4)
+    parser.add_argument("--workers", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "windfarm.db")
+        build_sqlite(path)
+
+        client = FakeAthenaClient(path, latency=args.latency)
+        start = time.perf_counter()
+        asyncio.run(run_blocking_path(client, args.queries, args.workers))
+        report(f"blocking ({args.workers} threads)", client, start)
+
+        client = FakeAthenaClient(path, latency=args.latency)
+        start = time.perf_counter()
+        asyncio.run(run_async_path(client, args.queries))
+        report("async executor", client, start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Bedrock calls from many sessions against a throttling quota, with and without the limiter.
+
+Sessions call one model through FakeBedrockRuntime behind ThrottlingBedrockRuntime,
+which throttles calls over --quota requests per second or concurrent calls, as
+Bedrock does. Most sessions make their calls one after another, as ReAct steps
+do; --greedy-sessions make theirs --greedy-parallel at a time, as parallel
+tool-selection steps of a long conversation can.
+
+The calls are made three ways:
+  botocore  - straight to the stub, retried as botocore's standard mode does
+              (3 attempts, up to 2**attempt seconds of full jitter)
+  adaptive  - through ThrottledBedrockClient with no quota set: the concurrency
+              limit adapts to the throttling
+  limited   - through ThrottledBedrockClient with the stub's quota as the model's
+              BEDROCK_MODEL_QUOTAS entry
+
+Reported per mode: failed calls, throttles, call latency, session durations of
+the sequential and the greedy sessions, and the largest queue depth.
+
+    python benchmarks/bedrock_throttling_benchmark.py --sessions 20 --calls 8 --quota 10 4
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from botocore.exceptions import ClientError  # noqa: E402
+from fake_bedrock import FakeBedrockRuntime, ThrottlingBedrockRuntime  # noqa: E402
+from agent_e2e_benchmark import summarise  # noqa: E402
+from utils.bedrock_client import ThrottledBedrockClient  # noqa: E402
+from utils.metrics import SessionMetrics, TurnMetrics, current_turn  # noqa: E402
+
+MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+BODY = json.dumps({"anthropic_version": "bedrock-2023-05-31", "max_tokens": 256,
+                   "messages": [{"role": "user", "content": "Which turbine ran hottest?"}]})
+
+
+class BotocoreStandardRetries:
+    # The stub called as boto3 does by default: standard retry mode
+
+    def __init__(self, client, max_attempts=3, max_backoff=20):
+        self._client = client
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+    def invoke_model(self, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self._client.invoke_model(**kwargs)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ThrottlingException" or attempt == self.max_attempts:
+                    raise
+            time.sleep(min(self.max_backoff, random.random() * 2 ** attempt))
+
+
+def call(client):
+    start = time.perf_counter()
+    try:
+        client.invoke_model(modelId=MODEL_ID, body=BODY)
+        error = False
+    except ClientError:
+        error = True
+    return {"latency_ms": round((time.perf_counter() - start) * 1000, 2), "error": error}
+
+
+def run_session(client, calls, parallel):
+    # Calls go in batches of `parallel`, each batch waiting for the last
+    current_turn.set(TurnMetrics(SessionMetrics()))
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for i in range(0, calls, parallel):
+            batch = [pool.submit(copy_context().run, call, client) for _ in range(min(parallel, calls - i))]
+            results += [future.result() for future in batch]
+    return {"duration_ms": round((time.perf_counter() - start) * 1000, 2), "calls": results}
+
+
+def run_mode(mode, args):
+    stub = ThrottlingBedrockRuntime(
+        FakeBedrockRuntime(latency=args.latency), requests_per_second=args.quota[0],
+        max_concurrency=int(args.quota[1]), burst=args.quota[0])
+    if mode == "botocore":
+        client = BotocoreStandardRetries(stub)
+    elif mode == "adaptive":
+        client = ThrottledBedrockClient(stub, quotas={})
+    else:
+        client = ThrottledBedrockClient(stub, quotas={MODEL_ID: {
+            "requests_per_minute": args.quota[0] * 60, "max_concurrency": int(args.quota[1])}})
+
+    max_queue_depth = 0
+    stop = threading.Event()
+
+    def sample_queue():
+        nonlocal max_queue_depth
+        while not stop.wait(0.01):
+            if isinstance(client, ThrottledBedrockClient):
+                max_queue_depth = max(max_queue_depth, client.limiter(MODEL_ID).stats()["waiting"])
+
+    sampler = threading.Thread(target=sample_queue, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    sessions = args.sessions + args.greedy_sessions
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = []
+        for i in range(sessions):
+            greedy = i < args.greedy_sessions
+            futures.append((greedy, pool.submit(
+                run_session, client, args.greedy_calls if greedy else args.calls,
+                args.greedy_parallel if greedy else 1)))
+            time.sleep(args.ramp_seconds / sessions)
+        records = [(greedy, future.result()) for greedy, future in futures]
+    wall_seconds = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    calls = [c for _, record in records for c in record["calls"]]
+    return {
+        "calls": len(calls),
+        "failed_calls": sum(c["error"] for c in calls),
+        "throttles": stub.throttled,
+        "stub_calls": stub.calls,
+        "wall_seconds": round(wall_seconds, 2),
+        "call_latency_ms": summarise([c["latency_ms"] for c in calls if not c["error"]]),
+        "session_ms": summarise([r["duration_ms"] for greedy, r in records if not greedy]),
+        "greedy_session_ms": summarise([r["duration_ms"] for greedy, r in records if greedy]),
+        "max_queue_depth": max_queue_depth,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions making their calls one at a time")
+    parser.add_argument("--calls", type=int, default=8, help="Calls per session")
+    parser.add_argument("--greedy-sessions", type=int, default=2)
+    parser.add_argument("--greedy-calls", type=int, default=24)
+    parser.add_argument("--greedy-parallel", type=int, default=6)
+    parser.add_argument("--ramp-seconds", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per Bedrock call")
+    parser.add_argument("--quota", type=float, nargs=2, default=[10.0, 4], metavar=("REQUESTS_PER_SECOND", "CONCURRENCY"))
+    parser.add_argument("--modes", nargs="+", default=["botocore", "adaptive", "limited"],
+                        choices=["botocore", "adaptive", "limited"])
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        results[mode] = result = run_mode(mode, args)
+        print(f"{mode:<9} {result['calls']} calls, {result['failed_calls']} failed, "
+              f"{result['throttles']} throttled, latency p50 {result['call_latency_ms']['p50']:.0f}ms "
+              f"p99 {result['call_latency_ms']['p99']:.0f}ms, session p50 {result['session_ms']['p50']:.0f}ms "
+              f"max {result['session_ms']['max']:.0f}ms, max queue {result['max_queue_depth']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "benchmark": "bedrock_throttling",
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "python": platform.python_version(),
+                "settings": {key: value for key, value in vars(args).items() if key != "output"},
+                "modes": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
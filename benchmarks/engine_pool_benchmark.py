@@ -0,0 +1,79 @@
+"""Chat-start latency with a per-session engine vs the shared engine registry.
+
+Opens N concurrent "sessions" against a local SQLite stand-in for Athena. Each
+session does the DB work `setup_agent` does on chat start: obtain a SQLDatabase
+and list the usable tables.
+
+    python benchmarks/engine_pool_benchmark.py --sessions 50 --tables 40
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from langchain_community.utilities import SQLDatabase  # noqa: E402
+from utils import db_engine  # noqa: E402
+
+
+def build_sqlite(path, tables):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for i in range(tables):
+            conn.execute(text(
+                f"CREATE TABLE turbine_{i} (assetid TEXT, sensortimestamp INTEGER, "
+                "temperature REAL, rpm REAL, status TEXT)"
+            ))
+            conn.execute(text(
+                f"INSERT INTO turbine_{i} VALUES ('turbine-1', 1729565872573, 41.5, 12.1, 'ok')"
+            ))
+    engine.dispose()
+
+
+def open_session_per_call(connection_string):
+    start = time.perf_counter()
+    db = SQLDatabase(create_engine(connection_string, echo=False))
+    db.get_usable_table_names()
+    return time.perf_counter() - start
+
+
+def open_session_shared(connection_string):
+    start = time.perf_counter()
+    db = db_engine.get_database(connection_string)
+    db.get_usable_table_names()
+    return time.perf_counter() - start
+
+
+def run(label, fn, connection_string, sessions):
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        wall_start = time.perf_counter()
+        timings = list(pool.map(lambda _: fn(connection_string), range(sessions)))
+        wall = time.perf_counter() - wall_start
+    timings.sort()
+    p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"{label:<12} wall={wall * 1000:8.1f}ms  "
+          f"p50={statistics.median(timings) * 1000:8.1f}ms  p95={p95 * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection_string = f"sqlite:///{os.path.join(tmp, 'datalake.db')}"
+        build_sqlite(os.path.join(tmp, "datalake.db"), args.tables)
+
+        run("per-session", open_session_per_call, connection_string, args.sessions)
+        run("shared", open_session_shared, connection_string, args.sessions)
+        db_engine.dispose_all()
+
+
+if __name__ == "__main__":
+    main()
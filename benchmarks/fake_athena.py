@@ -0,0 +1,97 @@
+"""Local stand-in for the Athena API, backed by SQLite.
+
+Implements the boto3 calls used by utils.athena_executor with a configurable
+query latency, so the executor can be exercised without AWS.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def _athena_type(value):
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "bigint"
+    if isinstance(value, float):
+        return "double"
+    return "varchar"
+
+
+class FakeAthenaClient:
+    def __init__(self, database_path, latency=2.0, queue_time=0.0):
+        self.database_path = database_path
+        self.latency = latency
+        self.queue_time = queue_time
+        self._lock = threading.Lock()
+        self._executions = {}
+        self.calls = {"start_query_execution": 0, "get_query_execution": 0,
+                      "get_query_results": 0, "stop_query_execution": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def start_query_execution(self, QueryString, QueryExecutionContext=None, WorkGroup=None,
+                              ResultConfiguration=None):
+        self._count("start_query_execution")
+        query_execution_id = str(uuid.uuid4())
+        execution = {"started": time.monotonic(), "state": None, "error": None, "columns": [], "rows": []}
+        try:
+            connection = sqlite3.connect(self.database_path)
+            cursor = connection.execute(QueryString)
+            execution["rows"] = cursor.fetchall()
+            execution["columns"] = [
+                {"Name": description[0],
+                 "Type": _athena_type(execution["rows"][0][i]) if execution["rows"] else "varchar"}
+                for i, description in enumerate(cursor.description or [])
+            ]
+            connection.close()
+        except sqlite3.Error as e:
+            execution["error"] = str(e)
+        with self._lock:
+            self._executions[query_execution_id] = execution
+        return {"QueryExecutionId": query_execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        self._count("get_query_execution")
+        with self._lock:
+            execution = self._executions[QueryExecutionId]
+            elapsed = time.monotonic() - execution["started"]
+            if execution["state"] is None:
+                if elapsed < self.queue_time:
+                    state = "QUEUED"
+                elif elapsed < self.queue_time + self.latency:
+                    state = "RUNNING"
+                else:
+                    state = "FAILED" if execution["error"] else "SUCCEEDED"
+            else:
+                state = execution["state"]
+        status = {"State": state}
+        if state == "FAILED":
+            status["StateChangeReason"] = execution["error"]
+        return {"QueryExecution": {"QueryExecutionId": QueryExecutionId, "Status": status,
+                                   "StatementType": "DML"}}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        self._count("get_query_results")
+        execution = self._executions[QueryExecutionId]
+        header = {"Data": [{"VarCharValue": column["Name"]} for column in execution["columns"]]}
+        rows = [header] + [
+            {"Data": [{} if value is None else {"VarCharValue": str(value).lower() if isinstance(value, bool)
+                                                else str(value)} for value in row]}
+            for row in execution["rows"]
+        ]
+        start = int(NextToken or 0)
+        response = {"ResultSet": {"Rows": rows[start:start + MaxResults],
+                                  "ResultSetMetadata": {"ColumnInfo": execution["columns"]}}}
+        if start + MaxResults < len(rows):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def stop_query_execution(self, QueryExecutionId):
+        self._count("stop_query_execution")
+        with self._lock:
+            self._executions[QueryExecutionId]["state"] = "CANCELLED"
+        return {}
@@ -0,0 +1,213 @@
+"""In-process stand-in for the bedrock-runtime client used by ChatBedrock.
+
+Answers Anthropic messages API requests on invoke_model and
+invoke_model_with_response_stream with replies from a `respond(body)` callback,
+in the same response and event formats as Bedrock, so the real ChatBedrock
+parses them. Input tokens are estimated at four characters per token, and the
+prompt cache is modelled on the request prefix up to each cache_control
+checkpoint, so cache read and write tokens come back as Bedrock reports them.
+Each call takes `latency` seconds plus a time per uncached input token and per
+output token. Every request body is kept in `requests` for inspection.
+
+ThrottlingBedrockRuntime wraps it with Bedrock's per-model quotas, failing calls
+over the rate or concurrency limit with ThrottlingException.
+"""
+import hashlib
+import io
+import json
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+CACHE_MIN_TOKENS = 1024
+
+
+def estimate_tokens(value):
+    return max(1, len(json.dumps(value)) // 4) if value else 0
+
+
+def text_reply(text):
+    return [{"type": "text", "text": text}]
+
+
+def tool_use_reply(name, arguments, text=""):
+    blocks = text_reply(text) if text else []
+    return blocks + [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:20]}", "name": name, "input": arguments}]
+
+
+class FakeBedrockRuntime:
+    def __init__(self, respond=None, latency=0.0, cache_min_tokens=CACHE_MIN_TOKENS,
+                 input_token_seconds=0.0, output_token_seconds=0.0):
+        self.respond = respond or (lambda body: text_reply("Done."))
+        self.latency = latency
+        self.input_token_seconds = input_token_seconds
+        self.output_token_seconds = output_token_seconds
+        self.cache_min_tokens = cache_min_tokens
+        self.requests = []
+        self._cache = set()
+        self._lock = threading.Lock()
+
+    def _prefix_segments(self, body):
+        # The request in cache order (tools, system, messages), one segment per block
+        segments = [("tool", tool) for tool in body.get("tools", [])]
+        system = body.get("system")
+        if isinstance(system, str):
+            segments.append(("system", {"type": "text", "text": system}))
+        elif system:
+            segments += [("system", block) for block in system]
+        for message in body.get("messages", []):
+            content = message["content"]
+            blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content
+            segments += [(message["role"], block) for block in blocks]
+        return segments
+
+    def _usage(self, body):
+        # Reads the longest cached prefix ending at a checkpoint and writes the prefix up
+        # to the last checkpoint, as Bedrock prompt caching does
+        segments = self._prefix_segments(body)
+        digest = hashlib.sha256()
+        tokens = 0
+        checkpoints = []
+        for role, block in segments:
+            digest.update(json.dumps([role, {k: v for k, v in block.items() if k != "cache_control"}],
+                                     sort_keys=True).encode())
+            tokens += estimate_tokens(block)
+            if "cache_control" in block:
+                checkpoints.append((digest.hexdigest(), tokens))
+        total = tokens
+
+        read = 0
+        write = 0
+        with self._lock:
+            for key, prefix_tokens in checkpoints:
+                if prefix_tokens < self.cache_min_tokens:
+                    continue
+                if key in self._cache:
+                    read = prefix_tokens
+                else:
+                    self._cache.add(key)
+                    write = prefix_tokens
+        write = max(0, write - read)
+        return {
+            "input_tokens": total - read - write,
+            "cache_read_input_tokens": read,
+            "cache_creation_input_tokens": write,
+        }
+
+    def _reply(self, kwargs):
+        body = json.loads(kwargs["body"])
+        with self._lock:
+            self.requests.append({"modelId": kwargs.get("modelId"), "body": body})
+        content = self.respond(body)
+        usage = self._usage(body)
+        usage["output_tokens"] = estimate_tokens(content)
+        # Tokens read from the cache are not processed again
+        seconds = (self.latency
+                   + (usage["input_tokens"] + usage["cache_creation_input_tokens"]) * self.input_token_seconds
+                   + usage["output_tokens"] * self.output_token_seconds)
+        if seconds:
+            time.sleep(seconds)
+        stop_reason = "tool_use" if any(block["type"] == "tool_use" for block in content) else "end_turn"
+        return content, usage, stop_reason
+
+    def invoke_model(self, **kwargs):
+        content, usage, stop_reason = self._reply(kwargs)
+        raw = json.dumps({
+            "id": f"msg_{uuid.uuid4().hex[:20]}", "type": "message", "role": "assistant",
+            "model": kwargs.get("modelId"), "content": content, "stop_reason": stop_reason,
+            "stop_sequence": None, "usage": usage,
+        }).encode()
+        return {
+            "body": StreamingBody(io.BytesIO(raw), len(raw)),
+            "ResponseMetadata": {"HTTPHeaders": {
+                "x-amzn-bedrock-input-token-count": str(usage["input_tokens"]),
+                "x-amzn-bedrock-output-token-count": str(usage["output_tokens"]),
+            }},
+        }
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        content, usage, stop_reason = self._reply(kwargs)
+        events = [{
+            "type": "message_start",
+            "message": {"id": f"msg_{uuid.uuid4().hex[:20]}", "type": "message", "role": "assistant",
+                        "model": kwargs.get("modelId"), "content": [], "stop_reason": None,
+                        "usage": {**usage, "output_tokens": 1}},
+        }]
+        for index, block in enumerate(content):
+            if block["type"] == "text":
+                events.append({"type": "content_block_start", "index": index,
+                               "content_block": {"type": "text", "text": ""}})
+                for i in range(0, len(block["text"]), 16):
+                    events.append({"type": "content_block_delta", "index": index,
+                                   "delta": {"type": "text_delta", "text": block["text"][i:i + 16]}})
+            else:
+                events.append({"type": "content_block_start", "index": index,
+                               "content_block": {"type": "tool_use", "id": block["id"], "name": block["name"],
+                                                 "input": {}}})
+                events.append({"type": "content_block_delta", "index": index,
+                               "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}})
+            events.append({"type": "content_block_stop", "index": index})
+        events.append({"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                       "usage": {"output_tokens": usage["output_tokens"]}})
+        events.append({"type": "message_stop", "amazon-bedrock-invocationMetrics": {
+            "inputTokenCount": usage["input_tokens"], "outputTokenCount": usage["output_tokens"],
+            "invocationLatency": int(self.latency * 1000), "firstByteLatency": int(self.latency * 1000),
+            "cacheReadInputTokenCount": usage["cache_read_input_tokens"],
+            "cacheWriteInputTokenCount": usage["cache_creation_input_tokens"],
+        }})
+        return {"body": [{"chunk": {"bytes": json.dumps(event).encode()}} for event in events]}
+
+
+class ThrottlingBedrockRuntime:
+    # Per-model quotas in front of a runtime: a token bucket of `requests_per_second`
+    # holding `burst` calls, and at most `max_concurrency` calls at once (0 is no limit)
+
+    def __init__(self, runtime, requests_per_second=0.0, max_concurrency=0, burst=1.0):
+        self._runtime = runtime
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.burst = max(1.0, burst)
+        self.calls = 0
+        self.throttled = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._runtime, name)
+
+    def _admit(self, model_id, operation):
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            model = self._models.setdefault(model_id, {"tokens": self.burst, "updated": now, "in_flight": 0})
+            if self.requests_per_second:
+                model["tokens"] = min(self.burst, model["tokens"] + (now - model["updated"]) * self.requests_per_second)
+                model["updated"] = now
+            over_rate = self.requests_per_second and model["tokens"] < 1
+            over_concurrency = self.max_concurrency and model["in_flight"] >= self.max_concurrency
+            if over_rate or over_concurrency:
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException",
+                                             "Message": "Too many requests, please wait before trying again."}},
+                                  operation)
+            if self.requests_per_second:
+                model["tokens"] -= 1
+            model["in_flight"] += 1
+
+    def _call(self, operation, kwargs):
+        model_id = kwargs.get("modelId")
+        self._admit(model_id, operation)
+        try:
+            return getattr(self._runtime, operation)(**kwargs)
+        finally:
+            with self._lock:
+                self._models[model_id]["in_flight"] -= 1
+
+    def invoke_model(self, **kwargs):
+        return self._call("invoke_model", kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._call("invoke_model_with_response_stream", kwargs)
@@ -0,0 +1,338 @@
+"""Concurrent chat sessions against the Chainlit app over its websocket.
+
+Opens --sessions socket.io sessions, started evenly over --ramp-seconds, that
+each do what the browser does: start a chat (on_chat_start), change a setting
+(on_settings_update, turning off the answer cache so every question reaches the
+agent) and ask the questions of one conversation of benchmarks/agent_corpus.json
+(on_message).
+
+By default it starts benchmarks/stub_server.py, the app with stubbed Bedrock and
+Athena of the given latency, optionally pinned to --server-cpus to match a
+Fargate task. --url points it at a running server instead, with session tokens
+signed with --auth-secret (the server's CHAINLIT_AUTH_SECRET) and /metrics scraped
+with --metrics-token (its METRICS_TOKEN).
+
+Measured per session: time to open it (connect until the chat settings arrive)
+and to apply the settings change; per message: time to the first streamed token
+and to the end of the answer. While the load runs, the app's /metrics is scraped
+for event loop lag, resident memory and the Bedrock queue depth. Results are
+written as JSON.
+
+    python benchmarks/load_test.py --sessions 50 --ramp-seconds 10 --server-cpus 0 \\
+        --llm-profile 0.45 0.00001 0.008 --query-latency 1.5 --output load.json
+
+--blocking-workers and --model-concurrency shrink the stub server's executor and
+the Bedrock limiter's concurrency, so calls waiting for the model outnumber the
+executor's threads:
+
+    python benchmarks/load_test.py --sessions 8 --ramp-seconds 1 --messages 2 \\
+        --think-seconds 0 --blocking-workers 4 --model-concurrency 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import aiohttp  # noqa: E402
+import jwt  # noqa: E402
+import socketio  # noqa: E402
+from agent_e2e_benchmark import CORPUS_PATH, summarise  # noqa: E402
+
+STUB_SERVER = os.path.join(os.path.dirname(__file__), "stub_server.py")
+
+
+def session_token(secret, index):
+    # The JWT Chainlit issues after an OAuth login
+    return jwt.encode({"identifier": f"load-test-{index}", "display_name": None, "metadata": {},
+                       "exp": datetime.utcnow() + timedelta(hours=12)}, secret, algorithm="HS256")
+
+
+def parse_metrics(text):
+    # {name: value} from the Prometheus text format, summed over the label sets
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name = series.partition("{")[0]
+        if not name.endswith("_bucket"):
+            values[name] = values.get(name, 0.0) + float(value)
+    return values
+
+
+async def scrape(http, url):
+    async with http.get(f"{url}/metrics") as response:
+        response.raise_for_status()
+        return parse_metrics(await response.text())
+
+
+async def sample_metrics(http, url, interval, samples, stop):
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            values = await scrape(http, url)
+            samples.append({"t": round(time.perf_counter() - start, 2),
+                            "event_loop_lag_seconds": values.get("nlq_event_loop_lag_seconds"),
+                            "event_loop_lag_max_seconds": values.get("nlq_event_loop_lag_max_seconds"),
+                            "resident_memory_bytes": values.get("process_resident_memory_bytes"),
+                            "bedrock_queue_depth": values.get("nlq_bedrock_queue_depth")})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ChatSession:
+    # One browser tab: a socket.io connection and the events the server sends it
+
+    def __init__(self, url, token):
+        self.url = url
+        self.token = token
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.events = asyncio.Queue()
+        self.client.on("*", self._on_event)
+
+    async def _on_event(self, event, data=None):
+        await self.events.put((time.perf_counter(), event, data))
+
+    async def next_event(self, names, timeout):
+        deadline = time.perf_counter() + timeout
+        while True:
+            received, event, data = await asyncio.wait_for(self.events.get(), deadline - time.perf_counter())
+            if event in names:
+                return received, event, data
+
+    async def open(self, timeout):
+        headers = {"X-Chainlit-Session-Id": str(uuid.uuid4()), "X-Chainlit-Client-Type": "webapp",
+                   "user-env": "{}"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        await self.client.connect(self.url, headers=headers, transports=["websocket"],
+                                  socketio_path="/ws/socket.io", wait_timeout=timeout)
+        await self.client.emit("connection_successful")
+        _, _, widgets = await self.next_event({"chat_settings"}, timeout)
+        return {widget["id"]: widget["initial"] for widget in widgets}
+
+    async def change_settings(self, settings, timeout):
+        # Acknowledged once on_settings_update has returned
+        await self.client.call("chat_settings_change", settings, timeout=timeout)
+
+    async def ask(self, question, timeout):
+        while not self.events.empty():
+            self.events.get_nowait()
+        sent = time.perf_counter()
+        await self.client.emit("client_message", {"message": {
+            "id": str(uuid.uuid4()), "threadId": "", "name": "User", "type": "user_message",
+            "output": question, "createdAt": datetime.utcnow().isoformat() + "Z",
+        }, "fileReferences": None})
+        first_token = None
+        error = False
+        while True:
+            received, event, data = await self.next_event({"stream_token", "new_message", "task_end"},
+                                                          timeout - (time.perf_counter() - sent))
+            if event == "stream_token" and first_token is None:
+                first_token = received
+            elif event == "new_message" and data.get("name") == "Error":
+                error = True
+            elif event == "task_end":
+                return {"latency_ms": round((received - sent) * 1000, 2),
+                        "first_token_ms": round((first_token - sent) * 1000, 2) if first_token else None,
+                        "error": error}
+
+    async def close(self):
+        if self.client.connected:
+            await self.client.disconnect()
+
+
+async def run_session(index, args, conversation, token):
+    await asyncio.sleep(args.ramp_seconds * index / max(1, args.sessions))
+    record = {"session": index, "conversation": conversation["name"], "open_ms": None,
+              "settings_update_ms": None, "messages": [], "error": None}
+    session = ChatSession(args.url, token)
+    try:
+        start = time.perf_counter()
+        settings = await session.open(args.timeout)
+        record["open_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+        settings["EnableAnswerCache"] = args.answer_cache
+        start = time.perf_counter()
+        await session.change_settings(settings, args.timeout)
+        record["settings_update_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+        turns = conversation["turns"]
+        for i in range(args.messages or len(turns)):
+            await asyncio.sleep(args.think_seconds)
+            question = turns[i % len(turns)]["question"]
+            record["messages"].append({"question": question, **await session.ask(question, args.timeout)})
+    except asyncio.TimeoutError:
+        record["error"] = "timeout"
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        await session.close()
+    return record
+
+
+async def wait_for_server(http, url, timeout):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await scrape(http, url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+
+async def run_load(args, conversations):
+    samples = []
+    stop = asyncio.Event()
+    headers = {"Authorization": f"Bearer {args.metrics_token}"} if args.metrics_token else None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10), headers=headers) as http:
+        before = await wait_for_server(http, args.url, args.server_start_timeout)
+        sampler = asyncio.create_task(sample_metrics(http, args.url, args.sample_seconds, samples, stop))
+        start = time.perf_counter()
+        records = await asyncio.gather(*(
+            run_session(i, args, conversations[i % len(conversations)],
+                        session_token(args.auth_secret, i) if args.auth_secret else None)
+            for i in range(args.sessions)))
+        wall_seconds = time.perf_counter() - start
+        stop.set()
+        await sampler
+        after = await scrape(http, args.url)
+    return records, samples, before, after, wall_seconds
+
+
+def start_stub_server(args):
+    command = [sys.executable, STUB_SERVER, "--port", str(args.port),
+               "--llm-profile", *map(str, args.llm_profile), "--query-latency", str(args.query_latency)]
+    if args.throttle:
+        command += ["--throttle", *map(str, args.throttle)]
+    if args.server_cpus:
+        command = ["taskset", "-c", args.server_cpus] + command
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    env = {**os.environ, "CHAINLIT_AUTH_SECRET": args.auth_secret, "METRICS_TOKEN": args.metrics_token}
+    if args.blocking_workers:
+        env["BLOCKING_MAX_WORKERS"] = str(args.blocking_workers)
+    if args.model_concurrency:
+        env["BEDROCK_DEFAULT_MAX_CONCURRENCY"] = str(args.model_concurrency)
+    return subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def delta_mean(before, after, name):
+    count = after.get(f"{name}_count", 0) - before.get(f"{name}_count", 0)
+    total = after.get(f"{name}_sum", 0) - before.get(f"{name}_sum", 0)
+    return round(total / count * 1000, 2) if count else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--ramp-seconds", type=float, default=10.0)
+    parser.add_argument("--messages", type=int, default=0,
+                        help="Questions per session, cycling its conversation (default: one pass)")
+    parser.add_argument("--think-seconds", type=float, default=1.0, help="Pause before each question")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the answer cache on")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--url", help="Load an already running server instead of starting the stub server")
+    parser.add_argument("--auth-secret", help="The server's CHAINLIT_AUTH_SECRET, to sign session tokens")
+    parser.add_argument("--metrics-token", help="The server's METRICS_TOKEN, to scrape /metrics")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the stub server")
+    parser.add_argument("--server-cpus", help="Pin the stub server to these CPUs (taskset list, e.g. 0)")
+    parser.add_argument("--server-log", help="Write the stub server's output here")
+    parser.add_argument("--server-start-timeout", type=float, default=120.0)
+    parser.add_argument("--llm-profile", type=float, nargs=3, default=[0.45, 0.00001, 0.008],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    parser.add_argument("--query-latency", type=float, default=1.5, help="Seconds each Athena query runs")
+    parser.add_argument("--throttle", type=float, nargs=2, metavar=("REQUESTS_PER_SECOND", "CONCURRENCY"),
+                        help="Have the stub server throttle Bedrock calls over this quota")
+    parser.add_argument("--blocking-workers", type=int, help="The stub server's BLOCKING_MAX_WORKERS")
+    parser.add_argument("--model-concurrency", type=int,
+                        help="The stub server's BEDROCK_DEFAULT_MAX_CONCURRENCY, concurrent calls per model")
+    parser.add_argument("--sample-seconds", type=float, default=1.0, help="How often /metrics is scraped")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        conversations = json.load(f)["conversations"]
+
+    server = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port}"
+        args.auth_secret = args.auth_secret or secrets.token_urlsafe(32)
+        args.metrics_token = args.metrics_token or secrets.token_urlsafe(32)
+        server = start_stub_server(args)
+    try:
+        records, samples, before, after, wall_seconds = asyncio.run(run_load(args, conversations))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    messages = [message for record in records for message in record["messages"]]
+    lags = [s["event_loop_lag_seconds"] for s in samples if s["event_loop_lag_seconds"] is not None]
+    rss_start = before.get("process_resident_memory_bytes")
+    rss_end = after.get("process_resident_memory_bytes")
+    rss = [s["resident_memory_bytes"] for s in samples if s["resident_memory_bytes"] is not None]
+    report = {
+        "benchmark": "load_test",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("auth_secret", "metrics_token", "output", "server_log")},
+        "summary": {
+            "sessions": len(records),
+            "failed_sessions": sum(record["error"] is not None for record in records),
+            "messages": len(messages),
+            "message_errors": sum(message["error"] for message in messages),
+            "wall_seconds": round(wall_seconds, 2),
+            "messages_per_second": round(len(messages) / wall_seconds, 3) if wall_seconds else None,
+            "session_open_ms": summarise([record["open_ms"] for record in records]),
+            "settings_update_ms": summarise([record["settings_update_ms"] for record in records]),
+            "first_token_ms": summarise([message["first_token_ms"] for message in messages]),
+            "message_latency_ms": summarise([message["latency_ms"] for message in messages]),
+            "server": {
+                "agent_setup_ms_mean": delta_mean(before, after, "nlq_agent_setup_seconds"),
+                "turn_duration_ms_mean": delta_mean(before, after, "nlq_turn_duration_seconds"),
+                "event_loop_lag_p99_ms": summarise([round(lag * 1000, 2) for lag in lags]),
+                "event_loop_lag_max_ms": round(after.get("nlq_event_loop_lag_max_seconds", 0) * 1000, 2),
+                "resident_memory_start_bytes": rss_start,
+                "resident_memory_peak_bytes": max(rss + [rss_end]) if rss_end else None,
+                "resident_memory_end_bytes": rss_end,
+                "resident_memory_growth_bytes": rss_end - rss_start if rss_start and rss_end else None,
+                "bedrock_queue_depth_max": max((s["bedrock_queue_depth"] or 0 for s in samples), default=None),
+                "bedrock_queue_wait_ms_mean": delta_mean(before, after, "nlq_bedrock_queue_wait_seconds"),
+                "bedrock_throttles": after.get("nlq_bedrock_throttles_total", 0) - before.get(
+                    "nlq_bedrock_throttles_total", 0),
+            },
+        },
+        "sessions": records,
+        "samples": samples,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    summary = report["summary"]
+    latency = summary["message_latency_ms"] or {}
+    print(f"{summary['sessions']} sessions ({summary['failed_sessions']} failed), {summary['messages']} messages "
+          f"({summary['message_errors']} errors) in {summary['wall_seconds']}s: message latency p50 "
+          f"{latency.get('p50')}ms p95 {latency.get('p95')}ms p99 {latency.get('p99')}ms, "
+          f"event loop lag max {summary['server']['event_loop_lag_max_ms']}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
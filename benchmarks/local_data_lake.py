@@ -0,0 +1,51 @@
+"""Local stand-in for the S3 data lake, built from cdk/example-data.zip.
+
+Loads the parquet files of each example dataset (one directory per table, as
+the Glue crawler sees them) into a SQLite database, which the benchmarks query
+through SQLAlchemy and FakeAthenaClient.
+"""
+import io
+import os
+import sqlite3
+import zipfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXAMPLE_DATA_ZIP = os.path.join(os.path.dirname(__file__), "..", "cdk", "example-data.zip")
+
+
+def _sqlite_type(arrow_type):
+    if pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type):
+        return "INTEGER"
+    if pa.types.is_floating(arrow_type):
+        return "REAL"
+    return "TEXT"
+
+
+def read_example_tables(zip_path=EXAMPLE_DATA_ZIP):
+    # {table name: pyarrow Table} from example-data/<table>/*.parquet
+    parts = {}
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in sorted(archive.namelist()):
+            directory, _, filename = name.rpartition("/")
+            if name.startswith("__MACOSX/") or not filename.endswith(".parquet"):
+                continue
+            table = os.path.basename(directory)
+            parts.setdefault(table, []).append(pq.read_table(io.BytesIO(archive.read(name))))
+    return {table: pa.concat_tables(tables, promote_options="default") for table, tables in parts.items()}
+
+
+def build_sqlite(path, zip_path=EXAMPLE_DATA_ZIP):
+    tables = read_example_tables(zip_path)
+    connection = sqlite3.connect(path)
+    for table, data in tables.items():
+        columns = ", ".join(f'"{field.name}" {_sqlite_type(field.type)}' for field in data.schema)
+        connection.execute(f'DROP TABLE IF EXISTS "{table}"')
+        connection.execute(f'CREATE TABLE "{table}" ({columns})')
+        placeholders = ", ".join("?" for _ in data.schema)
+        rows = zip(*(column.to_pylist() for column in data.columns))
+        connection.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+    connection.commit()
+    connection.close()
+    return {table: data.num_rows for table, data in tables.items()}
@@ -0,0 +1,161 @@
+"""End-to-end latency and token use with and without per-step model routing.
+
+Runs the agent graph on a scripted ReAct trajectory typical of the app (check a
+query, run it, get an error, repair it, run it again, answer) with simulated
+Bedrock models. Each model's latency is time to first token plus time per
+input and output token, so a step costs the same whichever model serves it,
+apart from the model's speed. The default speeds are rough figures for Claude
+3.5 Sonnet and Claude 3.5 Haiku; pass your own to match what you measure.
+
+    python benchmarks/model_routing_benchmark.py --questions 5 --time-scale 0.1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.language_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+from langchain_core.tools import tool  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+from utils.agent_graph import create_agent  # noqa: E402
+
+SYSTEM_PROMPT = "You are a data analyst. " * 300
+ANSWER = ("Turbine 3 had the highest average temperature at 31.2 degrees, about 2 degrees above "
+          "the fleet average over the same period. " * 4)
+GOOD_SQL = "SELECT assetid, AVG(temp) AS avg_temp FROM windfarm GROUP BY assetid ORDER BY avg_temp DESC"
+BAD_SQL = GOOD_SQL.replace("temp)", "tmp)")
+
+
+def scripted_step(messages):
+    # The step is decided by the tool results so far, so both models follow the same script
+    tool_results = 0
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        tool_results += isinstance(message, ToolMessage)
+    steps = [
+        ("sql_db_query_checker", BAD_SQL),
+        ("sql_db_query", BAD_SQL),
+        ("sql_db_query_checker", GOOD_SQL),
+        ("sql_db_query", GOOD_SQL),
+    ]
+    if tool_results < len(steps):
+        name, query = steps[tool_results]
+        return AIMessage(content="Let me check the data.", tool_calls=[
+            {"name": name, "args": {"query": query}, "id": f"call_{tool_results}"}])
+    return AIMessage(content=ANSWER)
+
+
+class SimulatedBedrockModel(BaseChatModel):
+    model_id: str
+    first_token_seconds: float
+    input_token_seconds: float
+    output_token_seconds: float
+    time_scale: float = 1.0
+    usage: Any = None
+
+    @property
+    def _llm_type(self):
+        return "simulated-bedrock"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _response(self, messages):
+        response = scripted_step(messages)
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = (len(response.content) + len(str(response.tool_calls))) // 4
+        seconds = (self.first_token_seconds + input_tokens * self.input_token_seconds
+                   + output_tokens * self.output_token_seconds)
+        self.usage["calls"] += 1
+        self.usage["input_tokens"] += input_tokens
+        self.usage["output_tokens"] += output_tokens
+        self.usage["seconds"] += seconds
+        return response, seconds
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        response, seconds = self._response(messages)
+        time.sleep(seconds * self.time_scale)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        response, seconds = self._response(messages)
+        await asyncio.sleep(seconds * self.time_scale)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+
+@tool
+def sql_db_query_checker(query: str) -> str:
+    """Check a query."""
+    return f"No problems found, run the query with sql_db_query:\n{query}"
+
+
+@tool
+def sql_db_query(query: str) -> str:
+    """Run a query."""
+    if "tmp" in query:
+        return "Error: COLUMN_NOT_FOUND: Column 'tmp' cannot be resolved"
+    return "[('turbine3', 31.2), ('turbine1', 29.4), ('turbine2', 28.9)]"
+
+
+def make_model(model_id, profile, time_scale):
+    first_token, input_token, output_token = profile
+    return SimulatedBedrockModel(
+        model_id=model_id, first_token_seconds=first_token, input_token_seconds=input_token,
+        output_token_seconds=output_token, time_scale=time_scale,
+        usage={"calls": 0, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0})
+
+
+async def run_policy(name, model, fast_model, questions):
+    agent = create_agent(
+        model, [sql_db_query_checker, sql_db_query],
+        state_modifier=lambda state: [("system", SYSTEM_PROMPT)] + state["messages"],
+        checkpointer=MemorySaver(), fast_model=fast_model)
+    latencies = []
+    for i in range(questions):
+        config = {"configurable": {"thread_id": f"{name}-{i}"}}
+        start = time.perf_counter()
+        await agent.ainvoke({"messages": [("human", "Which turbine had the highest average temperature?")]}, config)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--time-scale", type=float, default=0.1,
+                        help="Fraction of the simulated model latency actually slept")
+    parser.add_argument("--selected-profile", type=float, nargs=3, default=[0.9, 0.00002, 0.014],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    parser.add_argument("--fast-profile", type=float, nargs=3, default=[0.45, 0.00001, 0.008],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    args = parser.parse_args()
+
+    policies = {}
+    for name, use_fast in (("selected model for every step", False), ("fast model for tool steps", True)):
+        model = make_model("anthropic.claude-3-5-sonnet-20241022-v2:0", args.selected_profile, args.time_scale)
+        fast_model = make_model("anthropic.claude-3-5-haiku-20241022-v1:0", args.fast_profile, args.time_scale)
+        latencies = asyncio.run(run_policy(name, model, fast_model if use_fast else None, args.questions))
+        policies[name] = (latencies, model.usage, fast_model.usage)
+
+    for name, (latencies, usage, fast_usage) in policies.items():
+        latencies.sort()
+        simulated = (usage["seconds"] + fast_usage["seconds"]) / args.questions
+        print(f"{name}:")
+        print(f"  simulated model latency per question {simulated:.2f}s "
+              f"(wall p50 {latencies[len(latencies) // 2]:.2f}s at time scale {args.time_scale})")
+        for label, model_usage in (("selected", usage), ("fast", fast_usage)):
+            if model_usage["calls"]:
+                print(f"  {label} model: {model_usage['calls'] / args.questions:.1f} calls, "
+                      f"{model_usage['input_tokens'] / args.questions:.0f} input and "
+                      f"{model_usage['output_tokens'] / args.questions:.0f} output tokens per question")
+
+
+if __name__ == "__main__":
+    main()
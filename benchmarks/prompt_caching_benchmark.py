@@ -0,0 +1,104 @@
+"""Input tokens sent fresh vs. read from the Bedrock prompt cache over a conversation.
+
+Runs the agent graph with the real ChatBedrock against the FakeBedrockRuntime
+stub (benchmarks/fake_bedrock.py), with and without PromptCachingClient, for a
+few questions that each take a check/query/answer ReAct loop. Cache read and
+write tokens are collected through TurnMetrics as in the app, and the cache
+checkpoints of the last request are printed.
+
+    python benchmarks/prompt_caching_benchmark.py --questions 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_aws import ChatBedrock  # noqa: E402
+from langchain_core.messages import SystemMessage  # noqa: E402
+from langchain_core.tools import tool  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+from utils.agent_graph import create_agent  # noqa: E402
+from utils.metrics import TurnMetrics, current_turn  # noqa: E402
+from utils.prompt_caching import PromptCachingClient  # noqa: E402
+from fake_bedrock import FakeBedrockRuntime, text_reply, tool_use_reply  # noqa: E402
+
+MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+SYSTEM_PROMPT = ("You are a data analyst that analyses data in a database, and provides stats and "
+                 "analysis to users. Follow the steps below when querying the database. " * 60)
+SQL = "SELECT assetid, AVG(temp) FROM windfarm GROUP BY assetid"
+
+
+def scripted_reply(body):
+    # Tool results since the user's question decide the step
+    tool_results = 0
+    for message in reversed(body["messages"]):
+        content = message["content"]
+        blocks = [{"type": "text"}] if isinstance(content, str) else content
+        if message["role"] == "user" and any(block["type"] == "text" for block in blocks):
+            break
+        tool_results += sum(block["type"] == "tool_result" for block in blocks)
+    if tool_results == 0:
+        return tool_use_reply("sql_db_query_checker", {"query": SQL})
+    if tool_results == 1:
+        return tool_use_reply("sql_db_query", {"query": SQL})
+    return text_reply("Turbine 3 had the highest average temperature at 31.2 degrees.")
+
+
+@tool
+def sql_db_query_checker(query: str) -> str:
+    """Use this tool to double check if your query is correct before executing it."""
+    return f"No problems found, run the query with sql_db_query:\n{query}"
+
+
+@tool
+def sql_db_query(query: str) -> str:
+    """Execute a SQL query against the database and get back the result."""
+    return "[('turbine3', 31.2), ('turbine1', 29.4), ('turbine2', 28.9)]"
+
+
+async def run_conversation(client, questions):
+    model = ChatBedrock(client=client, model_id=MODEL_ID, model_kwargs={"max_tokens": 1024}, streaming=True)
+    system_message = SystemMessage(content=SYSTEM_PROMPT)
+    agent = create_agent(
+        model, [sql_db_query_checker, sql_db_query],
+        state_modifier=lambda state: [system_message] + state["messages"],
+        checkpointer=MemorySaver())
+
+    turn = TurnMetrics()
+    current_turn.set(turn)
+    config = {"configurable": {"thread_id": "benchmark"}}
+    input_tokens = 0
+    for i in range(questions):
+        async for event in agent.astream_events(
+                {"messages": [("human", f"Question {i}: which turbine ran hottest?")]}, config, version="v2"):
+            if event["event"] == "on_chat_model_end":
+                input_tokens += (event["data"]["output"].usage_metadata or {}).get("input_tokens", 0)
+    return input_tokens, turn.totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, caching in (("without prompt caching", False), ("with prompt caching", True)):
+        runtime = FakeBedrockRuntime(respond=scripted_reply)
+        client = PromptCachingClient(runtime, enabled=caching)
+        input_tokens, totals = asyncio.run(run_conversation(client, args.questions))
+        print(f"{name}: {len(runtime.requests)} requests, {input_tokens} uncached input tokens, "
+              f"{totals['cache_read_tokens']} cache read, {totals['cache_write_tokens']} cache write")
+        if caching:
+            body = runtime.requests[-1]["body"]
+            checkpoints = [tool["name"] for tool in body["tools"] if "cache_control" in tool]
+            checkpoints += ["system"] * sum("cache_control" in block for block in body["system"])
+            checkpoints += [f"{message['role']} message {i}" for i, message in enumerate(body["messages"])
+                            if not isinstance(message["content"], str)
+                            and any("cache_control" in block for block in message["content"])]
+            print(f"  checkpoints in the last request: {json.dumps(checkpoints)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Accuracy and token savings of relevance-based schema pruning.
+
+Builds a synthetic catalog of a few hundred tables in SQLite (plus the windfarm
+table from the example data) and, for a labelled set of questions, checks
+whether the tables the question needs are among the top-k tables picked by the
+schema index. Token savings compare the schema of the top-k tables with the
+schema of every table, as the agent would otherwise pull it.
+
+    python benchmarks/schema_pruning_benchmark.py --top-k 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from utils.schema_cache import CachedSQLDatabase, SchemaCache  # noqa: E402
+
+DOMAINS = [
+    "sales", "marketing", "finance", "hr", "support", "inventory", "logistics", "billing", "crm",
+    "web", "mobile", "procurement", "manufacturing", "quality", "legal", "payroll", "fleet",
+    "retail", "warehouse", "energy", "facilities", "security", "training", "research", "audit",
+    "partners", "events", "shipping", "claims", "loyalty",
+]
+ENTITIES = {
+    "orders": ["order_id", "customer_id", "order_date", "total_amount", "currency", "status"],
+    "customers": ["customer_id", "name", "email", "country", "signup_date", "segment"],
+    "products": ["product_id", "sku", "category", "unit_price", "supplier_id"],
+    "employees": ["employee_id", "first_name", "last_name", "department", "hire_date", "salary"],
+    "tickets": ["ticket_id", "customer_id", "priority", "opened_at", "closed_at", "agent_id"],
+    "shipments": ["shipment_id", "order_id", "carrier", "shipped_at", "delivered_at", "weight_kg"],
+    "invoices": ["invoice_id", "customer_id", "issued_at", "due_at", "amount", "paid"],
+    "events": ["event_id", "user_id", "event_type", "event_time", "page", "session_id"],
+    "suppliers": ["supplier_id", "name", "country", "rating", "contract_end"],
+    "budgets": ["budget_id", "cost_center", "fiscal_year", "planned", "actual"],
+}
+WINDFARM_COLUMNS = [
+    "sensortimestamp", "assetid", "temp", "pressure", "humidity", "altitude", "current", "voltage",
+    "power", "rpm", "gearboxvibration", "country", "region", "status", "lastmaintenance",
+]
+
+QUESTIONS = [
+    ("How many turbines are in the database and what are their asset ids?", {"windfarm"}),
+    ("Which of these turbines has had the highest average temperature and what was it?", {"windfarm"}),
+    ("What was the peak gearbox vibration per asset last week?", {"windfarm"}),
+    ("When was each turbine's last maintenance?", {"windfarm"}),
+    ("What is the average rpm and power output by region?", {"windfarm"}),
+    ("What is the total sales order amount per customer country?", {"sales_orders", "sales_customers"}),
+    ("How many sales orders were placed each month?", {"sales_orders"}),
+    ("Which support tickets with high priority are still open?", {"support_tickets"}),
+    ("What is the average time to close support tickets per agent?", {"support_tickets"}),
+    ("List the hr employees hired this year by department", {"hr_employees"}),
+    ("What is the total payroll salary by department?", {"payroll_employees"}),
+    ("Which billing invoices are overdue and unpaid?", {"billing_invoices"}),
+    ("Average shipment weight by carrier for logistics", {"logistics_shipments"}),
+    ("Which inventory products have the highest unit price per category?", {"inventory_products"}),
+    ("How many web events per session on the checkout page?", {"web_events"}),
+    ("What is the planned versus actual finance budget by cost center?", {"finance_budgets"}),
+    ("Which procurement suppliers have contracts ending soon?", {"procurement_suppliers"}),
+    ("How many mobile app events of each event type happened yesterday?", {"mobile_events"}),
+    ("Which crm customers signed up in the enterprise segment?", {"crm_customers"}),
+    ("How many warehouse shipments were delivered late?", {"warehouse_shipments"}),
+]
+
+
+def regex_token_count(value):
+    return len(re.findall(r"\w+|[^\w\s]", value))
+
+
+def build_catalog(engine):
+    with engine.begin() as connection:
+        columns = ", ".join(f"{column} TEXT" for column in WINDFARM_COLUMNS)
+        connection.execute(text(f"CREATE TABLE windfarm ({columns})"))
+        for domain in DOMAINS:
+            for entity, entity_columns in ENTITIES.items():
+                columns = ", ".join(f"{column} TEXT" for column in entity_columns)
+                connection.execute(text(f"CREATE TABLE {domain}_{entity} ({columns})"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    build_catalog(engine)
+    db = CachedSQLDatabase(engine, schema_cache=SchemaCache("schema-pruning-benchmark", cache_dir=None))
+    table_names = db.get_usable_table_names()
+
+    start = time.perf_counter()
+    db.relevant_tables("warm up", args.top_k)
+    build_seconds = time.perf_counter() - start
+
+    full_tokens = regex_token_count(db.get_table_info(table_names))
+    top1_hits = recall_hits = pruned_tokens = 0
+    search_seconds = []
+    for question, expected in QUESTIONS:
+        start = time.perf_counter()
+        picked = db.relevant_tables(question, args.top_k)
+        search_seconds.append(time.perf_counter() - start)
+        top1_hits += bool(picked) and picked[0] in expected
+        recall_hits += expected.issubset(picked)
+        pruned_tokens += regex_token_count(db.get_table_info(picked)) if picked else 0
+        if not expected.issubset(picked):
+            print(f"  miss: {question!r} -> {picked}")
+
+    count = len(QUESTIONS)
+    search_seconds.sort()
+    print(f"{len(table_names)} tables, {count} questions, top-k={args.top_k}")
+    print(f"index build {build_seconds * 1000:.1f}ms, search p50 "
+          f"{search_seconds[count // 2] * 1000:.2f}ms max {search_seconds[-1] * 1000:.2f}ms")
+    print(f"top-1 accuracy {top1_hits / count:.0%}, recall@{args.top_k} {recall_hits / count:.0%}")
+    print(f"schema tokens per question: all tables {full_tokens}, "
+          f"top-{args.top_k} {pruned_tokens / count:.0f} ({1 - pruned_tokens / count / full_tokens:.1%} saved)")
+
+
+if __name__ == "__main__":
+    main()
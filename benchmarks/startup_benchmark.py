@@ -0,0 +1,177 @@
+"""Start up time of the Chainlit app: import profile and time to a healthy task.
+
+The import profile runs chainlit-app.py under `python -X importtime` (with
+placeholder settings, the app makes no AWS calls at import) and reports the
+import wall time and the modules and top-level packages that take longest.
+
+The health check part starts benchmarks/stub_server.py with STARTUP_WARMUP off
+and on, and measures the time from process start until /health returns 200, then
+opens a chat session and asks the first fixed question, the wait the first user
+of a new task sees. The stub server imports its stubs' modules (langchain, the
+Athena executor) before the app, so these runs show the warm-up of the clients,
+prompts, engine and schema cache; the import profile shows the import time.
+
+    python benchmarks/startup_benchmark.py --runs 3 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import aiohttp  # noqa: E402
+from agent_e2e_benchmark import APP_PATH, app_questions, summarise  # noqa: E402
+from load_test import STUB_SERVER, ChatSession, session_token  # noqa: E402
+
+STUB_ENV = {
+    "BEDROCK_PROMPT_ID_1": "stub-data-prompt",
+    "BEDROCK_PROMPT_ID_2": "stub-business-prompt",
+    "DB_CONNECTION_STRING": "sqlite://",
+    "AWS_REGION_FOR_BEDROCK_INFERENCE": "us-east-1",
+    "OAUTH_COGNITO_CLIENT_ID": "stub",
+    "OAUTH_COGNITO_CLIENT_SECRET": "stub",
+    "OAUTH_COGNITO_DOMAIN": "stub.auth.us-east-1.amazoncognito.com",
+    "STARTUP_WARMUP": "false",
+}
+
+
+def parse_importtime(stderr):
+    # [(module, self_us, cumulative_us, depth)] from -X importtime output
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def profile_imports(app_path, top):
+    app_root = tempfile.mkdtemp(prefix="nlq-startup-")
+    try:
+        # Chainlit reads its config from, and writes chainlit.md to, the working directory
+        shutil.copytree(os.path.join(os.path.dirname(app_path), ".chainlit"), os.path.join(app_root, ".chainlit"))
+        env = {**os.environ, **STUB_ENV, "CHAINLIT_AUTH_SECRET": "startup-benchmark",
+               "PYTHONPATH": os.path.dirname(app_path)}
+        code = ("import runpy, sys, time; start = time.perf_counter(); "
+                f"runpy.run_path({app_path!r}); print(time.perf_counter() - start)")
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=app_root, env=env,
+                                capture_output=True, text=True, check=True)
+    finally:
+        shutil.rmtree(app_root, ignore_errors=True)
+
+    imports = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in imports:
+        packages[name.split(".")[0]] += self_us
+    top_level = sorted((i for i in imports if i[3] == 0), key=lambda i: -i[2])
+    return {
+        "app_import_s": round(float(result.stdout.strip().splitlines()[-1]), 3),
+        "modules_imported": len(imports),
+        "top_imports_ms": {name: round(cumulative / 1000, 1) for name, _, cumulative, _ in top_level[:top]},
+        "top_packages_ms": {name: round(self_us / 1000, 1)
+                            for name, self_us in sorted(packages.items(), key=lambda p: -p[1])[:top]},
+    }
+
+
+async def wait_until_healthy(http, url, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"stub server exited with {process.returncode}")
+        try:
+            async with http.get(f"{url}/health") as response:
+                if response.status == 200:
+                    return await response.json()
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.05)
+    raise asyncio.TimeoutError()
+
+
+async def measure_start(args, warmup, question):
+    secret = secrets.token_hex(16)
+    url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "CHAINLIT_AUTH_SECRET": secret, "STARTUP_WARMUP": "true" if warmup else "false"}
+    command = [sys.executable, STUB_SERVER, "--port", str(args.port),
+               "--llm-profile", *map(str, args.llm_profile), "--query-latency", str(args.query_latency)]
+    if args.server_cpus:
+        command = ["taskset", "-c", args.server_cpus] + command
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    session = None
+    try:
+        async with aiohttp.ClientSession() as http:
+            health = await wait_until_healthy(http, url, process, args.timeout)
+        healthy = time.perf_counter()
+        session = ChatSession(url, session_token(secret, 0))
+        await session.open(args.timeout)
+        opened = time.perf_counter()
+        answer = await session.ask(question, args.timeout)
+        return {
+            "healthy_s": round(healthy - started, 3),
+            "warmup_s": health.get("duration"),
+            "warmup_steps_s": health.get("timings"),
+            "first_session_open_ms": round((opened - healthy) * 1000, 2),
+            "first_answer_ms": answer["latency_ms"],
+            "error": answer["error"],
+        }
+    finally:
+        if session is not None:
+            await session.close()
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="Server starts per warm-up setting")
+    parser.add_argument("--top", type=int, default=15, help="Imports and packages to list")
+    parser.add_argument("--app", default=APP_PATH)
+    parser.add_argument("--skip-server", action="store_true", help="Only profile the imports")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--server-cpus", help="Pin the stub server to these CPUs (taskset list, e.g. 0)")
+    parser.add_argument("--llm-profile", type=float, nargs=3, default=[0.0, 0.0, 0.0],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    parser.add_argument("--query-latency", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    app_path = os.path.abspath(args.app)
+    results = {"imports": [profile_imports(app_path, args.top) for _ in range(args.runs)]}
+    results["app_import_ms"] = summarise([run["app_import_s"] * 1000 for run in results["imports"]])
+    print(json.dumps(results["imports"][-1], indent=2))
+    print("app import ms:", results["app_import_ms"])
+
+    if not args.skip_server:
+        question = app_questions()[0]
+        for warmup in (False, True):
+            key = "warmup" if warmup else "no_warmup"
+            runs = [asyncio.run(measure_start(args, warmup, question)) for _ in range(args.runs)]
+            results[key] = {
+                "runs": runs,
+                "healthy_ms": summarise([run["healthy_s"] * 1000 for run in runs]),
+                "first_answer_ms": summarise([run["first_answer_ms"] for run in runs]),
+                "first_session_open_ms": summarise([run["first_session_open_ms"] for run in runs]),
+            }
+            print(f"{key}: healthy {results[key]['healthy_ms']['p50']:.0f}ms, "
+                  f"first session open {results[key]['first_session_open_ms']['p50']:.0f}ms, "
+                  f"first answer {results[key]['first_answer_ms']['p50']:.0f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Serves chainlit-app.py on the Chainlit server with stubbed Bedrock and Athena.
+
+The app runs unchanged except for its AWS clients: bedrock-runtime is
+FakeBedrockRuntime replaying benchmarks/agent_corpus.json, bedrock-agent serves
+the two prompts, and DB_CONNECTION_STRING points at the windfarm example data
+in SQLite, queried through FakeAthenaClient and the async Athena executor. Model
+and query latencies are configurable, so load tests see realistic waits, and
+--throttle puts a Bedrock quota in front of the model.
+Login is on as in the deployment, with a placeholder Cognito provider.
+
+    CHAINLIT_AUTH_SECRET=... python benchmarks/stub_server.py --port 8080 --llm-profile 0.45 0.00001 0.008 --query-latency 1.5
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import boto3  # noqa: E402
+from utils import athena_executor  # noqa: E402
+from agent_e2e_benchmark import APP_PATH, CORPUS_PATH, PROMPT_TEMPLATE, ScriptedReplies  # noqa: E402
+from fake_athena import FakeAthenaClient  # noqa: E402
+from fake_bedrock import FakeBedrockRuntime, ThrottlingBedrockRuntime  # noqa: E402
+from local_data_lake import EXAMPLE_DATA_ZIP, build_sqlite  # noqa: E402
+
+PROMPTS = {
+    "stub-data-prompt": "DataOrientedPrompt",
+    "stub-business-prompt": "BusinessOrientedPrompt",
+}
+
+
+class FakeBedrockAgent:
+    # get_prompt for the PromptRegistry, both prompts with the business prompt's text
+
+    def get_prompt(self, promptIdentifier):
+        return {
+            "name": PROMPTS[promptIdentifier],
+            "version": "DRAFT",
+            "updatedAt": datetime(2024, 11, 25),
+            "defaultVariant": "default",
+            "variants": [{"name": "default", "templateConfiguration": {"text": {"text": PROMPT_TEMPLATE}}}],
+        }
+
+
+def install_stubs(database_path, conversations_path, llm_profile, query_latency, throttle=None):
+    with open(conversations_path) as f:
+        conversations = json.load(f)["conversations"]
+    bedrock_runtime = FakeBedrockRuntime(
+        respond=ScriptedReplies(conversations), latency=llm_profile[0],
+        input_token_seconds=llm_profile[1], output_token_seconds=llm_profile[2])
+    if throttle:
+        bedrock_runtime = ThrottlingBedrockRuntime(
+            bedrock_runtime, requests_per_second=throttle[0], max_concurrency=int(throttle[1]), burst=throttle[0])
+    stubs = {"bedrock-runtime": bedrock_runtime, "bedrock-agent": FakeBedrockAgent()}
+    real_client = boto3.client
+
+    def client(service_name, *args, **kwargs):
+        if service_name in stubs:
+            return stubs[service_name]
+        return real_client(service_name, *args, **kwargs)
+
+    boto3.client = client
+
+    # The SQLite database stands in for Athena, so give it the async executor Athena gets
+    executor_class = athena_executor.AthenaQueryExecutor
+    executor_class.from_engine = classmethod(lambda cls, engine, **kwargs: cls(
+        FakeAthenaClient(database_path, latency=query_latency), database="default", **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--llm-profile", type=float, nargs=3, default=[0.0, 0.0, 0.0],
+                        metavar=("FIRST_TOKEN_S", "PER_INPUT_TOKEN_S", "PER_OUTPUT_TOKEN_S"))
+    parser.add_argument("--query-latency", type=float, default=0.0, help="Seconds each Athena query runs")
+    parser.add_argument("--throttle", type=float, nargs=2, metavar=("REQUESTS_PER_SECOND", "CONCURRENCY"),
+                        help="Throttle Bedrock calls over this quota, per model")
+    parser.add_argument("--data", default=EXAMPLE_DATA_ZIP)
+    args = parser.parse_args()
+    if "CHAINLIT_AUTH_SECRET" not in os.environ:
+        sys.exit("Set CHAINLIT_AUTH_SECRET, the load test signs its session tokens with it")
+
+    app_root = tempfile.mkdtemp(prefix="nlq-stub-")
+    database_path = os.path.join(app_root, "example-data.db")
+    build_sqlite(database_path, args.data)
+    install_stubs(database_path, args.corpus, args.llm_profile, args.query_latency, args.throttle)
+
+    os.environ.update({
+        "BEDROCK_PROMPT_ID_1": "stub-data-prompt",
+        "BEDROCK_PROMPT_ID_2": "stub-business-prompt",
+        "DB_CONNECTION_STRING": f"sqlite:///{database_path}",
+        "AWS_REGION_FOR_BEDROCK_INFERENCE": "us-east-1",
+        "CHAINLIT_HOST": args.host,
+        "CHAINLIT_PORT": str(args.port),
+    })
+    # The app requires an OAuth provider; sessions authenticate with JWTs signed with
+    # CHAINLIT_AUTH_SECRET, as they do after the Cognito login
+    for name, value in (("OAUTH_COGNITO_CLIENT_ID", "stub"), ("OAUTH_COGNITO_CLIENT_SECRET", "stub"),
+                        ("OAUTH_COGNITO_DOMAIN", "stub.auth.us-east-1.amazoncognito.com")):
+        os.environ.setdefault(name, value)
+    # Chainlit reads its config from, and writes chainlit.md to, the working directory
+    app_path = os.path.abspath(APP_PATH)
+    repo_root = os.path.dirname(app_path)
+    shutil.copytree(os.path.join(repo_root, ".chainlit"), os.path.join(app_root, ".chainlit"))
+    shutil.copytree(os.path.join(repo_root, "public"), os.path.join(app_root, "public"))
+    os.chdir(app_root)
+    from chainlit.cli import run_chainlit
+    from chainlit.config import config
+    config.run.headless = True
+    run_chainlit(app_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Per-step cost of modify_state_messages with and without the token count cache.
+
+Replays a conversation growing to 200 messages (with bulky SQL result tool
+messages) and runs trimming after every new message, as the agent does on
+every ReAct step.
+
+    python benchmarks/trimming_benchmark.py --messages 200
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.messages import (  # noqa: E402
+    AIMessage, HumanMessage, SystemMessage, ToolMessage, get_buffer_string, trim_messages)
+from utils import message_trimming  # noqa: E402
+from utils.message_trimming import modify_state_messages  # noqa: E402
+
+
+class RegexTokenizerModel:
+    # Stand-in for ChatBedrock's tokenizer: cost grows with the text length
+    model_id = "benchmark-tokenizer"
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_num_tokens_from_messages(self, messages):
+        self.calls += 1
+        return len(re.findall(r"\w+|[^\w\s]", get_buffer_string(messages)))
+
+
+def build_history(length):
+    rows = "\n".join(f"('turbine-{i}', {1729565872573 + i}, {40 + i % 7}.5)" for i in range(150))
+    messages = []
+    for i in range(length):
+        message_id = str(uuid.uuid4())
+        if i % 4 == 0:
+            messages.append(HumanMessage(content=f"Question {i} about the turbines?", id=message_id))
+        elif i % 4 == 1:
+            messages.append(AIMessage(content="", id=message_id, tool_calls=[
+                {"name": "sql_db_query", "args": {"query": "SELECT * FROM windfarm"}, "id": f"call_{i}"}]))
+        elif i % 4 == 2:
+            messages.append(ToolMessage(content=rows, tool_call_id=f"call_{i - 1}", id=message_id))
+        else:
+            messages.append(AIMessage(content=f"Answer {i}: turbine-3 ran hottest.", id=message_id))
+    return messages
+
+
+def uncached_trim(state, model, system_message):
+    return trim_messages(
+        [system_message] + state["messages"],
+        max_tokens=195000,
+        strategy="last",
+        token_counter=model,
+        include_system=True,
+    )
+
+
+def replay(label, trim, history):
+    model = RegexTokenizerModel()
+    message_trimming._token_counts.clear()
+    system_message = SystemMessage(content="You are a data analyst.")
+    step_times = []
+    for i in range(1, len(history) + 1):
+        start = time.perf_counter()
+        trim({"messages": history[:i]}, model, system_message)
+        step_times.append(time.perf_counter() - start)
+    print(f"{label:<10} total={sum(step_times) * 1000:9.1f}ms  "
+          f"last step={step_times[-1] * 1000:7.2f}ms  tokenizer calls={model.calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+
+    history = build_history(args.messages)
+    replay("uncached", uncached_trim, history)
+    replay("cached", modify_state_messages, history)
+
+
+if __name__ == "__main__":
+    main()
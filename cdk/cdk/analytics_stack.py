@@ -14,6 +14,7 @@ class AnalyticsStack(NestedStack):
         # Define constant values
         self.athena_database_name = "example_glue_database_" + self.account.lower()
         self.athena_workgroup_name = "primary_workgroup" + self.account.lower()
+        self.glue_crawler_name = "example-data-crawler"
 
         # Create Glue crawler role with specific permissions
         crawler_role = iam.Role(
@@ -41,7 +42,7 @@ class AnalyticsStack(NestedStack):
         # Create a Glue crawler
         glue_crawler = glue.CfnCrawler(
             self, "ExampleGlueCrawler",
-            name="example-data-crawler",
+            name=self.glue_crawler_name,
             role=crawler_role.role_arn,
             database_name=self.athena_database_name,
             targets=glue.CfnCrawler.TargetsProperty(
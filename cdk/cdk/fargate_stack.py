@@ -1,4 +1,4 @@
-from aws_cdk import NestedStack, RemovalPolicy, CfnOutput, Fn
+from aws_cdk import NestedStack, RemovalPolicy, CfnOutput, Fn, Duration
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import aws_ecs_patterns as ecs_patterns
 from aws_cdk import aws_ec2 as ec2
@@ -16,8 +16,9 @@ import os
 class FargateStack(NestedStack):
     def __init__(self, scope: Construct, construct_id: str, vpc: ec2.Vpc,
                  access_logs_bucket, data_bucket, athena_results_bucket, db_connection_string: str,
-                 athena_workgroup_name: str, athena_database_name: str, data_oriented_prompt_id: str, business_oriented_prompt_id: str,
-                 aws_region_for_bedrock_inference: str = 'us-west-2', ** kwargs) -> None:
+                 athena_workgroup_name: str, athena_database_name: str, glue_crawler_name: str, data_oriented_prompt_id: str, business_oriented_prompt_id: str,
+                 aws_region_for_bedrock_inference: str = 'us-west-2', desired_count: int = 1,
+                 checkpoint_db_url: str = None, ** kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # Build the Docker image
@@ -40,6 +41,7 @@ class FargateStack(NestedStack):
                 # Bedrock permissions
                 "bedrock:GetPrompt",
                 "bedrock:InvokeModel",
+                "bedrock:InvokeModelWithResponseStream",
                 # Athena permissions
                 "athena:Get*",
                 "athena:List*",
@@ -78,6 +80,10 @@ class FargateStack(NestedStack):
                 f"""
                     arn:aws:glue:{self.region}:{self.account}:table/{athena_database_name}/*
                 """.strip(),
+                # Crawler last run, used to invalidate cached query results
+                f"""
+                    arn:aws:glue:{self.region}:{self.account}:crawler/{glue_crawler_name}
+                """.strip(),
 
                 # Athena workgroup and datacatalog resources
                 f"""
@@ -125,6 +131,15 @@ class FargateStack(NestedStack):
             )
         )
 
+        # Bearer token for scraping /metrics, which the app only serves when it is set
+        metrics_token_secret = secretsmanager.Secret(
+            self, "MetricsTokenSecret",
+            secret_name=f"{self.stack_name}-metrics-token",
+            description="Bearer token for the /metrics endpoint",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                exclude_punctuation=True, password_length=40)
+        )
+
         # Create Fargate service with mixed environment configuration
         fargate_service = ecs_patterns.ApplicationLoadBalancedFargateService(
             self, "GenAIService",
@@ -139,14 +154,19 @@ class FargateStack(NestedStack):
                     "DB_CONNECTION_STRING": db_connection_string,
                     "BEDROCK_PROMPT_ID_1": data_oriented_prompt_id,
                     "BEDROCK_PROMPT_ID_2": business_oriented_prompt_id,
-                    "AWS_REGION_FOR_BEDROCK_INFERENCE": aws_region_for_bedrock_inference
+                    "AWS_REGION_FOR_BEDROCK_INFERENCE": aws_region_for_bedrock_inference,
+                    "GLUE_CRAWLER_NAME": glue_crawler_name,
+                    # Build the clients, prompts and schema cache before taking traffic
+                    "STARTUP_WARMUP": "true"
                 },
                 secrets={
                     # Use the existing secret value
-                    "CHAINLIT_AUTH_SECRET": ecs.Secret.from_secrets_manager(chainlit_secret)
+                    "CHAINLIT_AUTH_SECRET": ecs.Secret.from_secrets_manager(chainlit_secret),
+                    "METRICS_TOKEN": ecs.Secret.from_secrets_manager(metrics_token_secret)
                 }
             ),
-            desired_count=1,
+            # More than one task requires a shared checkpoint_db_url for conversation state
+            desired_count=desired_count,
             vpc=vpc,
             public_load_balancer=True,
             # Configure deployment circuit breaker
@@ -155,6 +175,23 @@ class FargateStack(NestedStack):
             )
         )
 
+        # Tasks only receive traffic once the warm-up has finished
+        fargate_service.target_group.configure_health_check(
+            path="/health",
+            healthy_http_codes="200",
+        )
+
+        CfnOutput(self, "MetricsTokenSecretArn", value=metrics_token_secret.secret_arn,
+                  description="Secret holding the bearer token for scraping /metrics")
+
+        if checkpoint_db_url:
+            fargate_service.task_definition.default_container.add_environment(
+                "CHECKPOINT_DB_URL", checkpoint_db_url)
+
+        if desired_count > 1:
+            # Keep each browser's websocket session on one task
+            fargate_service.target_group.enable_cookie_stickiness(Duration.hours(8))
+
         # Enable load balancer access logs
         fargate_service.load_balancer.log_access_logs(
             access_logs_bucket, 'alb-access-logs')
@@ -42,9 +42,10 @@ class MainStack(Stack):
             self, "PromptsStack",
         )
 
-        # Calculate Athena connection string
+        # Calculate Athena connection string (the arrow driver fetches results as one Arrow table from S3
+        # instead of paging through GetQueryResults)
         athena_staging_dir = f"s3://{storage.athena_results_bucket.bucket_name}/athena-results/"
-        athena_connection_string = f"awsathena+rest://@athena.{self.region}.amazonaws.com:443/{analytics.athena_database_name}?s3_staging_dir={athena_staging_dir}&work_group={analytics.athena_workgroup_name}"
+        athena_connection_string = f"awsathena+arrow://@athena.{self.region}.amazonaws.com:443/{analytics.athena_database_name}?s3_staging_dir={athena_staging_dir}&work_group={analytics.athena_workgroup_name}"
 
         # ECS Fargate Stack
         fargate = FargateStack(
@@ -56,6 +57,7 @@ class MainStack(Stack):
             db_connection_string=athena_connection_string,
             athena_workgroup_name=analytics.athena_workgroup_name,
             athena_database_name=analytics.athena_database_name,
+            glue_crawler_name=analytics.glue_crawler_name,
             data_oriented_prompt_id=prompts.data_oriented_prompt.prompt_id,
             business_oriented_prompt_id=prompts.business_oriented_prompt.prompt_id,
             aws_region_for_bedrock_inference=aws_region_for_bedrock_inference,
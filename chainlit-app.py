@@ -1,29 +1,48 @@
-import boto3
+import asyncio
 import chainlit as cl
 import os
+import time
 import uuid
 import pytz
 from chainlit.input_widget import Switch, Select
+from chainlit.server import app as chainlit_server
 from datetime import datetime
-from langchain.schema.runnable.config import RunnableConfig
-from langchain_aws import ChatBedrock
-from langchain_core.messages import SystemMessage
-from sqlalchemy import create_engine
-from langchain_community.utilities import SQLDatabase
-from langgraph.prebuilt import create_react_agent
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langgraph.checkpoint.memory import MemorySaver
-from utils.message_trimming import modify_state_messages
+from utils.agent_cache import agent_cache
+from utils.answer_cache import answer_cache
+from utils.blocking import run_blocking
+from utils.loop_lag import loop_lag_monitor
+from utils.metrics import SessionMetrics, TurnMetrics, current_turn, metrics, mount_metrics_endpoint
+from utils.prompt_registry import PromptRegistry
+from utils.result_cache import result_cache
+from utils.startup import STARTUP_WARMUP, Warmup, import_modules, lazy, mount_health_endpoint
 from utils.token_counter import TokenCounter
-from langchain_core.tools import tool
 from typing import Dict, Optional
 
-
-memory = MemorySaver()
+# boto3, langchain, langgraph, SQLAlchemy and the SQL toolkit take most of the start up
+# time, so they are imported when the first session needs them (or by the warm-up)
+AGENT_MODULES = [
+    "boto3",
+    "langchain.schema.runnable.config",
+    "langchain_aws",
+    "langchain_community.agent_toolkits.sql.toolkit",
+    "langchain_core.tools",
+    "utils.agent_graph",
+    "utils.athena_executor",
+    "utils.bedrock_client",
+    "utils.checkpointer",
+    "utils.db_engine",
+    "utils.message_trimming",
+    "utils.metrics_callbacks",
+    "utils.prompt_caching",
+    "utils.sql_validator",
+]
 
 # NOTE: currently the datetime is hardcoded to Sydney/Australia timezone. Please change to your own.
 # Get current datetime in timezone
 TIMEZONE = pytz.timezone("Australia/Sydney")
+# How long the date and time in a session's system message are reused, at most the
+# 5 minutes Bedrock keeps a prompt cache entry
+SYSTEM_MESSAGE_MAX_AGE_SECONDS = int(os.environ.get("SYSTEM_MESSAGE_MAX_AGE_SECONDS", "300"))
 
 # Environment Variables
 prompt_id_1 = os.environ['BEDROCK_PROMPT_ID_1']  # Data oriented prompt
@@ -31,14 +50,74 @@ prompt_id_2 = os.environ['BEDROCK_PROMPT_ID_2']  # Business oriented prompt
 connection_string = os.environ['DB_CONNECTION_STRING']
 region = os.environ['AWS_REGION_FOR_BEDROCK_INFERENCE']
 
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name=region
-)
 
-bedrock_agent_client = boto3.client(
-    service_name="bedrock-agent",
-)
+@lazy
+def get_memory():
+    from utils.checkpointer import BoundedMemorySaver, create_checkpointer
+    memory = create_checkpointer()
+    if isinstance(memory, BoundedMemorySaver):
+        # Conversations kept in memory, and evicted or spilled to disk
+        metrics.add_collector(memory.gauges)
+    return memory
+
+
+@lazy
+def get_bedrock_runtime():
+    from utils.bedrock_client import create_bedrock_runtime
+    from utils.prompt_caching import PromptCachingClient
+    # Calls to each model are kept within its quota, admitted fairly across sessions,
+    # and retried with backoff and jitter when Bedrock throttles them
+    bedrock_runtime = create_bedrock_runtime(region)
+    metrics.add_collector(bedrock_runtime.gauges)
+    # Adds prompt cache checkpoints to requests, so each ReAct step and turn reuses the
+    # system prompt, schema digest and tool definitions already sent
+    return PromptCachingClient(bedrock_runtime)
+
+
+@lazy
+def get_prompt_registry():
+    import boto3
+    bedrock_agent_client = boto3.client(
+        service_name="bedrock-agent",
+    )
+
+    # Load the prompts once per process and keep them fresh in the background
+    prompt_registry = PromptRegistry(bedrock_agent_client, [prompt_id_1, prompt_id_2])
+    prompt_registry.load()
+    prompt_registry.start_background_refresh()
+    return prompt_registry
+
+
+def warm_schema_cache():
+    from utils.db_engine import get_database
+    db = get_database(connection_string)
+    # The schema digest, or the schema index when the catalog is too large for a digest
+    if not db.schema_digest():
+        db.table_columns()
+
+
+# Prometheus metrics for every LLM, tool and Athena call, served next to the UI
+mount_metrics_endpoint(chainlit_server)
+metrics.add_collector(lambda: [
+    ("nlq_event_loop_lag_seconds", "Event loop lag, p99 of recent samples", loop_lag_monitor.stats()["p99"]),
+    ("nlq_event_loop_lag_max_seconds", "Largest event loop lag since start", loop_lag_monitor.stats()["max"]),
+    ("nlq_answer_cache_entries", "Answers in the answer cache", answer_cache.stats()["entries"]),
+    ("nlq_agent_graphs", "Compiled agent graphs shared by the sessions", agent_cache.stats()["entries"]),
+])
+metrics.add_collector(result_cache.gauges)
+
+# With STARTUP_WARMUP the health check fails until the modules, clients, prompts, database
+# engine and schema cache are ready, so the load balancer only sends users to warm tasks
+warmup = None
+if STARTUP_WARMUP:
+    warmup = Warmup()
+    warmup.add("imports", lambda: import_modules(AGENT_MODULES))
+    warmup.add("checkpointer", get_memory)
+    warmup.add("bedrock_runtime", get_bedrock_runtime)
+    warmup.add("prompts", get_prompt_registry)
+    warmup.add("schema_cache", warm_schema_cache)
+    warmup.start()
+mount_health_endpoint(chainlit_server, warmup)
 
 QUESTIONS = [
     "How many turbines are in the database and what are their asset ids?",
@@ -59,40 +138,73 @@ def oauth_callback(
 
 @cl.on_chat_start
 async def start():
+    loop_lag_monitor.start()
+    # Messages sent before the agent is set up wait for it, and report the error if
+    # setting it up failed
+    agent_ready = asyncio.get_running_loop().create_future()
+    cl.user_session.set("agent_ready", agent_ready)
+
+    try:
+        settings = await open_session()
+        await setup_agent(settings)
+    except Exception as e:
+        agent_ready.set_exception(e)
+        # Retrieved here so a session that never sends a message logs nothing about it
+        agent_ready.exception()
+        await cl.Message(content=setup_failed_content(e)).send()
+        return
+    agent_ready.set_result(True)
+    if settings["EnableFixedQuestions"]:
+        await ask_fixed_question()
+
+
+def setup_failed_content(error):
+    # The chat settings are only shown once the prompts have loaded
+    retry = ("Change a chat setting to try again." if cl.user_session.get("chat_settings_sent")
+             else "Start a new chat to try again.")
+    return f"The agent could not be set up: {error}\n\n{retry}"
+
+
+async def open_session():
+    # Sets up the session's state and sends its chat settings, returns the default settings
+
+    # The first session imports the agent's modules, off the event loop (a no-op once
+    # imported, or after the warm-up)
+    await run_blocking(import_modules, AGENT_MODULES)
+    from utils.agent_graph import MODEL_ROUTING_OPTIONS, ROUTING_SELECTED_MODEL
+    from utils.message_trimming import CONTEXT_BUDGET_OPTIONS
+
     thread_id = str(uuid.uuid4())
     cl.user_session.set("thread_id", thread_id)
     cl.user_session.set("token_counter", TokenCounter())
+    cl.user_session.set("session_metrics", SessionMetrics())
 
-    # Fetch both prompts
-    response1 = bedrock_agent_client.get_prompt(
-        promptIdentifier=prompt_id_1)  # Data oriented
-    response2 = bedrock_agent_client.get_prompt(
-        promptIdentifier=prompt_id_2)  # Business oriented
-
-    def get_prompt_text(response):
-        default_variant = response['defaultVariant']
-        for variant in response['variants']:
-            if variant['name'] == default_variant:
-                return variant['templateConfiguration']['text']['text']
-        return None
+    # Both prompts are served from memory by the registry (it only calls Bedrock
+    # if a prompt failed to load, so keep that off the event loop)
+    prompt_registry = await run_blocking(get_prompt_registry)
+    data_prompt_name, data_prompt_text = await run_blocking(
+        prompt_registry.get, prompt_id_1)  # Data oriented
+    business_prompt_name, business_prompt_text = await run_blocking(
+        prompt_registry.get, prompt_id_2)  # Business oriented
 
-    # Store prompts in session using their names from the response
+    # Store prompts in session using their names
     prompts = {
-        response1['name']: get_prompt_text(response1),  # Data oriented
-        response2['name']: get_prompt_text(response2)   # Business oriented
+        data_prompt_name: data_prompt_text,  # Data oriented
+        business_prompt_name: business_prompt_text   # Business oriented
     }
     cl.user_session.set("prompts", prompts)
 
-    # Get the business prompt name for default
-    business_prompt_name = response2['name']
-
     # Set default settings using the business prompt
     default_settings = {
         "ShowTokenCount": False,
         "EnableTrimming": True,
         "ModelID": "anthropic.claude-3-5-haiku-20241022-v1:0",
         "EnableFixedQuestions": False,
-        "SelectedPrompt": business_prompt_name  # Default to business prompt
+        "SelectedPrompt": business_prompt_name,  # Default to business prompt
+        "ContextBudget": CONTEXT_BUDGET_OPTIONS[0],
+        "EnableCompaction": False,
+        "EnableAnswerCache": True,
+        "ModelRouting": ROUTING_SELECTED_MODEL
     }
     cl.user_session.set("settings", default_settings)
 
@@ -119,13 +231,27 @@ async def start():
                     "anthropic.claude-3-5-sonnet-20240620-v1:0"],
             initial_index=0
         ),
+        Select(
+            id="ModelRouting",
+            label="Model Routing",
+            values=MODEL_ROUTING_OPTIONS,
+            initial_index=0
+        ),
         Switch(id="ShowTokenCount", label="Show Token Count", initial=False),
         Switch(id="EnableTrimming", label="Enable Message Trimming", initial=True),
+        Select(
+            id="ContextBudget",
+            label="Context Budget (input tokens)",
+            values=CONTEXT_BUDGET_OPTIONS,
+            initial_index=0
+        ),
+        Switch(id="EnableCompaction",
+               label="Summarise Older Turns Near Budget", initial=False),
+        Switch(id="EnableAnswerCache",
+               label="Reuse Answers to Repeated Questions", initial=True),
     ]).send()
-
-    await setup_agent(default_settings)
-    if default_settings["EnableFixedQuestions"]:
-        await ask_fixed_question()
+    cl.user_session.set("chat_settings_sent", True)
+    return default_settings
 
 
 async def ask_fixed_question():
@@ -157,56 +283,54 @@ async def process_question(question):
 async def on_settings_update(settings):
     cl.user_session.set("settings", settings)
     await setup_agent(settings)
+    agent_ready = cl.user_session.get("agent_ready")
+    if agent_ready.done() and agent_ready.exception():
+        # Set up now after failing at chat start
+        agent_ready = asyncio.get_running_loop().create_future()
+        agent_ready.set_result(True)
+        cl.user_session.set("agent_ready", agent_ready)
 
     # if enablefixedquestions is enabled, ask a question
     if settings["EnableFixedQuestions"]:
         await ask_fixed_question()
 
 
-async def setup_agent(settings):
-    cl.user_session.set("show_token_count", settings["ShowTokenCount"])
-    cl.user_session.set("enable_trimming", settings["EnableTrimming"])
-
-    model_id = settings["ModelID"]
-    selected_prompt = settings["SelectedPrompt"]
-
-    current_datetime = datetime.now(TIMEZONE)
-
-    # Format datetime as string
-    formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S %Z")
-
-    # Get Unix epoch time in milliseconds
-    epoch_time = int(current_datetime.timestamp() * 1000)
-
-    prompts = cl.user_session.get("prompts")
-    system_prompt = prompts[selected_prompt]
-    system_message = SystemMessage(
-        content=system_prompt.format(
-            # Change if not using trino based Athena queries
-            dialect="trino",
-            current_datetime=formatted_datetime,
-            current_epoch=epoch_time
-        )
-    )
-    cl.user_session.set("system_message", system_message)
-
-    # DB Connection and tools
-    engine_athena = create_engine(connection_string, echo=False)
-    db = SQLDatabase(engine_athena)
+def build_agent(model_id, fast_model_id, db):
+    # Imported on first use rather than at module load, see AGENT_MODULES
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+    from langchain_core.tools import tool
+    from utils.agent_graph import create_agent
+    from utils.athena_executor import with_async_query_tool
+    from utils.bedrock_client import AdmittedChatBedrock
+    from utils.message_trimming import RESPONSE_MAX_TOKENS, configured_state_modifier
+    from utils.sql_validator import with_local_query_checker
 
     # Model configuration
+    bedrock_runtime = get_bedrock_runtime()
     model_kwargs = {
-        "max_tokens": 4096, "temperature": 0.1,
+        "max_tokens": RESPONSE_MAX_TOKENS, "temperature": 0.1,
         "top_k": 250, "top_p": 0.9, "stop_sequences": ["\n\nHuman"],
     }
-    model = ChatBedrock(
+    model = AdmittedChatBedrock(
         client=bedrock_runtime,
         model_id=model_id,
         model_kwargs=model_kwargs,
     )
 
+    # Tool-selection and SQL-repair steps can go to a faster model, keeping the
+    # selected model for the answer
+    fast_model = None
+    if fast_model_id:
+        fast_model = AdmittedChatBedrock(
+            client=bedrock_runtime,
+            model_id=fast_model_id,
+            model_kwargs=model_kwargs,
+        )
+
     toolkit = SQLDatabaseToolkit(db=db, llm=model)
-    sql_tools = toolkit.get_tools()
+    # sql_db_query awaits Athena queries instead of blocking a thread while they run,
+    # and sql_db_query_checker checks queries locally instead of with another LLM call
+    sql_tools = with_local_query_checker(with_async_query_tool(toolkit.get_tools(), db), db)
 
     # Create the epoch conversion tool
 
@@ -223,43 +347,241 @@ async def setup_agent(settings):
 
     tools = sql_tools + [epoch_to_local]
 
-    def state_modifier(state):
-        return modify_state_messages(state, model, cl.user_session.get("system_message"))
-
-    agent_executor = create_react_agent(
+    # The session's system message and trimming settings come with each question's
+    # config (see agent_config), so the graph can be shared
+    return create_agent(
         model,
         tools,
-        state_modifier=state_modifier,
-        checkpointer=memory
+        state_modifier=configured_state_modifier(model),
+        checkpointer=get_memory(),
+        fast_model=fast_model
     )
 
+
+async def setup_agent(settings):
+    # Imported on first use rather than at module load, see AGENT_MODULES
+    from utils.agent_graph import FAST_MODEL_ID, ROUTING_FAST_TOOL_STEPS
+    from utils.db_engine import get_database
+
+    cl.user_session.set("show_token_count", settings["ShowTokenCount"])
+    cl.user_session.set("enable_trimming", settings["EnableTrimming"])
+
+    model_id = settings["ModelID"]
+    selected_prompt = settings["SelectedPrompt"]
+    fast_model_id = None
+    if settings.get("ModelRouting") == ROUTING_FAST_TOOL_STEPS and model_id != FAST_MODEL_ID:
+        fast_model_id = FAST_MODEL_ID
+
+    # Sessions with the same model, routing and data source share one compiled graph.
+    # The other settings are read for each question, so changing them needs no set up.
+    agent_key = (model_id, fast_model_id, connection_string)
+    if (agent_key, selected_prompt) == cl.user_session.get("agent_setup"):
+        return
+    setup_started = time.perf_counter()
+
+    # DB Connection and tools (pooled engine and SQLDatabase shared across sessions)
+    db = await run_blocking(get_database, connection_string)
+    cl.user_session.set("db", db)
+
+    # Describing the schema up front saves the agent listing and describing the
+    # tables at the start of every conversation
+    schema_digest = await run_blocking(db.schema_digest)
+    cl.user_session.set("schema_digest", schema_digest)
+
+    cl.user_session.set("selected_prompt", selected_prompt)
+    set_system_message()
+
+    agent_executor = await run_blocking(
+        agent_cache.get, agent_key, lambda: build_agent(model_id, fast_model_id, db))
+
     cl.user_session.set("runnable", agent_executor)
+    cl.user_session.set("agent_setup", (agent_key, selected_prompt))
+    metrics.observe("nlq_agent_setup_seconds", time.perf_counter() - setup_started)
+
+
+def set_system_message():
+    # Imported on first use rather than at module load, see AGENT_MODULES
+    from langchain_core.messages import SystemMessage
+
+    current_datetime = datetime.now(TIMEZONE)
+
+    # Format datetime as string
+    formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S %Z")
+
+    # Get Unix epoch time in milliseconds
+    epoch_time = int(current_datetime.timestamp() * 1000)
+
+    prompts = cl.user_session.get("prompts")
+    system_prompt = prompts[cl.user_session.get("selected_prompt")]
+    system_content = system_prompt.format(
+        # Change if not using trino based Athena queries
+        dialect="trino",
+        current_datetime=formatted_datetime,
+        current_epoch=epoch_time
+    )
+    schema_digest = cl.user_session.get("schema_digest")
+    if schema_digest:
+        system_content = f"{system_content}\n\n{schema_digest}"
+    cl.user_session.set("system_message", SystemMessage(content=system_content))
+    cl.user_session.set("system_message_built", time.monotonic())
+
+
+def agent_config(settings, callbacks):
+    # Imported on first use rather than at module load, see AGENT_MODULES
+    from langchain.schema.runnable.config import RunnableConfig
+    from langchain_core.messages import SystemMessage
+    from utils.message_trimming import context_budget
+
+    # The system message carries the current date and time. It is kept for as long as
+    # Bedrock keeps its prompt cache entry, so follow-up questions still reuse it.
+    if time.monotonic() - cl.user_session.get("system_message_built") >= SYSTEM_MESSAGE_MAX_AGE_SECONDS:
+        set_system_message()
+
+    # The session's values for the shared agent graph, read by its state modifier
+    system_message = cl.user_session.get("system_message")
+    schema_context = cl.user_session.get("schema_context")
+    if schema_context:
+        system_message = SystemMessage(content=f"{system_message.content}\n\n{schema_context}")
+    return RunnableConfig(callbacks=callbacks, recursion_limit=50, configurable={
+        "thread_id": cl.user_session.get("thread_id"),
+        "system_message": system_message,
+        "max_tokens": context_budget(settings.get("ContextBudget")),
+        "enable_compaction": settings.get("EnableCompaction", False),
+        "enable_trimming": cl.user_session.get("enable_trimming", True),
+    })
+
+
+def message_text(message):
+    # Anthropic messages may be a plain string or a list of content blocks
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block.get("text", "") for block in message.content
+        if isinstance(block, dict) and block.get("type") in ("text", "text_delta")
+    )
+
+
+async def stream_agent_answer(agent_executor, question, config, token_counter):
+    from utils.agent_graph import FAST_MODEL_TAG
+    from utils.message_compaction import COMPACTION_TAG
+
+    # Stream the model's tokens into the UI as they are generated. Text the model
+    # produces before deciding to call a tool is not the answer, so it is discarded.
+    answer_message = cl.Message(content="")
+    async for event in agent_executor.astream_events(
+        {"messages": [("human", question)]},
+        config=config,
+        version="v2",
+    ):
+        if event["metadata"].get("langgraph_node") != "agent":
+            continue
+
+        if event["event"] == "on_chat_model_stream":
+            # The fast model only picks tools and the compaction call summarises the
+            # history, their text is never the answer
+            if FAST_MODEL_TAG in event.get("tags", []) or COMPACTION_TAG in event.get("tags", []):
+                continue
+            token = message_text(event["data"]["chunk"])
+            if token:
+                await answer_message.stream_token(token)
+        elif event["event"] == "on_chat_model_end":
+            output = event["data"]["output"]
+            token_counter.update_from_message(output)
+            if FAST_MODEL_TAG in event.get("tags", []) or COMPACTION_TAG in event.get("tags", []):
+                continue
+            if output.tool_calls:
+                if answer_message.content:
+                    await answer_message.remove()
+                answer_message = cl.Message(content="")
+            elif not answer_message.content:
+                # The model returned the answer without streaming it
+                answer_message.content = message_text(output)
+
+    await answer_message.send()
+    return answer_message.content
+
+
+async def set_schema_context(db, question):
+    # Give the agent the schema of the tables relevant to the question up front, instead
+    # of having it list and describe every table in the catalog. Follow-up questions that
+    # match no table keep the tables of the previous question. Not needed when the
+    # schema digest in the system message already covers the whole catalog.
+    if cl.user_session.get("schema_digest"):
+        return
+    table_names = await run_blocking(db.relevant_tables, question)
+    if not table_names:
+        table_names = cl.user_session.get("schema_tables", [])
+    cl.user_session.set("schema_tables", table_names)
+    if not table_names:
+        cl.user_session.set("schema_context", None)
+        return
+    table_info = await run_blocking(db.get_table_info, table_names)
+    cl.user_session.set("schema_context", (
+        "These are the tables most relevant to the question, with their columns and sample rows. "
+        "Query them directly instead of listing the tables and their schemas again, and only look "
+        "for other tables if these cannot answer the question.\n\n" + table_info
+    ))
 
 
 @cl.on_message
 async def on_message(message: cl.Message):
+    # Imported on first use rather than at module load, see AGENT_MODULES
+    from langchain_core.messages import AIMessage, HumanMessage
+    from utils.metrics_callbacks import MetricsCallbackHandler
+
+    try:
+        # Shielded, as the future is shared by the session's messages
+        await asyncio.shield(cl.user_session.get("agent_ready"))
+    except Exception as e:
+        await cl.Message(content=setup_failed_content(e)).send()
+        return
     agent_executor = cl.user_session.get("runnable")
-    thread_id = cl.user_session.get("thread_id")
     token_counter = cl.user_session.get("token_counter")
 
-    async for chunk in agent_executor.astream(
-        {"messages": [("human", message.content)]},
-        config=RunnableConfig(callbacks=[cl.LangchainCallbackHandler()], recursion_limit=50, configurable={
-            "thread_id": thread_id,
-            "enable_trimming": cl.user_session.get("enable_trimming", True),
-        }),
-    ):
-        if isinstance(chunk, dict) and 'agent' in chunk:
-            final_result = chunk
-            usage = chunk['agent']['messages'][-1].additional_kwargs.get(
-                'usage', {})
-            token_counter.update_tokens(usage)
-
-    await cl.Message(content=final_result['agent']['messages'][-1].content).send()
+    # Usage and timings of every call made for this question, also added to the
+    # session's and the process's totals
+    turn = TurnMetrics(cl.user_session.get("session_metrics"))
+    current_turn.set(turn)
+
+    settings = cl.user_session.get("settings")
+    callbacks = [cl.LangchainCallbackHandler(), MetricsCallbackHandler(turn)]
+
+    # Answers are reused only for the same prompt and model, after the same earlier
+    # questions in the conversation, and while the underlying data is unchanged
+    answer_scope = (settings["SelectedPrompt"], settings["ModelID"])
+    asked_questions = cl.user_session.get("asked_questions", [])
+    db = cl.user_session.get("db")
+    freshness = await run_blocking(db.data_freshness)
+    cached_answer = None
+    if settings.get("EnableAnswerCache", True):
+        cached_answer = answer_cache.get(answer_scope, asked_questions, message.content, freshness)
+
+    outcome = "error"
+    try:
+        if cached_answer is not None:
+            # Record the turn in the conversation so follow-up questions have its context
+            await agent_executor.aupdate_state(
+                agent_config(settings, callbacks),
+                {"messages": [HumanMessage(content=message.content), AIMessage(content=cached_answer)]},
+                as_node="agent",
+            )
+            await cl.Message(content=cached_answer).send()
+            outcome = "answer_cache"
+        else:
+            await set_schema_context(db, message.content)
+            config = agent_config(settings, callbacks)
+            answer = await stream_agent_answer(agent_executor, message.content, config, token_counter)
+            if answer:
+                answer_cache.put(answer_scope, asked_questions, message.content, freshness, answer)
+            outcome = "agent"
+    finally:
+        turn.finish(outcome)
+    token_counter.update_cache_usage(turn.totals["cache_read_tokens"], turn.totals["cache_write_tokens"])
+    cl.user_session.set("asked_questions", asked_questions + [message.content])
 
     if cl.user_session.get("show_token_count"):
         await cl.Message(
-            content=token_counter.get_token_usage_content(),
+            content=token_counter.get_token_usage_content() + f"\n    This question: {turn.summary()}",
             author="System (Token Usage)"
         ).send()
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are imported from the repository root, as the app and benchmarks do
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
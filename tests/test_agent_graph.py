@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from utils.agent_graph import ParallelToolNode
+
+running = []
+peak = []
+lock = threading.Lock()
+
+
+def started():
+    with lock:
+        running.append(1)
+        peak.append(len(running))
+
+
+def finished():
+    with lock:
+        running.pop()
+
+
+@tool
+async def slow_query(query: str):
+    """Runs a query."""
+    started()
+    await asyncio.sleep(0.05)
+    finished()
+    return f"result of {query}"
+
+
+@tool
+def slow_schema(table: str):
+    """Describes a table."""
+    started()
+    time.sleep(0.05)
+    finished()
+    return f"schema of {table}"
+
+
+def tool_calls(name, arg, count):
+    calls = [{"name": name, "args": {arg: f"q{i}"}, "id": f"call-{i}"} for i in range(count)]
+    return {"messages": [AIMessage(content="", tool_calls=calls)]}
+
+
+def test_async_tool_calls_run_at_most_max_concurrency_at_a_time():
+    peak.clear()
+    node = ParallelToolNode([slow_query], max_concurrency=3)
+
+    outputs = asyncio.run(node.ainvoke(tool_calls("slow_query", "query", 8)))["messages"]
+
+    assert max(peak) == 3
+    assert [output.content for output in outputs] == [f"result of q{i}" for i in range(8)]
+    assert all(output.response_metadata["timing"]["duration_ms"] >= 50 for output in outputs)
+    assert outputs[-1].response_metadata["timing"]["queued_ms"] >= 100
+
+
+def test_sync_tool_calls_run_at_most_max_concurrency_at_a_time():
+    peak.clear()
+    node = ParallelToolNode([slow_schema], max_concurrency=2)
+
+    outputs = node.invoke(tool_calls("slow_schema", "table", 5))["messages"]
+
+    assert max(peak) == 2
+    assert [output.content for output in outputs] == [f"schema of q{i}" for i in range(5)]
+    assert outputs[-1].response_metadata["timing"]["queued_ms"] >= 100
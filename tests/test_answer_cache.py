@@ -0,0 +1,52 @@
+import pytest
+from utils.answer_cache import AnswerCache
+
+SCOPE = ("Data Analyst", "anthropic.claude-3-5-haiku-20241022-v1:0")
+FRESHNESS = (1, None, (("windfarm", "v1"),))
+
+
+def cache_with(question, answer="cached"):
+    cache = AnswerCache()
+    cache.put(SCOPE, [], question, FRESHNESS, answer)
+    return cache
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Which turbine had the highest average temperature?", "Which turbine had the lowest average temperature?"),
+    ("How many readings are above 80 degrees?", "How many readings are below 80 degrees?"),
+    ("What is the average power output of turbine 3?", "What is the maximum power output of turbine 3?"),
+    ("Which turbines were not serviced in 2023?", "Which turbines were serviced in 2023?"),
+    ("Total output of turbine 3 in March", "Total output of turbine 4 in March"),
+    ("Output of windfarm A compared to windfarm B", "Output of windfarm B compared to windfarm A"),
+    ("Total output of windfarm A", "Total output of windfarm"),
+])
+def test_near_misses_are_not_served(cached, asked):
+    assert cache_with(cached).get(SCOPE, [], asked, FRESHNESS) is None
+
+
+@pytest.mark.parametrize("asked", [
+    "Which turbine had the highest average temperature?",
+    "which turbine had the highest average temperature",
+    "Can you tell me which turbine had the highest average temperature, please?",
+    "What turbine had the highest average temperature?",
+])
+def test_rephrasings_are_served(asked):
+    cache = cache_with("Which turbine had the highest average temperature?")
+
+    assert cache.get(SCOPE, [], asked, FRESHNESS) == "cached"
+
+
+def test_answers_expire_with_the_data():
+    cache = cache_with("How many turbines are there?")
+
+    assert cache.get(SCOPE, [], "How many turbines are there?", (1, None, (("windfarm", "v2"),))) is None
+    assert cache.stats()["stale"] == 1
+    assert cache.get(SCOPE, [], "How many turbines are there?", FRESHNESS) is None
+
+
+def test_answers_depend_on_the_earlier_questions():
+    cache = AnswerCache()
+    cache.put(SCOPE, ["Show turbine 3"], "And its maximum output?", FRESHNESS, "cached")
+
+    assert cache.get(SCOPE, ["Show turbine 4"], "And its maximum output?", FRESHNESS) is None
+    assert cache.get(SCOPE, ["show me turbine 3"], "And its maximum output?", FRESHNESS) == "cached"
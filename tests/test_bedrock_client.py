@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from botocore.exceptions import ClientError
+from utils.bedrock_client import ModelLimiter, ThrottledBedrockClient
+
+MODEL_ID = "anthropic.claude-3-5-haiku-20241022-v1:0"
+
+
+def throttling_error():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}}, "invoke_model")
+
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise throttling_error()
+        return {"body": "answer"}
+
+
+def test_waiting_calls_leave_the_executor_free():
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+        limiter = ModelLimiter(max_concurrency=1)
+        limiter.acquire()
+        waiters = [asyncio.create_task(limiter.acquire_async(session)) for session in range(8)]
+        await asyncio.sleep(0.05)
+
+        # More calls wait than the executor has threads, and it still runs other work
+        assert limiter.stats()["waiting"] == 8
+        assert await asyncio.wait_for(loop.run_in_executor(None, lambda: "done"), 1) == "done"
+
+        for _ in waiters:
+            await loop.run_in_executor(None, limiter.release)
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        assert limiter.stats() == {"waiting": 0, "sessions_waiting": 0, "in_flight": 1, "limit": 1}
+
+    asyncio.run(run())
+
+
+def test_admitted_calls_are_retried_on_the_event_loop():
+    client = ThrottledBedrockClient(FakeClient(failures=2), quotas={})
+
+    async def call():
+        # ChatBedrock makes the request in an executor thread and re-raises its errors as ValueError
+        def invoke():
+            try:
+                return client.invoke_model(modelId=MODEL_ID, body="{}")
+            except Exception as e:
+                raise ValueError(f"Error raised by bedrock service: {e}")
+        return await asyncio.get_running_loop().run_in_executor(None, invoke)
+
+    async def run():
+        return await client.admitted(MODEL_ID, call)
+
+    assert asyncio.run(run()) == {"body": "answer"}
+    assert client._client.calls == 3
+    assert client.limiter(MODEL_ID).stats()["in_flight"] == 0
+
+
+def test_admitted_calls_give_up_after_the_queue_timeout():
+    client = ThrottledBedrockClient(FakeClient(), quotas={MODEL_ID: {"max_concurrency": 1}}, queue_timeout=0.05)
+    client.limiter(MODEL_ID).acquire()
+
+    async def call():
+        return client.invoke_model(modelId=MODEL_ID)
+
+    with pytest.raises(ClientError, match="ThrottlingException"):
+        asyncio.run(client.admitted(MODEL_ID, call))
+    assert client.limiter(MODEL_ID).stats()["waiting"] == 0
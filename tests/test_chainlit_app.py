@@ -0,0 +1,87 @@
+import asyncio
+import importlib.util
+import os
+from datetime import datetime
+import pytest
+import chainlit as cl
+from langchain_core.messages import SystemMessage
+from utils.prompt_registry import PromptRegistry
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "chainlit-app.py")
+APP_ENV = {
+    "BEDROCK_PROMPT_ID_1": "data-prompt",
+    "BEDROCK_PROMPT_ID_2": "business-prompt",
+    "DB_CONNECTION_STRING": "sqlite://",
+    "AWS_REGION_FOR_BEDROCK_INFERENCE": "us-east-1",
+    "OAUTH_COGNITO_CLIENT_ID": "test",
+    "OAUTH_COGNITO_CLIENT_SECRET": "test",
+    "OAUTH_COGNITO_DOMAIN": "test.auth.us-east-1.amazoncognito.com",
+    "STARTUP_WARMUP": "false",
+}
+
+
+class UnavailableBedrockAgent:
+    def get_prompt(self, promptIdentifier):
+        raise ConnectionError("bedrock-agent is unreachable")
+
+
+class UserSession(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+class Message:
+    sent = []
+
+    def __init__(self, content, **kwargs):
+        self.content = content
+
+    async def send(self):
+        Message.sent.append(self.content)
+        return self
+
+
+@pytest.fixture
+def app(monkeypatch):
+    for name, value in APP_ENV.items():
+        monkeypatch.setenv(name, value)
+    # chainlit-app.py is not importable by name
+    spec = importlib.util.spec_from_file_location("chainlit_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    monkeypatch.setattr(cl, "user_session", UserSession())
+    monkeypatch.setattr(cl, "Message", Message)
+    monkeypatch.setattr(Message, "sent", [])
+    return app
+
+
+def test_messages_report_a_failed_chat_start(app, monkeypatch):
+    monkeypatch.setattr(app, "get_prompt_registry",
+                        lambda: PromptRegistry(UnavailableBedrockAgent(), ["data-prompt", "business-prompt"]))
+
+    async def run():
+        await app.start()
+        await asyncio.wait_for(app.on_message(Message("How many turbines are there?")), 5)
+
+    asyncio.run(run())
+
+    assert len(Message.sent) == 2
+    for content in Message.sent:
+        assert content.startswith("The agent could not be set up: Prompt data-prompt is not available")
+        assert content.endswith("Start a new chat to try again.")
+
+
+def test_stale_system_messages_get_the_current_date(app):
+    cl.user_session.update(prompts={"Business": "Now: {current_datetime} ({current_epoch}). Write {dialect} SQL."},
+                           selected_prompt="Business", schema_digest="windfarm: asset_id string")
+    app.set_system_message()
+    fresh = cl.user_session["system_message"]
+    # Follow-up questions keep the same system message, so its prompt cache entry is reused
+    assert app.agent_config({}, [])["configurable"]["system_message"] is fresh
+
+    cl.user_session["system_message"] = SystemMessage(content="Now: 2024-01-01 09:00:00 AEDT")
+    cl.user_session["system_message_built"] -= app.SYSTEM_MESSAGE_MAX_AGE_SECONDS
+    content = app.agent_config({}, [])["configurable"]["system_message"].content
+
+    assert content.startswith(f"Now: {datetime.now(app.TIMEZONE):%Y-%m-%d}")
+    assert content.endswith("Write trino SQL.\n\nwindfarm: asset_id string")
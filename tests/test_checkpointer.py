@@ -0,0 +1,106 @@
+import threading
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.graph import MessagesState, StateGraph
+from sqlalchemy import create_engine, event
+from utils.checkpointer import BoundedMemorySaver, SQLCheckpointSaver
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'checkpoints.db'}")
+
+
+def echo_graph(checkpointer):
+    def agent(state):
+        return {"messages": [AIMessage(content=f"seen {len(state['messages'])}")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", agent)
+    graph.set_entry_point("agent")
+    graph.set_finish_point("agent")
+    return graph.compile(checkpointer=checkpointer)
+
+
+def count_selects(engine):
+    selects = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    return selects
+
+
+def test_conversation_resumes_on_another_saver(engine):
+    config = {"configurable": {"thread_id": "t1"}}
+    echo_graph(SQLCheckpointSaver(engine)).invoke({"messages": [("human", "one")]}, config)
+
+    # A second task sharing the database continues the same thread
+    result = echo_graph(SQLCheckpointSaver(engine)).invoke({"messages": [("human", "two")]}, config)
+
+    assert [m.content for m in result["messages"]] == ["one", "seen 1", "two", "seen 3"]
+
+
+def test_pending_writes_are_durable(engine):
+    saver = SQLCheckpointSaver(engine)
+    config = {"configurable": {"thread_id": "t1"}}
+    echo_graph(saver).invoke({"messages": [("human", "one")]}, config)
+    latest = saver.get_tuple(config).config
+
+    saver.put_writes(latest, [("messages", "partial"), ("__error__", "boom")], "task-1")
+
+    pending = SQLCheckpointSaver(engine).get_tuple(latest).pending_writes
+    assert pending == [("task-1", "__error__", "boom"), ("task-1", "messages", "partial")]
+
+
+def test_list_loads_writes_in_one_query(engine):
+    saver = SQLCheckpointSaver(engine, max_checkpoints_per_thread=100)
+    config = {"configurable": {"thread_id": "t1"}}
+    graph = echo_graph(saver)
+    for question in ("one", "two", "three"):
+        graph.invoke({"messages": [("human", question)]}, config)
+
+    selects = count_selects(engine)
+    checkpoints = list(saver.list(config))
+
+    assert len(checkpoints) == 9
+    assert len(selects) == 2
+    assert [c.config for c in saver.list(config, limit=2)] == [c.config for c in checkpoints[:2]]
+    assert {c.metadata["step"] for c in saver.list(config, filter={"source": "input"})} == {-1, 2, 5}
+
+
+def test_threads_are_compacted_to_the_latest_checkpoints(engine):
+    saver = SQLCheckpointSaver(engine, max_checkpoints_per_thread=3)
+    config = {"configurable": {"thread_id": "t1"}}
+    graph = echo_graph(saver)
+    for question in ("one", "two"):
+        graph.invoke({"messages": [("human", question)]}, config)
+
+    checkpoints = list(saver.list(config))
+
+    assert len(checkpoints) == 3
+    assert checkpoints[0].checkpoint["channel_values"]["messages"][-1].content == "seen 3"
+
+
+def test_listing_all_threads_while_threads_are_evicted():
+    saver = BoundedMemorySaver(max_threads=5)
+    graph = echo_graph(saver)
+    stop = threading.Event()
+
+    def converse():
+        for i in range(200):
+            graph.invoke({"messages": [("human", "hi")]}, {"configurable": {"thread_id": f"t{i}"}})
+        stop.set()
+
+    writer = threading.Thread(target=converse)
+    writer.start()
+    while not stop.is_set():
+        for _ in saver.list(None):
+            pass
+    writer.join()
+
+    gauges = {name: value for name, _, value in saver.gauges()}
+    assert gauges["nlq_checkpoint_threads"] == 5
+    assert gauges["nlq_checkpoint_evicted_threads_total"] == 195
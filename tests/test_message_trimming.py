@@ -0,0 +1,44 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from utils.message_trimming import count_tokens, modify_state_messages
+
+
+class FakeModel:
+    model_id = "fake-model"
+
+    def get_num_tokens_from_messages(self, messages):
+        return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+    def with_config(self, **kwargs):
+        return self
+
+    def invoke(self, messages):
+        return AIMessage(content="The user asked about turbine temperatures.")
+
+
+def conversation(turns, tool_output_chars):
+    messages = []
+    for turn in range(turns):
+        tool_call = {"name": "sql_db_query", "args": {"query": "SELECT 1"}, "id": f"call-{turn}"}
+        messages += [
+            HumanMessage(content=f"Question {turn}", id=f"compact-trim-{turn}-human"),
+            AIMessage(content="", tool_calls=[tool_call], id=f"compact-trim-{turn}-ai"),
+            ToolMessage(content="x" * tool_output_chars, tool_call_id=f"call-{turn}", id=f"compact-trim-{turn}-tool"),
+            AIMessage(content=f"Answer {turn}", id=f"compact-trim-{turn}-answer"),
+        ]
+    return messages
+
+
+def test_compacted_tool_outputs_are_counted_at_their_new_size():
+    model = FakeModel()
+    system_message = SystemMessage(content="You are a data analyst.")
+    messages = conversation(turns=3, tool_output_chars=20000)
+    # Earlier agent steps counted the full tool outputs
+    assert count_tokens(messages, model) > 15000
+
+    state = {"messages": messages}
+    trimmed = modify_state_messages(state, model, system_message, max_tokens=10000, enable_compaction=True)
+
+    # The two recent turns fit once the older turn's tool output is cut, so nothing is trimmed
+    assert not state["trimmed"]
+    assert [message.content for message in trimmed if isinstance(message, HumanMessage)] == ["Question 1", "Question 2"]
+    assert count_tokens(trimmed, model) < 10000
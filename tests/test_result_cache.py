@@ -0,0 +1,24 @@
+import pytest
+from utils.result_cache import referenced_tables
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM windfarm w, turbines t WHERE w.asset_id = t.asset_id", ["turbines", "windfarm"]),
+    ('SELECT * FROM "default".windfarm, "default"."turbines"', ["turbines", "windfarm"]),
+    ("SELECT extract(year FROM event_time), count(*) FROM windfarm GROUP BY 1", ["windfarm"]),
+    ("SELECT * FROM windfarm JOIN turbines ON windfarm.asset_id = turbines.asset_id", ["turbines", "windfarm"]),
+    ("SELECT * FROM windfarm WHERE asset_id IN (SELECT asset_id FROM turbines)", ["turbines", "windfarm"]),
+])
+def test_tables_are_found(sql, tables):
+    assert referenced_tables(sql, "trino") == tables
+
+
+def test_common_table_expressions_are_not_tables():
+    sql = "WITH hot AS (SELECT * FROM windfarm WHERE temperature > 80) SELECT count(*) FROM hot"
+
+    assert referenced_tables(sql, "trino") == ["windfarm"]
+
+
+@pytest.mark.parametrize("sql", ["SHOW COLUMNS FROM windfarm", "SELECT * FROM windfarm WHERE ("])
+def test_queries_without_known_tables_are_not_cached(sql):
+    assert referenced_tables(sql, "trino") is None
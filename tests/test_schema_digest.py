@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine, event, text
+from utils.schema_cache import CachedSQLDatabase, SchemaCache
+from utils.schema_digest import build_schema_digest, sample_values
+
+DOCUMENT = {"name": "windfarm", "columns": [("asset_id", "string", ""), ("temperature", "double", "Degrees C")]}
+TABLE_INFO = """CREATE TABLE windfarm (
+\tasset_id VARCHAR,
+\ttemperature FLOAT
+)
+
+/*
+3 rows from windfarm table:
+asset_id\ttemperature
+T-01\t71.5
+T-02\t80.1
+T-01\tNone
+*/"""
+
+
+def test_sample_values_are_read_from_the_table_info():
+    assert sample_values(TABLE_INFO) == {"asset_id": ["T-01", "T-02"], "temperature": ["71.5", "80.1"]}
+
+
+def test_text_columns_show_sample_values():
+    digest = build_schema_digest([DOCUMENT], table_info=lambda name: TABLE_INFO)
+
+    assert digest.endswith("windfarm: asset_id string e.g. 'T-01', 'T-02'; temperature double (Degrees C)")
+
+
+def test_samples_are_left_out_when_the_digest_would_be_too_long():
+    without_samples = build_schema_digest([DOCUMENT])
+
+    assert build_schema_digest([DOCUMENT], table_info=lambda name: TABLE_INFO,
+                               max_chars=len(without_samples)) == without_samples
+
+
+def test_digest_reuses_the_cached_table_info(tmp_path):
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE windfarm (asset_id VARCHAR(20), temperature REAL)"))
+        connection.execute(text("INSERT INTO windfarm VALUES ('T-01', 71.5), ('T-02', 80.1)"))
+    db = CachedSQLDatabase(engine, schema_cache=SchemaCache("digest-test", cache_dir=str(tmp_path)))
+    queries = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: queries.append(statement))
+
+    assert "asset_id varchar(20) e.g. 'T-01', 'T-02'" in db.schema_digest()
+    assert "T-01" in db.get_table_info(["windfarm"])
+    # One sample query, made for the table info, serves both
+    assert len([query for query in queries if "FROM windfarm" in query]) == 1
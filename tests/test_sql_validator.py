@@ -0,0 +1,49 @@
+import pytest
+from utils.sql_validator import check_query
+
+TABLE_COLUMNS = {"windfarm": ["asset_id", "temperature", "event_time"]}
+
+
+@pytest.mark.parametrize("query, dialect", [
+    ("SELECT table_name FROM information_schema.tables WHERE table_schema = 'default'", "trino"),
+    ("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'windfarm'", "trino"),
+    ("SELECT tablename FROM pg_catalog.pg_tables WHERE schemaname = 'public'", "postgres"),
+    ("SELECT c.relname FROM pg_catalog.pg_class AS c JOIN windfarm AS w ON c.relname = w.asset_id", "postgres"),
+])
+def test_system_schemas_are_allowed(query, dialect):
+    assert check_query(query, TABLE_COLUMNS, dialect) == []
+
+
+def test_unknown_tables_are_still_reported():
+    problems = check_query("SELECT * FROM windfarms", TABLE_COLUMNS)
+
+    assert len(problems) == 1
+    assert problems[0].startswith("Table windfarms does not exist. Did you mean: windfarm?")
+
+
+def test_unknown_columns_are_still_reported():
+    problems = check_query("SELECT asset_id, temprature FROM windfarm", TABLE_COLUMNS)
+
+    assert problems == ["Column temprature does not exist in windfarm. Did you mean: temperature?"]
+
+
+def test_trino_rules_apply_to_system_schema_queries():
+    problems = check_query("SELECT ifnull(table_name, '') FROM information_schema.tables", TABLE_COLUMNS)
+
+    assert problems == ["IFNULL is not a Trino function, use coalesce instead."]
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT avg(CAST(temperature AS REAL)) FROM windfarm",
+    "SELECT avg(try_cast(temperature AS real)) FROM windfarm",
+    "SELECT avg(CAST(temperature AS DOUBLE)) AS float FROM windfarm",
+])
+def test_real_casts_pass(query):
+    assert check_query(query, TABLE_COLUMNS) == []
+
+
+def test_float_casts_are_reported():
+    problems = check_query("SELECT avg(CAST(temperature AS REAL)), max(CAST(temperature AS float)) FROM windfarm",
+                           TABLE_COLUMNS)
+
+    assert problems == ["Cast to REAL instead of FLOAT in queries (line 1)."]
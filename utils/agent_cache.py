@@ -0,0 +1,52 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+# Compiled agent graphs kept, one per model, routing and data source in use
+AGENT_CACHE_SIZE = int(os.environ.get("AGENT_CACHE_SIZE", "16"))
+
+
+class AgentCache:
+    # LRU of compiled agent graphs shared by every session with the same key. The
+    # graphs hold no session state: that comes from the checkpointer and the config.
+
+    def __init__(self, max_entries=AGENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, key, build):
+        with self._lock:
+            agent = self._entries.get(key)
+            if agent is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return agent
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Sessions starting together with a new key wait for one build
+        with build_lock:
+            with self._lock:
+                agent = self._entries.get(key)
+                if agent is not None:
+                    self.hits += 1
+                    return agent
+            agent = build()
+            with self._lock:
+                self._entries[key] = agent
+                self.builds += 1
+                self._build_locks.pop(key, None)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return agent
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds}
+
+
+agent_cache = AgentCache()
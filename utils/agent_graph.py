@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import time
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import get_config_list, get_executor_for_config
+from langgraph.graph import END, StateGraph
+from langgraph.prebuilt import ToolNode
+from langgraph.prebuilt.chat_agent_executor import AgentState
+from utils.metrics import metrics
+
+
+# Tool calls from one agent step that may run at the same time
+TOOL_MAX_CONCURRENCY = int(os.environ.get("TOOL_MAX_CONCURRENCY", "4"))
+
+# Model used for tool-selection and SQL-repair steps when routing is on
+FAST_MODEL_ID = os.environ.get("FAST_MODEL_ID", "anthropic.claude-3-5-haiku-20241022-v1:0")
+ROUTING_SELECTED_MODEL = "Selected model for every step"
+ROUTING_FAST_TOOL_STEPS = "Fast model for tool steps"
+MODEL_ROUTING_OPTIONS = [ROUTING_SELECTED_MODEL, ROUTING_FAST_TOOL_STEPS]
+# Tag on the fast model's calls; its text is never the final answer, so it isn't streamed
+FAST_MODEL_TAG = "fast_model"
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelToolNode(ToolNode):
+    # langgraph's ToolNode runs all of a step's tool calls at once. This one runs at most
+    # `max_concurrency` at a time, so a step asking for many Athena queries doesn't take
+    # every pool connection. Results keep the order of the tool calls and carry their
+    # timings in response_metadata["timing"].
+
+    def __init__(self, tools, max_concurrency=TOOL_MAX_CONCURRENCY, **kwargs):
+        super().__init__(tools, **kwargs)
+        self.max_concurrency = max(1, max_concurrency)
+
+    def _record_timings(self, outputs, timings, step_start):
+        for output, (start, end) in zip(outputs, timings):
+            queued = start - step_start
+            metrics.observe("nlq_tool_queue_wait_seconds", queued, tool=output.name)
+            output.response_metadata["timing"] = {
+                "queued_ms": round(queued * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1),
+            }
+        if len(outputs) > 1:
+            logger.info(
+                "Ran %d tool calls in %.0fms: %s", len(outputs), (time.perf_counter() - step_start) * 1000,
+                ", ".join(f"{o.name}={o.response_metadata['timing']['duration_ms']:.0f}ms" for o in outputs))
+
+    def _func(self, input, config):
+        tool_calls, output_type = self._parse_input(input)
+        step_start = time.perf_counter()
+        timings = [None] * len(tool_calls)
+
+        def run_one(i, call, call_config):
+            start = time.perf_counter()
+            output = self._run_one(call, call_config)
+            timings[i] = (start, time.perf_counter())
+            return output
+
+        # The config's executor, as in ToolNode, copies the context into its threads
+        with get_executor_for_config({**config, "max_concurrency": self.max_concurrency}) as executor:
+            outputs = list(executor.map(run_one, range(len(tool_calls)), tool_calls,
+                                        get_config_list(config, len(tool_calls))))
+        self._record_timings(outputs, timings, step_start)
+        return outputs if output_type == "list" else {"messages": outputs}
+
+    async def _afunc(self, input, config):
+        tool_calls, output_type = self._parse_input(input)
+        step_start = time.perf_counter()
+        timings = [None] * len(tool_calls)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(i, call):
+            async with semaphore:
+                start = time.perf_counter()
+                output = await self._arun_one(call, config)
+                timings[i] = (start, time.perf_counter())
+                return output
+
+        outputs = await asyncio.gather(*(run_one(i, call) for i, call in enumerate(tool_calls)))
+        self._record_timings(outputs, timings, step_start)
+        return outputs if output_type == "list" else {"messages": outputs}
+
+
+def has_query_result(messages):
+    # True when the tool results the model is about to read include a successful query
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            return False
+        if message.name == "sql_db_query" and not message.content.startswith("Error"):
+            return True
+    return False
+
+
+class FastToolStepModel:
+    # Stands in for the chat model in create_react_agent. Steps that pick tools or
+    # repair SQL go to fast_model and steps that answer from query results go to the
+    # selected model. If the fast model answers instead of calling a tool, the selected
+    # model writes the answer.
+
+    def __init__(self, model, fast_model):
+        self.model = model
+        self.fast_model = fast_model
+
+    def bind_tools(self, tools):
+        model = self.model.bind_tools(tools)
+        fast_model = self.fast_model.bind_tools(tools).with_config(tags=[FAST_MODEL_TAG])
+
+        def route(messages, config):
+            if not has_query_result(messages):
+                response = fast_model.invoke(messages, config)
+                if response.tool_calls:
+                    return response
+            return model.invoke(messages, config)
+
+        async def aroute(messages, config):
+            if not has_query_result(messages):
+                response = await fast_model.ainvoke(messages, config)
+                if response.tool_calls:
+                    return response
+            return await model.ainvoke(messages, config)
+
+        return RunnableLambda(route, aroute, name="ModelRouter")
+
+
+def create_agent(model, tools, state_modifier, checkpointer=None, fast_model=None):
+    # The graph of langgraph's create_react_agent, which always builds a stock ToolNode,
+    # with ParallelToolNode as the tool node, and fast-model routing when a fast_model is given
+    if fast_model is not None:
+        model = FastToolStepModel(model, fast_model)
+    model_runnable = RunnableLambda(state_modifier, name="StateModifier") | model.bind_tools(tools)
+
+    def should_continue(state):
+        return "continue" if state["messages"][-1].tool_calls else "end"
+
+    def out_of_steps(state, response):
+        if state["is_last_step"] and response.tool_calls:
+            return {"messages": [AIMessage(id=response.id, content="Sorry, need more steps to process this request.")]}
+        return {"messages": [response]}
+
+    def call_model(state, config):
+        return out_of_steps(state, model_runnable.invoke(state, config))
+
+    async def acall_model(state, config):
+        return out_of_steps(state, await model_runnable.ainvoke(state, config))
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("agent", RunnableLambda(call_model, acall_model))
+    workflow.add_node("tools", ParallelToolNode(tools))
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", should_continue, {"continue": "tools", "end": END})
+    workflow.add_edge("tools", "agent")
+    return workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,89 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+_WORD = re.compile(r"[a-z0-9_.]+")
+# Words that can be added, dropped or swapped without changing what is asked. Anything
+# that could change the answer (comparisons, negations, superlatives, names, numbers)
+# is deliberately left out.
+STOPWORDS = frozenset("""
+an the is are be of for in on at me i we us you my our your please can could would
+will do does show tell give list display what whats which there s this that it its
+""".split())
+
+
+def normalize_question(question):
+    return " ".join(_WORD.findall(question.lower()))
+
+
+def content_words(normalized):
+    return tuple(word for word in normalized.split() if word not in STOPWORDS)
+
+
+class AnswerCache:
+    # Answers keyed by scope (prompt and model), the earlier questions in the
+    # conversation, and the question itself. Questions match when they have the same
+    # words in the same order, ignoring case, punctuation and STOPWORDS; near misses
+    # such as "highest" and "lowest" must never share an answer.
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _key(self, scope, context, normalized):
+        return (tuple(scope), tuple(content_words(normalize_question(q)) for q in context),
+                content_words(normalized))
+
+    def get(self, scope, context, question, freshness):
+        normalized = normalize_question(question)
+        key = self._key(scope, context, normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry["freshness"] != freshness:
+                # The data changed since the answer was computed
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            if entry["question"] == normalized:
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+            self._entries.move_to_end(key)
+            return entry["answer"]
+
+    def put(self, scope, context, question, freshness, answer):
+        normalized = normalize_question(question)
+        with self._lock:
+            self._entries[self._key(scope, context, normalized)] = {
+                "question": normalized,
+                "freshness": freshness,
+                "answer": answer,
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,173 @@
+import asyncio
+import os
+from urllib.parse import unquote
+import boto3
+from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
+from utils.blocking import run_blocking
+from utils.metrics import record_athena_query
+from utils.result_fetch import SQL_FETCH_CHUNK_ROWS, SQL_MAX_RESULT_CHARS, SQL_MAX_RESULT_ROWS, format_rows
+
+
+# Queries in flight per Athena workgroup, across all sessions in the process
+ATHENA_MAX_CONCURRENT_QUERIES = int(os.environ.get("ATHENA_MAX_CONCURRENT_QUERIES", "20"))
+ATHENA_POLL_INITIAL_SECONDS = float(os.environ.get("ATHENA_POLL_INITIAL_SECONDS", "0.2"))
+ATHENA_POLL_MAX_SECONDS = float(os.environ.get("ATHENA_POLL_MAX_SECONDS", "2.0"))
+ATHENA_POLL_BACKOFF = float(os.environ.get("ATHENA_POLL_BACKOFF", "1.5"))
+ATHENA_QUERY_TIMEOUT_SECONDS = float(os.environ.get("ATHENA_QUERY_TIMEOUT_SECONDS", "300"))
+
+class AthenaQueryError(Exception):
+    pass
+
+
+class AthenaQueryExecutor:
+    # Runs Athena queries without holding a thread while they execute: only the
+    # short API calls go through the blocking executor, and polling backs off with
+    # asyncio.sleep. Cancelling the awaiting task stops the query in Athena. Results
+    # are read through the engine's pyathena cursor, as fetch_capped reads them.
+
+    _semaphores = {}
+
+    def __init__(self, client, database, workgroup=None, output_location=None, engine=None,
+                 max_concurrency=ATHENA_MAX_CONCURRENT_QUERIES, poll_initial=ATHENA_POLL_INITIAL_SECONDS,
+                 poll_max=ATHENA_POLL_MAX_SECONDS, poll_backoff=ATHENA_POLL_BACKOFF,
+                 timeout=ATHENA_QUERY_TIMEOUT_SECONDS, max_rows=SQL_MAX_RESULT_ROWS,
+                 max_chars=SQL_MAX_RESULT_CHARS, max_string_length=300):
+        self.client = client
+        self.database = database
+        self.workgroup = workgroup
+        self.output_location = output_location
+        self.engine = engine
+        self.max_concurrency = max_concurrency
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_backoff = poll_backoff
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.max_chars = max_chars
+        self.max_string_length = max_string_length
+
+    @classmethod
+    def from_engine(cls, engine, **kwargs):
+        url = engine.url
+        if not url.drivername.startswith("awsathena"):
+            return None
+        region = url.host.split(".")[1]
+        return cls(
+            boto3.client("athena", region_name=region),
+            database=url.database,
+            workgroup=url.query.get("work_group"),
+            output_location=unquote(url.query["s3_staging_dir"]) if "s3_staging_dir" in url.query else None,
+            engine=engine,
+            **kwargs,
+        )
+
+    def _semaphore(self):
+        key = (self.workgroup, id(asyncio.get_running_loop()))
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[key]
+
+    async def execute(self, sql, include_columns=False):
+        async with self._semaphore():
+            query_execution_id = await self._start(sql)
+            try:
+                execution = await asyncio.wait_for(self._wait(query_execution_id), self.timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                await run_blocking(self.client.stop_query_execution, QueryExecutionId=query_execution_id)
+                raise
+            record_athena_query(execution)
+            if self.engine is None:
+                return await run_blocking(self._page_results, query_execution_id, execution, include_columns)
+            return await run_blocking(self._read_results, execution, include_columns)
+
+    async def _start(self, sql):
+        request = {
+            "QueryString": sql,
+            "QueryExecutionContext": {"Database": self.database},
+        }
+        if self.workgroup:
+            request["WorkGroup"] = self.workgroup
+        if self.output_location:
+            request["ResultConfiguration"] = {"OutputLocation": self.output_location}
+        response = await run_blocking(self.client.start_query_execution, **request)
+        return response["QueryExecutionId"]
+
+    async def _wait(self, query_execution_id):
+        interval = self.poll_initial
+        while True:
+            response = await run_blocking(self.client.get_query_execution, QueryExecutionId=query_execution_id)
+            execution = response["QueryExecution"]
+            state = execution["Status"]["State"]
+            if state == "SUCCEEDED":
+                return execution
+            if state in ("FAILED", "CANCELLED"):
+                raise AthenaQueryError(execution["Status"].get("StateChangeReason", state))
+            await asyncio.sleep(interval)
+            interval = min(self.poll_max, interval * self.poll_backoff)
+
+    def _format(self, chunks, include_columns):
+        return format_rows(chunks, include_columns, self.max_string_length, self.max_rows, self.max_chars)
+
+    def _read_results(self, execution, include_columns):
+        # The finished query's result set, built as the engine's own cursor would build
+        # it (the Arrow one with awsathena+arrow), so values are converted as they are
+        # for fetch_capped and both paths can share result_cache entries
+        # Imported here as pyathena's Arrow result set loads pyarrow
+        from pyathena.arrow.cursor import ArrowCursor
+        from pyathena.arrow.result_set import AthenaArrowResultSet
+        from pyathena.model import AthenaQueryExecution
+
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            query_execution = AthenaQueryExecution({"QueryExecution": execution})
+            result_set_class = AthenaArrowResultSet if isinstance(cursor, ArrowCursor) else cursor._result_set_class
+            cursor.result_set = result_set_class(
+                connection.driver_connection, cursor._converter, query_execution, SQL_FETCH_CHUNK_ROWS,
+                connection.driver_connection.retry_config)
+            if not cursor.description:
+                return ""
+            columns = [column[0] for column in cursor.description]
+            chunks = iter(lambda: [dict(zip(columns, row)) for row in cursor.fetchmany(SQL_FETCH_CHUNK_ROWS)], [])
+            return self._format(chunks, include_columns)
+        finally:
+            connection.close()
+
+    def _page_results(self, query_execution_id, execution, include_columns):
+        # Without an engine (a client on its own), page GetQueryResults and convert the
+        # values with pyathena's converter for its default cursor
+        from pyathena.converter import DefaultTypeConverter
+        converter = DefaultTypeConverter()
+
+        def pages():
+            next_token, skip_header = None, execution.get("StatementType") == "DML"
+            while True:
+                request = {"QueryExecutionId": query_execution_id, "MaxResults": 1000}
+                if next_token:
+                    request["NextToken"] = next_token
+                response = self.client.get_query_results(**request)
+                columns = response["ResultSet"]["ResultSetMetadata"]["ColumnInfo"]
+                page = response["ResultSet"]["Rows"]
+                if skip_header:
+                    page, skip_header = page[1:], False
+                yield [
+                    {column["Name"]: converter.convert(column["Type"], datum.get("VarCharValue"))
+                     for column, datum in zip(columns, row["Data"])}
+                    for row in page
+                ]
+                next_token = response.get("NextToken")
+                if not next_token:
+                    break
+
+        return self._format(pages(), include_columns)
+
+
+class AsyncQuerySQLDataBaseTool(QuerySQLDataBaseTool):
+    # sql_db_query that awaits the database's async query path when run by the agent
+
+    async def _arun(self, query, run_manager=None):
+        return await self.db.arun_no_throw(query)
+
+
+def with_async_query_tool(tools, db):
+    return [AsyncQuerySQLDataBaseTool(db=db) if t.name == "sql_db_query" else t for t in tools]
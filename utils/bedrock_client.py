@@ -0,0 +1,424 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionClosedError, EndpointConnectionError
+from langchain_aws import ChatBedrock
+from utils.metrics import current_turn, metrics
+
+
+# HTTP connection pool and timeouts of the bedrock-runtime client. Retries are done by
+# ThrottledBedrockClient, through the model's limiter, so botocore makes one attempt.
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+BEDROCK_CONNECT_TIMEOUT_SECONDS = int(os.environ.get("BEDROCK_CONNECT_TIMEOUT_SECONDS", "5"))
+BEDROCK_READ_TIMEOUT_SECONDS = int(os.environ.get("BEDROCK_READ_TIMEOUT_SECONDS", "120"))
+
+# Per-model limits, sized to the account's Bedrock quotas, as JSON:
+# {"<model id>": {"requests_per_minute": 50, "max_concurrency": 8}}. Models not listed
+# get the defaults. A requests_per_minute of 0 leaves the rate unlimited.
+BEDROCK_MODEL_QUOTAS = json.loads(os.environ.get("BEDROCK_MODEL_QUOTAS", "{}"))
+BEDROCK_DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("BEDROCK_DEFAULT_REQUESTS_PER_MINUTE", "0"))
+BEDROCK_DEFAULT_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_DEFAULT_MAX_CONCURRENCY", "16"))
+# Requests the token bucket lets through at once, in seconds of the per-minute rate
+BEDROCK_BURST_SECONDS = float(os.environ.get("BEDROCK_BURST_SECONDS", "5"))
+
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "6"))
+BEDROCK_BACKOFF_BASE_SECONDS = float(os.environ.get("BEDROCK_BACKOFF_BASE_SECONDS", "0.5"))
+BEDROCK_BACKOFF_MAX_SECONDS = float(os.environ.get("BEDROCK_BACKOFF_MAX_SECONDS", "20"))
+# How long a call may wait for its model's limiter before failing as throttled
+BEDROCK_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("BEDROCK_QUEUE_TIMEOUT_SECONDS", "120"))
+
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException"}
+RETRYABLE_CODES = THROTTLING_CODES | {"ServiceUnavailableException", "ModelNotReadyException",
+                                      "InternalServerException"}
+
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+    connect_timeout=BEDROCK_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=BEDROCK_READ_TIMEOUT_SECONDS,
+    tcp_keepalive=True,
+    retries={"mode": "standard", "total_max_attempts": 1},
+)
+
+
+class QueueTimeout(Exception):
+    pass
+
+
+# The limiter slot ThrottledBedrockClient.admitted took for the request being made
+_admission = contextvars.ContextVar("bedrock_admission", default=None)
+
+
+class _Admission:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.used = False
+
+
+class _AsyncWaiter:
+    # A call waiting on the event loop; release() may run in any thread
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+def _session():
+    # Calls are queued fairly per chat session
+    turn = current_turn.get()
+    return id(turn.session or turn) if turn is not None else None
+
+
+def _retry_code(error):
+    # The code of a Bedrock error worth retrying, otherwise None. ChatBedrock re-raises
+    # the client's errors as ValueError, so the errors they were raised from are checked too
+    while error is not None:
+        if isinstance(error, ClientError):
+            code = error.response.get("Error", {}).get("Code", "")
+            return code if code in RETRYABLE_CODES else None
+        if isinstance(error, (ConnectionClosedError, EndpointConnectionError)):
+            return type(error).__name__
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def backoff_seconds(attempt, base=BEDROCK_BACKOFF_BASE_SECONDS, cap=BEDROCK_BACKOFF_MAX_SECONDS):
+    # Exponential backoff with full jitter, so throttled calls don't retry in step
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class ModelLimiter:
+    # Admits the calls to one model: at most `limit` at a time and, with a rate, no more
+    # than the token bucket allows. The limit halves when Bedrock throttles a call and
+    # grows back by about one per `limit` successful calls, up to max_concurrency.
+    # Waiting calls are queued per session and admitted round-robin across sessions, so
+    # a session running many calls at once doesn't hold up the others.
+
+    def __init__(self, requests_per_minute=BEDROCK_DEFAULT_REQUESTS_PER_MINUTE,
+                 max_concurrency=BEDROCK_DEFAULT_MAX_CONCURRENCY, burst_seconds=BEDROCK_BURST_SECONDS):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self._updated = time.monotonic()
+        self._queues = OrderedDict()
+        self._async_waiters = set()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_start(self, session, waiter):
+        # None once the call is admitted, otherwise the seconds until it may be
+        head_session, queue = next(iter(self._queues.items()))
+        if head_session != session or queue[0] is not waiter or self.in_flight >= int(self.limit):
+            return math.inf
+        if self.rate:
+            self._refill()
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.in_flight += 1
+        queue.popleft()
+        # The session goes to the back of the line for its next call
+        del self._queues[session]
+        if queue:
+            self._queues[session] = queue
+        return None
+
+    def _enqueue(self, session, waiter):
+        self._queues.setdefault(session, deque()).append(waiter)
+        self.waiting += 1
+
+    def _dequeue(self, session, waiter):
+        # Takes back a call that gave up before it was admitted
+        queue = self._queues.get(session)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[session]
+        self.waiting -= 1
+        self._notify()
+
+    def _notify(self):
+        self._condition.notify_all()
+        for waiter in self._async_waiters:
+            waiter.wake()
+
+    def acquire(self, session=None, timeout=BEDROCK_QUEUE_TIMEOUT_SECONDS):
+        waiter = object()
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._condition:
+            self._enqueue(session, waiter)
+            try:
+                while True:
+                    wait = self._try_start(session, waiter)
+                    if wait is None:
+                        return time.monotonic() - started
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise QueueTimeout()
+                    self._condition.wait(min(wait, remaining))
+            finally:
+                self._dequeue(session, waiter)
+
+    async def acquire_async(self, session=None, timeout=BEDROCK_QUEUE_TIMEOUT_SECONDS):
+        # acquire() for a coroutine: the call waits on the event loop instead of in a thread
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._condition:
+            self._enqueue(session, waiter)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._condition:
+                    waiter.event.clear()
+                    wait = self._try_start(session, waiter)
+                    if wait is None:
+                        return time.monotonic() - started
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise QueueTimeout()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), min(wait, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+                self._dequeue(session, waiter)
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self.tokens = min(self.tokens, 0.0)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._notify()
+
+    def stats(self):
+        with self._condition:
+            return {"waiting": self.waiting, "sessions_waiting": len(self._queues),
+                    "in_flight": self.in_flight, "limit": int(self.limit)}
+
+
+class _ReleasingStream:
+    # A streamed response body that gives its call's limiter slot back once it has been
+    # read, closed or dropped
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._events
+        finally:
+            self.close()
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __del__(self):
+        self.close()
+
+
+class ThrottledBedrockClient:
+    # Wraps a bedrock-runtime client: each model's calls go through its ModelLimiter,
+    # and throttled or unavailable calls are retried with backoff and jitter
+
+    def __init__(self, client, quotas=None, max_attempts=BEDROCK_MAX_ATTEMPTS,
+                 queue_timeout=BEDROCK_QUEUE_TIMEOUT_SECONDS):
+        self._client = client
+        self.quotas = BEDROCK_MODEL_QUOTAS if quotas is None else quotas
+        self.max_attempts = max_attempts
+        self.queue_timeout = queue_timeout
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def limiter(self, model_id):
+        with self._lock:
+            limiter = self._limiters.get(model_id)
+            if limiter is None:
+                quota = self.quotas.get(model_id, {})
+                limiter = self._limiters[model_id] = ModelLimiter(
+                    quota.get("requests_per_minute", BEDROCK_DEFAULT_REQUESTS_PER_MINUTE),
+                    quota.get("max_concurrency", BEDROCK_DEFAULT_MAX_CONCURRENCY))
+            return limiter
+
+    def _queue_timeout(self, model_id, method):
+        metrics.inc("nlq_bedrock_queue_timeouts_total", model=model_id)
+        return ClientError({"Error": {
+            "Code": "ThrottlingException",
+            "Message": f"Waited {self.queue_timeout:.0f}s for a {model_id} call to be admitted",
+        }}, method)
+
+    def _attempt(self, limiter, model_id, method, kwargs, stream_key):
+        # One admitted request; its slot is released when it fails or has been read
+        try:
+            response = getattr(self._client, method)(**kwargs)
+        except ClientError as e:
+            throttled = e.response.get("Error", {}).get("Code", "") in THROTTLING_CODES
+            limiter.release(throttled=throttled)
+            if throttled:
+                metrics.inc("nlq_bedrock_throttles_total", model=model_id)
+            raise
+        except Exception:
+            limiter.release()
+            raise
+        if stream_key is None:
+            limiter.release()
+            return response
+        # A streamed call holds its slot until the response has been read
+        return {**response, stream_key: _ReleasingStream(response[stream_key], limiter.release)}
+
+    def _call(self, method, kwargs, stream_key=None):
+        model_id = kwargs.get("modelId", "")
+        limiter = self.limiter(model_id)
+
+        admission = _admission.get()
+        if admission is not None and admission.limiter is limiter and not admission.used:
+            # Admitted on the event loop by admitted(), which also does the retries
+            admission.used = True
+            return self._attempt(limiter, model_id, method, kwargs, stream_key)
+
+        session = _session()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                waited = limiter.acquire(session, self.queue_timeout)
+            except QueueTimeout:
+                raise self._queue_timeout(model_id, method)
+            metrics.observe("nlq_bedrock_queue_wait_seconds", waited, model=model_id)
+
+            try:
+                return self._attempt(limiter, model_id, method, kwargs, stream_key)
+            except Exception as e:
+                code = _retry_code(e)
+                if code is None or attempt == self.max_attempts:
+                    raise
+
+            metrics.inc("nlq_bedrock_retries_total", model=model_id, code=code)
+            time.sleep(backoff_seconds(attempt))
+
+    async def admitted(self, model_id, call):
+        # Awaits `call`, a coroutine function that makes one request to `model_id` through
+        # this client from an executor thread, after waiting for the model's limiter on the
+        # event loop. Queued calls and the backoff between retries then don't hold any of
+        # the executor's threads, which the other sessions' models and tools need.
+        limiter = self.limiter(model_id)
+        session = _session()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                waited = await limiter.acquire_async(session, self.queue_timeout)
+            except QueueTimeout:
+                raise self._queue_timeout(model_id, "invoke_model")
+            metrics.observe("nlq_bedrock_queue_wait_seconds", waited, model=model_id)
+
+            admission = _Admission(limiter)
+            token = _admission.set(admission)
+            try:
+                return await call()
+            except Exception as e:
+                code = _retry_code(e)
+                if not admission.used or code is None or attempt == self.max_attempts:
+                    raise
+            finally:
+                _admission.reset(token)
+                if not admission.used:
+                    limiter.release()
+
+            metrics.inc("nlq_bedrock_retries_total", model=model_id, code=code)
+            await asyncio.sleep(backoff_seconds(attempt))
+
+    def invoke_model(self, **kwargs):
+        return self._call("invoke_model", kwargs)
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        return self._call("invoke_model_with_response_stream", kwargs, stream_key="body")
+
+    def converse(self, **kwargs):
+        return self._call("converse", kwargs)
+
+    def converse_stream(self, **kwargs):
+        return self._call("converse_stream", kwargs, stream_key="stream")
+
+    def gauges(self):
+        with self._lock:
+            limiters = list(self._limiters.items())
+        gauges = []
+        for model_id, limiter in limiters:
+            stats = limiter.stats()
+            labels = {"model": model_id}
+            gauges += [
+                ("nlq_bedrock_queue_depth", "Bedrock calls waiting for their model's limiter",
+                 stats["waiting"], labels),
+                ("nlq_bedrock_queue_sessions", "Sessions with Bedrock calls waiting", stats["sessions_waiting"], labels),
+                ("nlq_bedrock_in_flight", "Bedrock calls in progress", stats["in_flight"], labels),
+                ("nlq_bedrock_concurrency_limit", "Concurrent Bedrock calls allowed, lowered while throttled",
+                 stats["limit"], labels),
+            ]
+        return gauges
+
+
+class AdmittedChatBedrock(ChatBedrock):
+    # ChatBedrock makes its requests from the loop's default executor. With a
+    # ThrottledBedrockClient, the async calls wait for their model's limiter before
+    # being handed to a thread, see ThrottledBedrockClient.admitted.
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._agenerate
+        admitted = getattr(self.client, "admitted", None)
+        if admitted is None:
+            return await generate(messages, stop, run_manager, **kwargs)
+        return await admitted(self.model_id, lambda: generate(messages, stop, run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        admitted = getattr(self.client, "admitted", None)
+        if admitted is None:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+
+        streams = []
+
+        async def first_chunk():
+            # The request is made when the first chunk is read, a retry needs a new stream
+            streams.append(super(AdmittedChatBedrock, self)._astream(messages, stop, run_manager, **kwargs))
+            return await streams[-1].__anext__()
+
+        try:
+            chunk = await admitted(self.model_id, first_chunk)
+        except StopAsyncIteration:
+            return
+        yield chunk
+        async for chunk in streams[-1]:
+            yield chunk
+
+
+def create_bedrock_runtime(region_name=None, **kwargs):
+    client = boto3.client(service_name="bedrock-runtime", region_name=region_name, config=BEDROCK_CLIENT_CONFIG)
+    return ThrottledBedrockClient(client, **kwargs)
@@ -0,0 +1,28 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Threads available for blocking work (boto3, SQLAlchemy, PyAthena polling, sync LangChain calls).
+# Database concurrency is further bounded by the engine pool (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW).
+BLOCKING_MAX_WORKERS = int(os.environ.get("BLOCKING_MAX_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_MAX_WORKERS, thread_name_prefix="blocking")
+_installed_loops = set()
+
+
+def install_default_executor(loop=None):
+    # LangChain runs sync tools and models through the loop's default executor, which is
+    # only min(32, cpus + 4) threads by default (5 on a 1 vCPU Fargate task)
+    loop = loop or asyncio.get_running_loop()
+    if id(loop) not in _installed_loops:
+        loop.set_default_executor(_executor)
+        _installed_loops.add(id(loop))
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    install_default_executor(loop)
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,63 @@
+import os
+import threading
+from sqlalchemy import create_engine
+from utils.schema_cache import CachedSQLDatabase
+
+
+# Connection pool configuration, shared by every session in the process
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", "5"))
+POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "30"))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+_lock = threading.Lock()
+_engines = {}
+_databases = {}
+_database_locks = {}
+
+
+def get_engine(connection_string):
+    with _lock:
+        engine = _engines.get(connection_string)
+        if engine is None:
+            engine = create_engine(
+                connection_string,
+                echo=False,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_timeout=POOL_TIMEOUT,
+                pool_recycle=POOL_RECYCLE,
+                pool_pre_ping=True,
+            )
+            _engines[connection_string] = engine
+        return engine
+
+
+def get_database(connection_string):
+    # Build the SQLDatabase once and share it, so its schema cache is shared too.
+    # Building it lists tables over the network, so it holds only this connection
+    # string's lock; callers for other databases aren't kept waiting.
+    engine = get_engine(connection_string)
+    with _lock:
+        db = _databases.get(connection_string)
+        if db is not None:
+            return db
+        database_lock = _database_locks.setdefault(connection_string, threading.Lock())
+
+    with database_lock:
+        with _lock:
+            db = _databases.get(connection_string)
+        if db is None:
+            db = CachedSQLDatabase(engine)
+            with _lock:
+                db = _databases.setdefault(connection_string, db)
+        return db
+
+
+def dispose_all():
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _databases.clear()
+        _database_locks.clear()
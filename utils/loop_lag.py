@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+LOOP_LAG_WARN_SECONDS = float(os.environ.get("LOOP_LAG_WARN_SECONDS", "0.2"))
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    # Measures how late the event loop wakes a sleeping task, i.e. how long
+    # something blocked the loop and delayed every other session
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL_SECONDS, warn_threshold=LOOP_LAG_WARN_SECONDS, window=600):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.warn_threshold:
+                logger.warning("Event loop lag %.3fs", lag)
+
+    def stats(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {"last": 0.0, "p50": 0.0, "p99": 0.0, "max": self.max_lag}
+        return {
+            "last": self.samples[-1],
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": self.max_lag,
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
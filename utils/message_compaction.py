@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+from langchain_core.messages import (
+    AIMessage, HumanMessage, SystemMessage, ToolMessage, get_buffer_string)
+from utils.message_trimming import count_tokens
+
+
+# Number of most recent human turns that are always kept verbatim
+KEEP_RECENT_TURNS = 2
+# Tool outputs older than the last turn are cut to this many characters
+COMPACT_TOOL_OUTPUT_CHARS = 2000
+SUMMARY_CACHE_SIZE = 1000
+# Tags the summary call, which runs inside the agent node, so its tokens aren't streamed as the answer
+COMPACTION_TAG = "nlq-compaction"
+
+SUMMARY_INSTRUCTIONS = """Summarise the earlier part of a conversation between a user and a data analyst assistant that queries a database.
+Keep the user's questions, the answers given, table and column names that were used, and any figures the user may refer back to.
+Be concise and do not include raw query results."""
+
+# Summaries keyed by the id of the last message they cover, so later compactions
+# only summarise messages added since
+_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def _truncate(content, limit):
+    if isinstance(content, str) and len(content) > limit:
+        return f"{content[:limit]}\n... [truncated {len(content) - limit} characters]"
+    return content
+
+
+def _compact_tool_output(message):
+    # A new id, as token counts are cached by message id
+    return message.copy(update={
+        "content": _truncate(message.content, COMPACT_TOOL_OUTPUT_CHARS),
+        "id": f"{message.id}-compacted" if message.id else None,
+    })
+
+
+def _turn_starts(messages):
+    return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+
+def last_successful_sql(messages):
+    results = {message.tool_call_id: message for message in messages if isinstance(message, ToolMessage)}
+    for message in reversed(messages):
+        if not isinstance(message, AIMessage):
+            continue
+        for tool_call in reversed(message.tool_calls):
+            result = results.get(tool_call["id"])
+            if tool_call["name"] == "sql_db_query" and result is not None \
+                    and not str(result.content).startswith("Error"):
+                return tool_call["args"].get("query")
+    return None
+
+
+def _summarise(model, previous_summary, messages):
+    transcript = get_buffer_string([
+        _compact_tool_output(message) if isinstance(message, ToolMessage) else message
+        for message in messages
+    ])
+    if previous_summary:
+        transcript = f"Summary of the conversation before this point:\n{previous_summary}\n\n{transcript}"
+    response = model.with_config(tags=[COMPACTION_TAG]).invoke([SystemMessage(content=SUMMARY_INSTRUCTIONS), HumanMessage(content=transcript)])
+    return response.content if isinstance(response.content, str) else get_buffer_string([response])
+
+
+def _cached_summary(model, messages):
+    # Reuse the longest cached summary of a prefix of `messages`
+    previous_summary, start = None, 0
+    with _summaries_lock:
+        for i in range(len(messages) - 1, -1, -1):
+            summary = _summaries.get(messages[i].id)
+            if summary is not None:
+                _summaries.move_to_end(messages[i].id)
+                previous_summary, start = summary, i + 1
+                break
+
+    if start == len(messages):
+        return previous_summary
+
+    summary = _summarise(model, previous_summary, messages[start:])
+    if messages[-1].id:
+        with _summaries_lock:
+            _summaries[messages[-1].id] = summary
+            if len(_summaries) > SUMMARY_CACHE_SIZE:
+                _summaries.popitem(last=False)
+    return summary
+
+
+def compact_messages(messages, model, system_message, threshold):
+    # Once the history exceeds `threshold` tokens, older turns are replaced by a summary
+    # appended to the system message (Anthropic only accepts a leading system message)
+    if count_tokens([system_message] + messages, model) <= threshold:
+        return system_message, messages
+
+    turn_starts = _turn_starts(messages)
+    if len(turn_starts) <= KEEP_RECENT_TURNS:
+        return system_message, messages
+
+    cut = turn_starts[-KEEP_RECENT_TURNS]
+    older, recent = messages[:cut], messages[cut:]
+
+    # Bulky tool outputs from earlier (kept) turns are only needed in short form
+    last_turn = turn_starts[-1] - cut
+    recent = [
+        _compact_tool_output(message) if isinstance(message, ToolMessage) and i < last_turn else message
+        for i, message in enumerate(recent)
+    ]
+
+    content = f"{system_message.content}\n\nSummary of the earlier conversation:\n{_cached_summary(model, older)}"
+    sql = last_successful_sql(older)
+    if sql:
+        content += f"\n\nThe last successful SQL query from the earlier conversation was:\n{sql}"
+    return SystemMessage(content=content), recent
@@ -1,17 +1,76 @@
+import hashlib
+import threading
+from collections import OrderedDict
 from langchain_core.messages import trim_messages, SystemMessage
 
 
-def modify_state_messages(state, model, system_message):
+# Per-message token counts, so each agent step only tokenizes messages it hasn't seen before
+TOKEN_COUNT_CACHE_SIZE = 50000
+
+# The Claude 3 and 3.5 models on Bedrock have a 200k token context window, which has to
+# hold the input and the response (the agent's model is called with max_tokens=RESPONSE_MAX_TOKENS)
+CONTEXT_WINDOW_TOKENS = 200000
+RESPONSE_MAX_TOKENS = 4096
+DEFAULT_MAX_TOKENS = CONTEXT_WINDOW_TOKENS - RESPONSE_MAX_TOKENS
+CONTEXT_BUDGET_OPTIONS = ["Model maximum", "100000", "50000", "20000"]
+# Compaction starts once the history uses this fraction of the budget
+COMPACTION_THRESHOLD = 0.75
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def _message_key(message, model):
+    model_id = getattr(model, "model_id", type(model).__name__)
+    if message.id:
+        return (model_id, message.type, message.id)
+    content = f"{message.type}:{message.content}:{getattr(message, 'tool_calls', '')}"
+    return (model_id, hashlib.sha1(content.encode("utf-8")).hexdigest())
+
+
+def count_message_tokens(message, model):
+    key = _message_key(message, model)
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+
+    count = model.get_num_tokens_from_messages([message])
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def count_tokens(messages, model):
+    return sum(count_message_tokens(message, model) for message in messages)
+
+
+def context_budget(selected_budget):
+    if selected_budget and selected_budget.isdigit():
+        return min(DEFAULT_MAX_TOKENS, int(selected_budget))
+    return DEFAULT_MAX_TOKENS
+
+
+def modify_state_messages(state, model, system_message, max_tokens=DEFAULT_MAX_TOKENS, enable_compaction=False,
+                          enable_trimming=True):
     all_messages = state.get("memory", []) + state.get("messages", [])
-    enable_trimming = state.get("enable_trimming", True)
+
+    if enable_compaction:
+        # Imported here as message_compaction reuses the token counting above
+        from utils.message_compaction import compact_messages
+        system_message, all_messages = compact_messages(
+            all_messages, model, system_message, int(max_tokens * COMPACTION_THRESHOLD))
 
     if enable_trimming:
         original_length = len(all_messages)
         trimmed_messages = trim_messages(
             [system_message] + all_messages,
-            max_tokens=195000,
+            max_tokens=max_tokens,
             strategy="last",
-            token_counter=model,
+            token_counter=lambda messages: count_tokens(messages, model),
             include_system=True
         )
         state["trimmed"] = len(trimmed_messages) < original_length + 1
@@ -21,3 +80,17 @@ def modify_state_messages(state, model, system_message):
 
     state["memory"] = trimmed_messages
     return trimmed_messages
+
+
+def configured_state_modifier(model):
+    # State modifier for an agent shared by many sessions: each session passes its system
+    # message and trimming settings in the "configurable" values of the runnable config
+    def state_modifier(state, config):
+        configurable = config.get("configurable", {})
+        return modify_state_messages(
+            state, model, configurable["system_message"],
+            max_tokens=configurable.get("max_tokens", DEFAULT_MAX_TOKENS),
+            enable_compaction=configurable.get("enable_compaction", False),
+            enable_trimming=configurable.get("enable_trimming", True))
+
+    return state_modifier
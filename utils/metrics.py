@@ -0,0 +1,271 @@
+import hmac
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+
+# Prometheus scrape endpoint on the Chainlit server ("" turns it off). It is served on the
+# public listener, so only when a token is set; scrapes send it as "Authorization: Bearer <token>".
+METRICS_PATH = os.environ.get("METRICS_PATH", "/metrics")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+METRICS_HELP = {
+    "nlq_llm_calls_total": ("counter", "LLM calls by model and status"),
+    "nlq_llm_call_duration_seconds": ("histogram", "LLM call duration by model"),
+    "nlq_llm_tokens_total": ("counter", "LLM tokens by model and type (input, output, cache_read, cache_write)"),
+    "nlq_tool_calls_total": ("counter", "Tool calls by tool and status"),
+    "nlq_tool_call_duration_seconds": ("histogram", "Tool call duration by tool"),
+    "nlq_tool_queue_wait_seconds": ("histogram", "Time tool calls waited for a slot in their agent step"),
+    "nlq_athena_queries_total": ("counter", "Athena queries run by the async executor"),
+    "nlq_athena_data_scanned_bytes_total": ("counter", "Bytes scanned by Athena queries"),
+    "nlq_athena_queue_seconds": ("histogram", "Time Athena queries spent queued in Athena"),
+    "nlq_athena_execution_seconds": ("histogram", "Athena engine execution time"),
+    "nlq_turns_total": ("counter", "Questions answered, by how (agent or answer_cache)"),
+    "nlq_turn_duration_seconds": ("histogram", "Time to answer a question"),
+    "nlq_sessions_total": ("counter", "Chat sessions started"),
+    "nlq_agent_setup_seconds": ("histogram", "Time to set up a session's agent, at chat start or on a settings change"),
+    "nlq_bedrock_queue_wait_seconds": ("histogram", "Time Bedrock calls waited for their model's limiter"),
+    "nlq_bedrock_throttles_total": ("counter", "Bedrock calls throttled by Bedrock, by model"),
+    "nlq_bedrock_retries_total": ("counter", "Bedrock calls retried, by model and error code"),
+    "nlq_bedrock_queue_timeouts_total": ("counter", "Bedrock calls that gave up waiting for their model's limiter"),
+}
+# Collector values that only ever go up, exposed as counters rather than gauges
+COLLECTOR_COUNTERS = {
+    "nlq_result_cache_hits_total",
+    "nlq_result_cache_misses_total",
+    "nlq_result_cache_evictions_total",
+    "nlq_result_cache_invalidations_total",
+    "nlq_checkpoint_evicted_threads_total",
+    "nlq_checkpoint_spilled_threads_total",
+    "nlq_checkpoint_restored_threads_total",
+}
+
+# The turn being answered in the current task, for code with no handle on it
+# (the Athena executor and the Bedrock client)
+current_turn = ContextVar("current_turn", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    # Process-wide counters and histograms, rendered in the Prometheus text format.
+    # Collectors add gauges computed at scrape time.
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def add_collector(self, collector):
+        # collector() returns [(name, help, value)] or [(name, help, value, labels)] gauges
+        # (or counters, for the names in COLLECTOR_COUNTERS)
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: list(counts) for key, counts in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            kind, help_text = METRICS_HELP.get(name, ("counter", name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            kind, help_text = METRICS_HELP.get(name, ("histogram", name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, counts in sorted(histograms[name].items()):
+                for bound, count in zip(self.buckets + (math.inf,), counts[:-2] + [counts[-2]]):
+                    le = (("le", _format_value(bound if bound == math.inf else float(bound))),)
+                    lines.append(f"{name}_bucket{_format_labels(key + le)} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+                lines.append(f"{name}_count{_format_labels(key)} {counts[-2]}")
+
+        described = set()
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception:
+                continue
+            for name, help_text, value, *labels in gauges:
+                if name not in described:
+                    described.add(name)
+                    kind = "counter" if name in COLLECTOR_COUNTERS else "gauge"
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                key = tuple(sorted(labels[0].items())) if labels else ()
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def process_memory():
+    # Resident set size of the process (Linux only)
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return []
+    return [("process_resident_memory_bytes", "Resident memory size in bytes",
+             resident_pages * os.sysconf("SC_PAGE_SIZE"))]
+
+
+metrics = MetricsRegistry()
+metrics.add_collector(process_memory)
+
+
+class SessionMetrics:
+    def __init__(self):
+        self.totals = Counter()
+        self.turns = 0
+        metrics.inc("nlq_sessions_total")
+
+    def add_turn(self, turn):
+        self.turns += 1
+        self.totals.update(turn.totals)
+
+
+class TurnMetrics:
+    # Usage and timings of every LLM, tool and Athena call made to answer one question
+
+    def __init__(self, session=None):
+        self.session = session
+        self.started = time.perf_counter()
+        self.duration = None
+        self.totals = Counter()
+        self.calls = []
+
+    def add_llm_call(self, model_id, seconds, input_tokens, output_tokens, error=False):
+        self.calls.append({"type": "llm", "model": model_id, "seconds": seconds,
+                           "input_tokens": input_tokens, "output_tokens": output_tokens, "error": error})
+        self.totals.update({"llm_calls": 1, "llm_seconds": seconds,
+                            "input_tokens": input_tokens, "output_tokens": output_tokens})
+
+    def add_cache_usage(self, cache_read_tokens, cache_write_tokens):
+        self.totals.update({"cache_read_tokens": cache_read_tokens, "cache_write_tokens": cache_write_tokens})
+
+    def add_tool_call(self, name, seconds, error=False):
+        self.calls.append({"type": "tool", "name": name, "seconds": seconds, "error": error})
+        self.totals.update({"tool_calls": 1, "tool_seconds": seconds, "tool_errors": int(error)})
+
+    def add_athena_query(self, bytes_scanned, queue_seconds, execution_seconds):
+        self.calls.append({"type": "athena", "bytes_scanned": bytes_scanned,
+                           "queue_seconds": queue_seconds, "execution_seconds": execution_seconds})
+        self.totals.update({"athena_queries": 1, "athena_bytes_scanned": bytes_scanned,
+                            "athena_queue_seconds": queue_seconds, "athena_execution_seconds": execution_seconds})
+
+    def finish(self, outcome="agent"):
+        self.duration = time.perf_counter() - self.started
+        metrics.inc("nlq_turns_total", outcome=outcome)
+        metrics.observe("nlq_turn_duration_seconds", self.duration, outcome=outcome)
+        if self.session is not None:
+            self.session.add_turn(self)
+
+    def summary(self):
+        totals = self.totals
+        return (f"{self.duration or 0:.1f}s, {totals['llm_calls']} LLM calls ({totals['llm_seconds']:.1f}s), "
+                f"{totals['tool_calls']} tool calls ({totals['tool_seconds']:.1f}s), "
+                f"{totals['athena_bytes_scanned'] / 1e6:.1f} MB scanned by Athena")
+
+
+def record_llm_call(model_id, seconds, input_tokens=0, output_tokens=0, error=False, turn=None):
+    metrics.inc("nlq_llm_calls_total", model=model_id, status="error" if error else "ok")
+    metrics.observe("nlq_llm_call_duration_seconds", seconds, model=model_id)
+    metrics.inc("nlq_llm_tokens_total", input_tokens, model=model_id, type="input")
+    metrics.inc("nlq_llm_tokens_total", output_tokens, model=model_id, type="output")
+    turn = turn or current_turn.get()
+    if turn is not None:
+        turn.add_llm_call(model_id, seconds, input_tokens, output_tokens, error)
+
+
+def record_cache_usage(model_id, cache_read_tokens, cache_write_tokens):
+    metrics.inc("nlq_llm_tokens_total", cache_read_tokens, model=model_id, type="cache_read")
+    metrics.inc("nlq_llm_tokens_total", cache_write_tokens, model=model_id, type="cache_write")
+    turn = current_turn.get()
+    if turn is not None:
+        turn.add_cache_usage(cache_read_tokens, cache_write_tokens)
+
+
+def record_tool_call(name, seconds, error=False, turn=None):
+    metrics.inc("nlq_tool_calls_total", tool=name, status="error" if error else "ok")
+    metrics.observe("nlq_tool_call_duration_seconds", seconds, tool=name)
+    turn = turn or current_turn.get()
+    if turn is not None:
+        turn.add_tool_call(name, seconds, error)
+
+
+def record_athena_query(execution):
+    statistics = execution.get("Statistics", {})
+    bytes_scanned = statistics.get("DataScannedInBytes", 0)
+    queue_seconds = statistics.get("QueryQueueTimeInMillis", 0) / 1000
+    execution_seconds = statistics.get("EngineExecutionTimeInMillis", 0) / 1000
+    metrics.inc("nlq_athena_queries_total")
+    metrics.inc("nlq_athena_data_scanned_bytes_total", bytes_scanned)
+    metrics.observe("nlq_athena_queue_seconds", queue_seconds)
+    metrics.observe("nlq_athena_execution_seconds", execution_seconds)
+    turn = current_turn.get()
+    if turn is not None:
+        turn.add_athena_query(bytes_scanned, queue_seconds, execution_seconds)
+
+
+def mount_metrics_endpoint(app, path=METRICS_PATH, token=METRICS_TOKEN):
+    # Registered ahead of Chainlit's catch-all route, which would otherwise serve the UI
+    if not path:
+        return
+    if not token:
+        logger.warning("METRICS_TOKEN is not set, so %s is not served", path)
+        return
+    from starlette.responses import PlainTextResponse, Response
+    from starlette.routing import Route
+
+    async def metrics_endpoint(request):
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied, token):
+            return Response(status_code=401)
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    app.router.routes.insert(0, Route(path, metrics_endpoint, methods=["GET"]))
@@ -0,0 +1,44 @@
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from utils.metrics import record_llm_call, record_tool_call
+
+
+# Kept apart from utils.metrics, so the metrics registry and endpoint load without langchain
+class MetricsCallbackHandler(BaseCallbackHandler):
+    # Times every chat model and tool run in the agent and records its usage
+    run_inline = True
+
+    def __init__(self, turn=None):
+        self.turn = turn
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model_id = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "unknown")
+        self._runs[run_id] = (model_id, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model_id, started = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        record_llm_call(model_id, time.perf_counter() - started, usage.get("input_tokens", 0),
+                        usage.get("output_tokens", 0), turn=self.turn)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        model_id, started = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        record_llm_call(model_id, time.perf_counter() - started, error=True, turn=self.turn)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._runs[run_id] = ((serialized or {}).get("name", "unknown"), time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        name, started = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        content = getattr(output, "content", output)
+        error = isinstance(content, str) and content.startswith("Error")
+        record_tool_call(name, time.perf_counter() - started, error=error, turn=self.turn)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        name, started = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        record_tool_call(name, time.perf_counter() - started, error=True, turn=self.turn)
@@ -0,0 +1,98 @@
+import io
+import json
+import os
+from botocore.response import StreamingBody
+from utils.metrics import record_cache_usage
+
+
+# Bedrock prompt caching, on for the Claude models Bedrock lists as supporting it
+PROMPT_CACHING_ENABLED = os.environ.get("BEDROCK_PROMPT_CACHING", "true").lower() == "true"
+PROMPT_CACHING_MODELS = {
+    "anthropic.claude-3-5-haiku-20241022-v1:0",
+    "anthropic.claude-3-7-sonnet-20250219-v1:0",
+}
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_prompt_caching(model_id):
+    # Cross-region inference profiles ("us.anthropic...") cache like the base model
+    region_prefix, _, base_model_id = model_id.partition(".")
+    if region_prefix not in ("us", "eu", "apac"):
+        base_model_id = model_id
+    return base_model_id in PROMPT_CACHING_MODELS
+
+
+def _with_cache_control(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}] if content else content
+    if content:
+        content = list(content)
+        content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+    return content
+
+
+def add_cache_checkpoints(body):
+    # Bedrock caches the request prefix up to each checkpoint, in the order tools,
+    # system, messages. Checkpoints after the tools and the system prompt (which holds
+    # the schema digest) cover what every step and turn resends; one on the last message
+    # lets the next ReAct step of the same turn reuse the conversation so far.
+    body = dict(body)
+    if body.get("tools"):
+        body["tools"] = body["tools"][:-1] + [{**body["tools"][-1], "cache_control": CACHE_CONTROL}]
+    if body.get("system"):
+        body["system"] = _with_cache_control(body["system"])
+    if body.get("messages"):
+        last = body["messages"][-1]
+        body["messages"] = body["messages"][:-1] + [{**last, "content": _with_cache_control(last["content"])}]
+    return body
+
+
+class PromptCachingClient:
+    # Wraps a bedrock-runtime client: adds cache checkpoints to Anthropic requests and
+    # records the cache read/write tokens in the responses, which ChatBedrock drops
+
+    def __init__(self, client, enabled=PROMPT_CACHING_ENABLED):
+        self._client = client
+        self.enabled = enabled
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _prepare(self, kwargs):
+        if not self.enabled or not supports_prompt_caching(kwargs.get("modelId", "")):
+            return kwargs, False
+        body = json.loads(kwargs["body"])
+        if "messages" not in body:
+            return kwargs, False
+        return {**kwargs, "body": json.dumps(add_cache_checkpoints(body))}, True
+
+    def invoke_model(self, **kwargs):
+        kwargs, cached = self._prepare(kwargs)
+        response = self._client.invoke_model(**kwargs)
+        if not cached:
+            return response
+
+        raw = response["body"].read()
+        usage = json.loads(raw).get("usage", {})
+        record_cache_usage(kwargs["modelId"], usage.get("cache_read_input_tokens", 0),
+                           usage.get("cache_creation_input_tokens", 0))
+        return {**response, "body": StreamingBody(io.BytesIO(raw), len(raw))}
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        kwargs, cached = self._prepare(kwargs)
+        response = self._client.invoke_model_with_response_stream(**kwargs)
+        if not cached:
+            return response
+        return {**response, "body": self._observe_stream(kwargs["modelId"], response["body"])}
+
+    def _observe_stream(self, model_id, events):
+        # The cache usage comes with the message_start event
+        for event in events:
+            chunk = event.get("chunk")
+            if chunk:
+                chunk_obj = json.loads(chunk["bytes"])
+                if chunk_obj.get("type") == "message_start":
+                    usage = chunk_obj.get("message", {}).get("usage", {})
+                    record_cache_usage(model_id, usage.get("cache_read_input_tokens", 0),
+                                       usage.get("cache_creation_input_tokens", 0))
+            yield event
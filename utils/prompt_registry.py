@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+import time
+
+
+PROMPT_REFRESH_SECONDS = int(os.environ.get("PROMPT_REFRESH_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+
+def get_prompt_text(response):
+    default_variant = response['defaultVariant']
+    for variant in response['variants']:
+        if variant['name'] == default_variant:
+            return variant['templateConfiguration']['text']['text']
+    return None
+
+
+class PromptRegistry:
+    # Keeps the Bedrock prompt templates in memory, refreshed in the background.
+    # The last good copy keeps being served while Bedrock is unavailable.
+
+    def __init__(self, client, prompt_ids, refresh_seconds=PROMPT_REFRESH_SECONDS):
+        self.client = client
+        self.prompt_ids = list(prompt_ids)
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._refresh_thread = None
+
+    def _fetch(self, prompt_id):
+        response = self.client.get_prompt(promptIdentifier=prompt_id)
+        return {
+            "name": response['name'],
+            "text": get_prompt_text(response),
+            "version": (response.get('version'), str(response.get('updatedAt'))),
+            "fetched_at": time.time(),
+        }
+
+    def load(self, prompt_ids=None):
+        for prompt_id in prompt_ids or self.prompt_ids:
+            try:
+                prompt = self._fetch(prompt_id)
+            except Exception:
+                logger.exception("Failed to fetch prompt %s, keeping last good copy", prompt_id)
+                continue
+            with self._lock:
+                previous = self._prompts.get(prompt_id)
+                if previous is None or previous["version"] != prompt["version"]:
+                    logger.info("Loaded prompt %s (%s) version %s", prompt_id, prompt["name"], prompt["version"])
+                self._prompts[prompt_id] = prompt
+
+    def get(self, prompt_id):
+        with self._lock:
+            prompt = self._prompts.get(prompt_id)
+        if prompt is None:
+            # Not loaded yet (e.g. Bedrock was down at start up), try once more
+            self.load([prompt_id])
+            with self._lock:
+                prompt = self._prompts.get(prompt_id)
+            if prompt is None:
+                raise RuntimeError(f"Prompt {prompt_id} is not available")
+        return prompt["name"], prompt["text"]
+
+    def start_background_refresh(self):
+        if self._refresh_thread is not None:
+            return
+
+        def refresh_loop():
+            while True:
+                time.sleep(self.refresh_seconds)
+                self.load()
+
+        self._refresh_thread = threading.Thread(
+            target=refresh_loop, name="prompt-registry-refresh", daemon=True)
+        self._refresh_thread.start()
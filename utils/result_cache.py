@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import sqlglot
+from sqlglot import exp
+
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+
+# String literals, quoted identifiers, or anything else up to the next quote
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|[^'\"]+")
+_IN_LIST = re.compile(r"\bin\s*\(([^()]*)\)")
+_LITERAL = re.compile(r"^\s*('(?:[^']|'')*'|-?\d+(?:\.\d+)?)\s*$")
+
+
+def normalize_sql(sql):
+    # Case-fold and collapse whitespace outside of quotes, and sort literal IN lists,
+    # so trivially different spellings of a query share a cache entry
+    parts = []
+    for token in _SQL_TOKEN.findall(sql.strip().rstrip(";").strip()):
+        if token[0] in "'\"":
+            parts.append(token)
+        else:
+            parts.append(re.sub(r"\s+", " ", token.lower()))
+    normalized = re.sub(r"\s*([(),=<>])\s*", r"\1", "".join(parts))
+
+    def sort_in_list(match):
+        items = match.group(1).split(",")
+        if all(_LITERAL.match(item) for item in items):
+            items = sorted(item.strip() for item in items)
+        return f"in({','.join(items)})"
+
+    return _IN_LIST.sub(sort_in_list, normalized)
+
+
+def referenced_tables(sql, dialect=None):
+    # The tables a query reads, or None when they can't be told (the query doesn't parse,
+    # or is a statement sqlglot only keeps as text, like SHOW), so its result isn't cached
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read=dialect) if e is not None]
+    except sqlglot.errors.ParseError:
+        return None
+    if not expressions or any(isinstance(e, exp.Command) for e in expressions):
+        return None
+    tables = set()
+    for expression in expressions:
+        cte_names = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+        tables |= {table.name.lower() for table in expression.find_all(exp.Table)
+                   if table.name and table.name.lower() not in cte_names}
+    return sorted(tables)
+
+
+def is_cacheable(sql):
+    return normalize_sql(sql).startswith(("select", "with", "show", "describe"))
+
+
+class ResultCache:
+    # Size-bounded LRU of query results. Each entry carries the freshness token of
+    # the data it was computed from and is ignored once that token changes.
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        _, _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def get(self, key, freshness):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, entry_freshness, value = entry
+            if entry_freshness != freshness or time.time() >= expires_at:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, freshness, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, freshness, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def gauges(self):
+        stats = self.stats()
+        return [
+            ("nlq_result_cache_entries", "Query results in the result cache", stats["entries"]),
+            ("nlq_result_cache_bytes", "Size of the cached query results", stats["bytes"]),
+            ("nlq_result_cache_hit_rate", "Query result cache hit rate", stats["hit_rate"]),
+            ("nlq_result_cache_hits_total", "Query result cache hits", stats["hits"]),
+            ("nlq_result_cache_misses_total", "Query result cache misses", stats["misses"]),
+            ("nlq_result_cache_evictions_total", "Query results evicted to stay within the size limit",
+             stats["evictions"]),
+            ("nlq_result_cache_invalidations_total", "Query results dropped as the data changed or expired",
+             stats["invalidations"]),
+        ]
+
+
+result_cache = ResultCache()
@@ -0,0 +1,53 @@
+import os
+from sqlalchemy import text
+from langchain_community.utilities.sql_database import truncate_word
+
+
+# Caps applied while fetching, before the whole result set is turned into a tool message
+SQL_MAX_RESULT_ROWS = int(os.environ.get("SQL_MAX_RESULT_ROWS", "1000"))
+SQL_MAX_RESULT_CHARS = int(os.environ.get("SQL_MAX_RESULT_CHARS", "100000"))
+SQL_FETCH_CHUNK_ROWS = int(os.environ.get("SQL_FETCH_CHUNK_ROWS", "500"))
+
+
+def format_rows(chunks, include_columns=False, max_string_length=300,
+                max_rows=SQL_MAX_RESULT_ROWS, max_chars=SQL_MAX_RESULT_CHARS):
+    # Formats rows (mappings of column to value, in chunks) like SQLDatabase.run, and
+    # stops consuming chunks at the row/character caps
+    rows, chars, truncated = [], 2, False
+    for chunk in chunks:
+        for row in chunk:
+            values = {column: truncate_word(value, length=max_string_length) for column, value in row.items()}
+            row_text = repr(values if include_columns else tuple(values.values()))
+            if len(rows) >= max_rows or chars + len(row_text) + 2 > max_chars:
+                truncated = True
+                break
+            rows.append(row_text)
+            chars += len(row_text) + 2
+        if truncated:
+            break
+
+    if not rows:
+        return ""
+    output = f"[{', '.join(rows)}]"
+    if truncated:
+        output += (f"\n(Result truncated to the first {len(rows)} rows. "
+                   "Use LIMIT, filters or aggregation to return fewer rows.)")
+    return output
+
+
+def fetch_capped(engine, command, include_columns=False, max_string_length=300, execution_options=None,
+                 max_rows=SQL_MAX_RESULT_ROWS, max_chars=SQL_MAX_RESULT_CHARS, chunk_rows=SQL_FETCH_CHUNK_ROWS):
+    # Returns the same string as SQLDatabase.run, but rows are pulled from the cursor in
+    # chunks and fetching stops at the row/character caps. With the awsathena+arrow
+    # dialect the result is downloaded as one Arrow table and rows are only converted
+    # to Python objects as they are consumed here.
+    with engine.connect() as connection:
+        result = connection.execute(
+            text(command), execution_options={"stream_results": True, **(execution_options or {})})
+        if not result.returns_rows:
+            connection.commit()
+            return ""
+        chunks = iter(lambda: [row._mapping for row in result.fetchmany(chunk_rows)], [])
+        output = format_rows(chunks, include_columns, max_string_length, max_rows, max_chars)
+        result.close()
+    return output
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import boto3
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import inspect
+from utils.athena_executor import AthenaQueryExecutor
+from utils.blocking import run_blocking
+from utils.result_cache import is_cacheable, normalize_sql, referenced_tables, result_cache
+from utils.result_fetch import fetch_capped
+from utils.schema_digest import build_schema_digest
+from utils.schema_index import (
+    SCHEMA_PRUNING_TOP_K, SchemaIndex, glue_table_documents, inspector_table_documents)
+from utils.sql_validator import SQLGLOT_DIALECTS
+
+
+# Cache entries expire just after each scheduled Glue crawler run (hourly, cron(0 * * * ? *)
+# in AnalyticsStack), with a grace period for the crawler to finish updating the catalog.
+SCHEMA_CACHE_DIR = os.environ.get("SCHEMA_CACHE_DIR", "/tmp/nlq-schema-cache")
+SCHEMA_CACHE_TTL_SECONDS = int(os.environ.get("SCHEMA_CACHE_TTL_SECONDS", "3600"))
+SCHEMA_CACHE_GRACE_SECONDS = int(os.environ.get("SCHEMA_CACHE_GRACE_SECONDS", "600"))
+# How often the table metadata versions are compared against the catalog
+SCHEMA_VERSION_CHECK_SECONDS = int(os.environ.get("SCHEMA_VERSION_CHECK_SECONDS", "300"))
+# When set, the crawler's last run is tracked too, as it adds partitions without changing table versions
+GLUE_CRAWLER_NAME = os.environ.get("GLUE_CRAWLER_NAME")
+CRAWLER_VERSION_KEY = "__crawler__"
+
+
+def glue_table_versions(engine):
+    # Only Athena connections have a Glue catalog to compare against
+    url = engine.url
+    if not url.drivername.startswith("awsathena"):
+        return None
+
+    region = url.host.split(".")[1]
+    glue = boto3.client("glue", region_name=region)
+    versions = {}
+    for page in glue.get_paginator("get_tables").paginate(DatabaseName=url.database):
+        for table in page["TableList"]:
+            versions[table["Name"]] = str(table.get("VersionId") or table.get("UpdateTime"))
+    if GLUE_CRAWLER_NAME:
+        crawler = glue.get_crawler(Name=GLUE_CRAWLER_NAME)["Crawler"]
+        versions[CRAWLER_VERSION_KEY] = str(crawler.get("LastCrawl", {}).get("StartTime"))
+    return versions
+
+
+class SchemaCache:
+    def __init__(self, key, version_probe=None, cache_dir=SCHEMA_CACHE_DIR,
+                 ttl=SCHEMA_CACHE_TTL_SECONDS, grace=SCHEMA_CACHE_GRACE_SECONDS,
+                 version_check_interval=SCHEMA_VERSION_CHECK_SECONDS):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, f"{digest}.json") if cache_dir else None
+        self.version_probe = version_probe
+        self.ttl = ttl
+        self.grace = grace
+        self.version_check_interval = version_check_interval
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._generation = 0
+        self._next_version_check = 0
+        self._state = self._empty_state()
+        self._load()
+
+    def _empty_state(self):
+        now = time.time()
+        return {
+            "expires_at": (now // self.ttl + 1) * self.ttl + self.grace,
+            "table_names": None,
+            "tables": {},
+            "versions": {},
+            "digest": None,
+        }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("expires_at", 0) > time.time():
+            self._state = state
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # The on-disk copy is only an optimisation for restarts
+            pass
+
+    def _refresh(self):
+        # The version probe is a catalog round trip, so it runs outside the lock
+        with self._lock:
+            now = time.time()
+            if now >= self._state["expires_at"]:
+                self._state = self._empty_state()
+                self._generation += 1
+                self._save()
+
+            if self.version_probe is None or now < self._next_version_check:
+                return
+            self._next_version_check = now + self.version_check_interval
+            version_probe = self.version_probe
+        try:
+            versions = version_probe()
+        except Exception:
+            # Fall back to the schedule if the catalog can't be reached
+            return
+
+        with self._lock:
+            if versions is None:
+                self.version_probe = None
+                return
+            known = self._state["versions"]
+            changed = {name for name in set(known) | set(versions) if known.get(name) != versions.get(name)}
+            if changed and known:
+                for name in changed:
+                    self._state["tables"].pop(name, None)
+                self._state["digest"] = None
+                if set(known) != set(versions):
+                    self._state["table_names"] = None
+                self._generation += 1
+            if changed:
+                self._state["versions"] = versions
+                self._save()
+
+    def _get(self, key, read, write, loader):
+        # Loaders are catalog or database round trips, so they run outside the lock,
+        # one at a time per key; a load that overlaps an invalidation isn't kept
+        self._refresh()
+        with self._lock:
+            value = read()
+            if value is not None:
+                return value
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                value = read()
+                if value is not None:
+                    return value
+                generation = self._generation
+            value = loader()
+            with self._lock:
+                if self._generation == generation:
+                    write(value)
+                    self._save()
+            return value
+
+    def get_table_names(self, loader):
+        def write(table_names):
+            self._state["table_names"] = table_names
+
+        return list(self._get(("table_names",), lambda: self._state["table_names"], write,
+                              lambda: list(loader())))
+
+    def get_table_info(self, table_name, loader):
+        def write(info):
+            self._state["tables"][table_name] = info
+
+        return self._get(("table", table_name), lambda: self._state["tables"].get(table_name), write, loader)
+
+    def get_digest(self, loader):
+        def write(digest):
+            self._state["digest"] = digest
+
+        return self._get(("digest",), lambda: self._state.get("digest"), write, loader)
+
+    def freshness(self, table_names):
+        # Identifies the data a query result was computed from
+        self._refresh()
+        with self._lock:
+            versions = self._state["versions"]
+            return (
+                self._state["expires_at"],
+                versions.get(CRAWLER_VERSION_KEY),
+                tuple((name, versions.get(name)) for name in table_names),
+            )
+
+    def invalidate(self, table_names=None):
+        with self._lock:
+            self._generation += 1
+            if table_names is None:
+                self._state = self._empty_state()
+            else:
+                for name in table_names:
+                    self._state["tables"].pop(name, None)
+                self._state["digest"] = None
+            self._save()
+
+
+class CachedSQLDatabase(SQLDatabase):
+    # Serves sql_db_list_tables / sql_db_schema from the shared SchemaCache and
+    # sql_db_query results from the shared ResultCache
+
+    def __init__(self, engine, schema_cache=None, athena_executor=None, **kwargs):
+        # Set before SQLDatabase.__init__, which already lists the usable tables
+        self.schema_cache = schema_cache or SchemaCache(
+            str(engine.url), version_probe=lambda: glue_table_versions(engine))
+        kwargs.setdefault("lazy_table_reflection", True)
+        self._listed = False
+        self._reflection_lock = threading.Lock()
+        super().__init__(engine, **kwargs)
+        self._listed = True
+        self.athena_executor = athena_executor or AthenaQueryExecutor.from_engine(
+            engine, max_string_length=self._max_string_length)
+        self._schema_index = None
+        self._schema_index_version = None
+        self._schema_index_lock = threading.Lock()
+
+    def _load_table_names(self):
+        # SQLDatabase lists the tables once, in __init__, and its inspector keeps the
+        # results, so later loads (after the catalog changed) list them again
+        if self._listed:
+            inspector = inspect(self._engine)
+            table_names = inspector.get_table_names(schema=self._schema)
+            if self._view_support:
+                table_names += inspector.get_view_names(schema=self._schema)
+            self._inspector = inspector
+            self._all_tables = set(table_names)
+        return super().get_usable_table_names()
+
+    def _load_table_info(self, table_name):
+        # Reflect the table again: the MetaData keeps the columns of the first reflection
+        with self._reflection_lock:
+            for table in [table for table in self._metadata.sorted_tables if table.name == table_name]:
+                self._metadata.remove(table)
+            return super().get_table_info([table_name])
+
+    def get_usable_table_names(self):
+        return self.schema_cache.get_table_names(self._load_table_names)
+
+    def get_table_info(self, table_names=None):
+        all_table_names = self.get_usable_table_names()
+        if table_names is not None:
+            missing_tables = set(table_names).difference(all_table_names)
+            if missing_tables:
+                raise ValueError(f"table_names {missing_tables} not found in database")
+            all_table_names = table_names
+
+        return "\n\n".join(
+            self.schema_cache.get_table_info(name, lambda name=name: self._load_table_info(name))
+            for name in all_table_names
+        )
+
+    def data_freshness(self):
+        return self.schema_cache.freshness(self.get_usable_table_names())
+
+    def _table_documents(self, table_names):
+        try:
+            documents = glue_table_documents(self._engine)
+        except Exception:
+            documents = None
+        if documents is None:
+            return inspector_table_documents(self._engine, table_names)
+        usable = set(table_names)
+        return [document for document in documents if document["name"] in usable]
+
+    def schema_digest(self):
+        # Compact description of the whole catalog, built once per catalog version
+        # ("" when the catalog is too large for one). Its sample values come from the
+        # cached table info, which sql_db_schema serves too.
+        def build():
+            return build_schema_digest(self._table_documents(self.get_usable_table_names()),
+                                       table_info=lambda name: self.get_table_info([name]))
+
+        return self.schema_cache.get_digest(build)
+
+    def _current_schema_index(self):
+        # The index is rebuilt only when the catalog changes
+        version = self.data_freshness()
+        with self._schema_index_lock:
+            if self._schema_index is None or self._schema_index_version != version:
+                table_names = self.get_usable_table_names()
+                self._schema_index = SchemaIndex(self._table_documents(table_names))
+                self._schema_index_version = version
+            return self._schema_index
+
+    def relevant_tables(self, question, k=SCHEMA_PRUNING_TOP_K):
+        if k <= 0:
+            return []
+        return [name for name, _ in self._current_schema_index().search(question, k)]
+
+    def table_columns(self):
+        return {
+            document["name"].lower(): [column[0].lower() for column in document["columns"]]
+            for document in self._current_schema_index().documents
+        }
+
+    def _run_capped(self, command, include_columns, execution_options):
+        return fetch_capped(self._engine, command, include_columns, self._max_string_length, execution_options)
+
+    def _cached_tables(self, command):
+        # The tables a cacheable query reads, None when its result isn't cached
+        if not is_cacheable(command):
+            return None
+        return referenced_tables(command, SQLGLOT_DIALECTS.get(self.dialect, self.dialect))
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        if not isinstance(command, str) or fetch != "all" or parameters:
+            return super().run(command, fetch, include_columns,
+                               parameters=parameters, execution_options=execution_options)
+        tables = self._cached_tables(command)
+        if tables is None:
+            return self._run_capped(command, include_columns, execution_options)
+
+        key = (str(self._engine.url), include_columns, normalize_sql(command))
+        freshness = self.schema_cache.freshness(tables)
+        result = result_cache.get(key, freshness)
+        if result is None:
+            result = self._run_capped(command, include_columns, execution_options)
+            result_cache.put(key, freshness, result)
+        return result
+
+    async def arun_no_throw(self, command, include_columns=False):
+        # Athena queries are awaited without tying up a thread; other databases
+        # fall back to the blocking path on the executor. Both format results the same
+        # way, so they share result_cache entries.
+        tables = self._cached_tables(command) if self.athena_executor is not None else None
+        if tables is None:
+            return await run_blocking(self.run_no_throw, command, include_columns=include_columns)
+
+        key = (str(self._engine.url), include_columns, normalize_sql(command))
+        freshness = await run_blocking(self.schema_cache.freshness, tables)
+        result = result_cache.get(key, freshness)
+        if result is None:
+            try:
+                result = await self.athena_executor.execute(command, include_columns)
+            except Exception as e:
+                return f"Error: {e}"
+            result_cache.put(key, freshness, result)
+        return result
@@ -0,0 +1,89 @@
+import os
+import re
+
+
+# Catalogs with more tables than this get no digest; relevant tables are found per question instead
+SCHEMA_DIGEST_MAX_TABLES = int(os.environ.get("SCHEMA_DIGEST_MAX_TABLES", "30"))
+SCHEMA_DIGEST_MAX_CHARS = int(os.environ.get("SCHEMA_DIGEST_MAX_CHARS", "12000"))
+COLUMN_COMMENT_MAX_LENGTH = 60
+SAMPLE_VALUES_PER_COLUMN = 3
+SAMPLE_VALUE_MAX_LENGTH = 32
+TEXT_TYPES = ("string", "varchar", "char", "text")
+
+SCHEMA_DIGEST_HEADER = (
+    "The database schema is below, one table per line: each column with its type, its description "
+    "in brackets where the catalog has one, and for text columns a few sample values. Partition "
+    "columns are listed after \"partitioned by\". Write queries from this schema directly instead "
+    "of listing the tables or describing their schema."
+)
+
+# The sample rows SQLDatabase adds to a table's info: "/*\nN rows from t table:\n<columns>\n<rows>\n*/"
+_SAMPLE_ROWS = re.compile(r"^\d+ rows from .* table:\n(.*?)\n?\*/", re.MULTILINE | re.DOTALL)
+
+
+def sample_values(table_info):
+    # A few distinct values of each column, read from the sample rows of the table's
+    # info, so the digest runs no queries of its own
+    match = _SAMPLE_ROWS.search(table_info)
+    if match is None:
+        return {}
+    lines = match.group(1).split("\n")
+    columns = lines[0].split("\t")
+    values = {column: [] for column in columns}
+    for line in lines[1:]:
+        cells = line.split("\t")
+        # A value with a tab or line break in it doesn't split back into the row
+        if len(cells) != len(columns):
+            continue
+        for column, value in zip(columns, cells):
+            value = value[:SAMPLE_VALUE_MAX_LENGTH]
+            if value and value != "None" and value not in values[column]:
+                values[column].append(value)
+    return {column: found[:SAMPLE_VALUES_PER_COLUMN] for column, found in values.items() if found}
+
+
+def digest_line(document, values=None):
+    values = values or {}
+
+    def column_text(name, column_type, comment):
+        text = f"{name} {column_type.lower()}"
+        if comment:
+            text += f" ({comment[:COLUMN_COMMENT_MAX_LENGTH]})"
+        samples = values.get(name)
+        if samples and column_type.lower().startswith(TEXT_TYPES):
+            text += " e.g. " + ", ".join(repr(value) for value in samples)
+        return text
+
+    partition_keys = set(document.get("partition_keys", []))
+    columns = [column_text(*column) for column in document["columns"] if column[0] not in partition_keys]
+    line = f"{document['name']}: " + "; ".join(columns)
+    partitions = [column_text(*column) for column in document["columns"] if column[0] in partition_keys]
+    if partitions:
+        line += " | partitioned by " + "; ".join(partitions)
+    return line
+
+
+def build_schema_digest(documents, table_info=None, max_tables=SCHEMA_DIGEST_MAX_TABLES,
+                        max_chars=SCHEMA_DIGEST_MAX_CHARS):
+    # Returns "" when the catalog is too large to describe up front. table_info(name)
+    # gives a table's info with its sample rows; without it, or when the samples make
+    # the digest too long, the columns are described without sample values.
+    if not documents or len(documents) > max_tables:
+        return ""
+    documents = sorted(documents, key=lambda document: document["name"])
+
+    if table_info is not None:
+        lines = []
+        for document in documents:
+            try:
+                values = sample_values(table_info(document["name"]))
+            except Exception:
+                # Still describe the columns if the table's info can't be loaded
+                values = {}
+            lines.append(digest_line(document, values))
+        digest = SCHEMA_DIGEST_HEADER + "\n\n" + "\n".join(lines)
+        if len(digest) <= max_chars:
+            return digest
+
+    digest = SCHEMA_DIGEST_HEADER + "\n\n" + "\n".join(digest_line(document) for document in documents)
+    return digest if len(digest) <= max_chars else ""
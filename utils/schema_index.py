@@ -0,0 +1,133 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+import boto3
+from sqlalchemy import inspect
+
+
+# Number of tables whose schema is put in front of the agent for each question (0 turns it off)
+SCHEMA_PRUNING_TOP_K = int(os.environ.get("SCHEMA_PRUNING_TOP_K", "5"))
+# Words at least this long also match inside longer words, so "timestamp" finds
+# "sensortimestamp" and "temperature" finds "temp"
+SUBSTRING_MATCH_MIN_LENGTH = 4
+SUBSTRING_MATCH_WEIGHT = 0.5
+# Matches on the table name count for more than matches on its columns
+TABLE_NAME_WEIGHT = 3
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOP_WORDS = {
+    "a", "all", "an", "and", "any", "are", "as", "at", "be", "by", "can", "did", "do", "does",
+    "each", "for", "from", "had", "has", "have", "how", "i", "in", "is", "it", "its", "last", "me",
+    "many", "most", "much", "my", "of", "on", "or", "over", "per", "show", "that", "the", "their",
+    "them", "there", "these", "this", "those", "to", "was", "were", "what", "when", "where", "which",
+    "who", "why", "with", "you",
+}
+
+
+def split_words(text):
+    # "sensorTimestamp", "sensor_timestamp" and "sensor timestamp" all give the same words
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    words = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def glue_table_documents(engine):
+    # Table and column names, types and comments as crawled into the Glue catalog
+    url = engine.url
+    if not url.drivername.startswith("awsathena"):
+        return None
+
+    region = url.host.split(".")[1]
+    glue = boto3.client("glue", region_name=region)
+    documents = []
+    for page in glue.get_paginator("get_tables").paginate(DatabaseName=url.database):
+        for table in page["TableList"]:
+            partition_keys = table.get("PartitionKeys", [])
+            columns = table.get("StorageDescriptor", {}).get("Columns", []) + partition_keys
+            documents.append({
+                "name": table["Name"],
+                "comment": table.get("Description") or table.get("Parameters", {}).get("comment", ""),
+                "columns": [(c["Name"], c.get("Type", ""), c.get("Comment", "")) for c in columns],
+                "partition_keys": [c["Name"] for c in partition_keys],
+            })
+    return documents
+
+
+def inspector_table_documents(engine, table_names):
+    inspector = inspect(engine)
+    documents = []
+    for name in table_names:
+        try:
+            comment = inspector.get_table_comment(name).get("text") or ""
+        except NotImplementedError:
+            comment = ""
+        documents.append({
+            "name": name,
+            "comment": comment,
+            "columns": [(c["name"], str(c["type"]), c.get("comment") or "")
+                        for c in inspector.get_columns(name)],
+            "partition_keys": [],
+        })
+    return documents
+
+
+class SchemaIndex:
+    # BM25 over each table's name, comment and column names/comments
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.table_names = [document["name"] for document in documents]
+        self._term_counts = []
+        self._postings = defaultdict(list)
+        for i, document in enumerate(documents):
+            terms = Counter()
+            for word in split_words(document["name"]):
+                terms[word] += TABLE_NAME_WEIGHT
+            for word in split_words(document.get("comment", "")):
+                terms[word] += 1
+            for column_name, _, column_comment in document["columns"]:
+                for word in split_words(column_name) + split_words(column_comment):
+                    terms[word] += 1
+            self._term_counts.append(terms)
+            for word in terms:
+                self._postings[word].append(i)
+        lengths = [sum(terms.values()) for terms in self._term_counts]
+        self._lengths = lengths
+        self._average_length = (sum(lengths) / len(lengths)) if lengths else 0
+
+    def _idf(self, word):
+        matches = len(self._postings[word])
+        return math.log(1 + (len(self.table_names) - matches + 0.5) / (matches + 0.5))
+
+    def _expand(self, query_word):
+        # Exact matches, plus index words that contain or are contained in the query word
+        expanded = {query_word: 1.0} if query_word in self._postings else {}
+        for word in self._postings:
+            if word == query_word or min(len(word), len(query_word)) < SUBSTRING_MATCH_MIN_LENGTH:
+                continue
+            if query_word in word or word in query_word:
+                expanded[word] = SUBSTRING_MATCH_WEIGHT
+        return expanded
+
+    def search(self, question, k=SCHEMA_PRUNING_TOP_K):
+        scores = defaultdict(float)
+        for query_word in set(split_words(question)):
+            for word, weight in self._expand(query_word).items():
+                idf = self._idf(word)
+                for i in self._postings[word]:
+                    tf = self._term_counts[i][word]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / self._average_length)
+                    scores[i] += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.table_names[item[0]]))
+        return [(self.table_names[i], score) for i, score in ranked[:k]]
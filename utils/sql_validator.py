@@ -0,0 +1,213 @@
+import difflib
+import re
+from typing import Optional, Type
+import sqlglot
+from langchain_community.tools.sql_database.tool import BaseSQLDatabaseTool
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.tools import BaseTool
+from sqlglot import exp
+from sqlglot.errors import OptimizeError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.tokens import TokenType
+from utils.blocking import run_blocking
+
+
+# sqlglot dialect for each SQLAlchemy dialect (Athena engine v3 runs Trino SQL)
+SQLGLOT_DIALECTS = {"awsathena": "trino", "postgresql": "postgres", "mysql": "mysql", "sqlite": "sqlite"}
+
+# Functions from other SQL dialects that Trino doesn't have, with what to use instead
+# (DATE_SUB is from the tips in the PromptsStack prompts)
+TRINO_REPLACEMENTS = {
+    "date_sub": "date_add with a negative amount, e.g. date_add('hour', -24, CAST(CURRENT_TIMESTAMP AS timestamp))",
+    "dateadd": "date_add('unit', amount, timestamp)",
+    "datediff": "date_diff('unit', start, end)",
+    "ifnull": "coalesce",
+    "isnull": "coalesce, or IS NULL",
+    "nvl": "coalesce",
+    "getdate": "current_timestamp",
+    "sysdate": "current_timestamp",
+    "unix_timestamp": "to_unixtime",
+    "strftime": "date_format",
+    "len": "length",
+    "charindex": "strpos",
+    "convert": "CAST",
+}
+
+TRINO_FUNCTIONS = set("""
+abs acos all_match any_match any_value approx_distinct approx_most_frequent approx_percentile approx_set
+arbitrary array_agg array_distinct array_except array_histogram array_intersect array_join array_max
+array_min array_position array_remove array_sort array_union arrays_overlap asin at_timezone atan atan2
+avg bar beta_cdf bing_tile bit_count bitwise_and bitwise_and_agg bitwise_left_shift bitwise_not
+bitwise_or bitwise_or_agg bitwise_right_shift bitwise_right_shift_arithmetic bitwise_xor bool_and
+bool_or cardinality cast cbrt ceil ceiling char2hexint checksum chr classify codepoint coalesce
+color combinations concat concat_ws contains contains_sequence corr cos cosh cosine_similarity count
+count_if covar_pop covar_samp crc32 cume_dist current_catalog current_date current_groups
+current_schema current_time current_timestamp current_timezone current_user date date_add date_diff
+date_format date_parse date_trunc day day_of_month day_of_week day_of_year degrees dense_rank dow doy
+e element_at empty_approx_set evaluate_classifier_predictions every exp extract features filter
+first_value flatten floor format format_datetime format_number from_base from_base32 from_base64
+from_base64url from_big_endian_32 from_big_endian_64 from_encoded_polyline from_geojson_geometry
+from_hex from_ieee754_32 from_ieee754_64 from_iso8601_date from_iso8601_timestamp
+from_iso8601_timestamp_nanos from_unixtime from_unixtime_nanos from_utf8 geometric_mean greatest
+grouping hamming_distance hash_counts histogram hmac_md5 hmac_sha1 hmac_sha256 hmac_sha512 hour
+human_readable_seconds if index infinity intersection_cardinality inverse_beta_cdf inverse_normal_cdf
+is_finite is_infinite is_json_scalar is_nan jaccard_index json_array_contains json_array_get
+json_array_length json_exists json_extract json_extract_scalar json_format json_parse json_query
+json_size json_value kurtosis lag last_day_of_month last_value lead learn_classifier learn_regressor
+least length levenshtein_distance listagg ln localtime localtimestamp log log10 log2 lower lpad ltrim
+luhn_check make_set_digest map map_agg map_concat map_entries map_filter map_from_entries map_keys
+map_union map_union_sum map_values map_zip_with max max_by md5 merge merge_set_digest millisecond min
+min_by minute mod month multimap_agg multimap_from_entries murmur3 nan none_match normal_cdf normalize
+now nth_value ntile nullif numeric_histogram objectid parse_data_size parse_datetime parse_duration
+percent_rank pi position pow power quantile_at_value quarter radians rand random rank reduce
+reduce_agg regexp_count regexp_extract regexp_extract_all regexp_like regexp_position regexp_replace
+regexp_split regr_intercept regr_slope regress render repeat replace reverse rgb round row row_number
+rpad rtrim second sequence sha1 sha256 sha512 shuffle sign sin sinh skewness slice soundex spatial_partitions
+split split_part split_to_map split_to_multimap spooky_hash_v2_32 spooky_hash_v2_64 sqrt st_area
+st_asbinary st_astext st_boundary st_buffer st_centroid st_contains st_distance st_geometryfromtext
+st_intersects st_point st_within starts_with stddev stddev_pop stddev_samp strpos substr substring sum
+tan tanh tdigest_agg timestamp_objectid timezone_hour timezone_minute to_base to_base32 to_base64
+to_base64url to_big_endian_32 to_big_endian_64 to_char to_date to_encoded_polyline to_geojson_geometry
+to_hex to_ieee754_32 to_ieee754_64 to_iso8601 to_milliseconds to_timestamp to_unixtime to_utf8
+transform transform_keys transform_values translate trim trim_array truncate try try_cast typeof
+upper url_decode url_encode url_extract_fragment url_extract_host url_extract_parameter
+url_extract_path url_extract_port url_extract_protocol url_extract_query uuid value_at_quantile
+values_at_quantiles var_pop var_samp variance week week_of_year width_bucket wilson_interval_lower
+wilson_interval_upper with_timezone word_stem xxhash64 year year_of_week yow zip zip_with
+""".split())
+
+MAX_LISTED_NAMES = 20
+
+# Catalog schemas every database has but the cached schema doesn't list; queries on them
+# (e.g. information_schema.columns) are checked for syntax only
+SYSTEM_SCHEMAS = {"information_schema", "pg_catalog"}
+
+
+def _close_matches(name, candidates):
+    matches = difflib.get_close_matches(name, candidates, n=3, cutoff=0.6)
+    return f" Did you mean: {', '.join(matches)}?" if matches else ""
+
+
+def _strip_literals(query):
+    # Function names are looked for outside string literals and comments
+    query = re.sub(r"'(?:[^']|'')*'", "''", query)
+    query = re.sub(r"--[^\n]*", "", query)
+    return re.sub(r"/\*.*?\*/", "", query, flags=re.S)
+
+
+def _trino_rule_problems(query, expression):
+    problems = []
+    called = {name.lower() for name in re.findall(r"\b(\w+)\s*\(", _strip_literals(query))}
+    for name, replacement in TRINO_REPLACEMENTS.items():
+        if name in called:
+            problems.append(f"{name.upper()} is not a Trino function, use {replacement} instead.")
+
+    for function in expression.find_all(exp.Anonymous):
+        name = function.name.lower()
+        if name not in TRINO_FUNCTIONS and name not in TRINO_REPLACEMENTS:
+            problems.append(f"{function.name}() is not a Trino function.")
+
+    # sqlglot parses REAL and FLOAT to the same type, so the keyword is read from the tokens
+    tokens = sqlglot.tokenize(query, read="trino")
+    for previous, token, following in zip(tokens, tokens[1:], tokens[2:]):
+        if (previous.token_type == TokenType.ALIAS and token.token_type == TokenType.FLOAT
+                and token.text.upper() == "FLOAT" and following.token_type == TokenType.R_PAREN):
+            problems.append(f"Cast to REAL instead of FLOAT in queries (line {token.line}).")
+    return problems
+
+
+def _is_system_table(table):
+    return table.db.lower() in SYSTEM_SCHEMAS
+
+
+def _table_problems(expression, table_columns):
+    cte_names = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+    problems = []
+    for table in expression.find_all(exp.Table):
+        name = table.name.lower()
+        if not name or name in cte_names or name in table_columns or _is_system_table(table):
+            continue
+        listed = ", ".join(sorted(table_columns)[:MAX_LISTED_NAMES])
+        problems.append(f"Table {table.name} does not exist.{_close_matches(name, list(table_columns))} "
+                        f"Available tables: {listed}")
+    return problems
+
+
+def _column_problems(expression, table_columns, dialect):
+    # qualify resolves every column through aliases, subqueries and CTEs against the schema
+    expression = expression.copy()
+    for table in expression.find_all(exp.Table):
+        table.set("db", None)
+        table.set("catalog", None)
+    schema = {table: {column: "UNKNOWN" for column in columns} for table, columns in table_columns.items()}
+    try:
+        qualify(expression, schema=schema, dialect=dialect, validate_qualify_columns=True)
+    except OptimizeError as e:
+        message = str(e)
+        match = re.match(r"Column '\"?(.+?)\"?' could not be resolved", message)
+        if not match:
+            return [message]
+        column = match.group(1)
+        used_tables = {table.name.lower() for table in expression.find_all(exp.Table)}
+        candidates = sorted({name for table in used_tables for name in table_columns.get(table, {})})
+        return [f"Column {column} does not exist in {', '.join(sorted(used_tables & set(table_columns)))}."
+                f"{_close_matches(column.lower(), candidates)}"]
+    except Exception:
+        # Constructs qualify doesn't support aren't reported as problems
+        pass
+    return []
+
+
+def check_query(query, table_columns, dialect="trino"):
+    # Returns a list of problems, empty when the query looks runnable. table_columns maps
+    # each (lower case) table name to its columns.
+    try:
+        statements = [s for s in sqlglot.parse(query, read=dialect) if s is not None]
+    except sqlglot.errors.ParseError as e:
+        errors = e.errors[0] if e.errors else {}
+        location = f" at line {errors['line']}, column {errors['col']}" if errors.get("line") else ""
+        return [f"Syntax error{location}: {errors.get('description', str(e))}"]
+    if not statements:
+        return ["The query is empty."]
+    if len(statements) > 1:
+        return ["Only one statement can be run at a time."]
+
+    expression = statements[0]
+    problems = _trino_rule_problems(query, expression) if dialect == "trino" else []
+    table_problems = _table_problems(expression, table_columns)
+    problems += table_problems
+    uses_system_tables = any(_is_system_table(table) for table in expression.find_all(exp.Table))
+    if not table_problems and table_columns and not uses_system_tables:
+        problems += _column_problems(expression, table_columns, dialect)
+    return problems
+
+
+class _QueryCheckerInput(BaseModel):
+    query: str = Field(..., description="A detailed and SQL query to be checked.")
+
+
+class LocalQueryCheckerTool(BaseSQLDatabaseTool, BaseTool):
+    # Checks the query locally against the cached schema instead of asking the LLM
+
+    name: str = "sql_db_query_checker"
+    description: str = """
+    Use this tool to double check if your query is correct before executing it.
+    Always use this tool before executing a query with sql_db_query!
+    """
+    args_schema: Type[BaseModel] = _QueryCheckerInput
+
+    def _run(self, query: str, run_manager: Optional[object] = None) -> str:
+        dialect = SQLGLOT_DIALECTS.get(self.db.dialect, self.db.dialect)
+        problems = check_query(query, self.db.table_columns(), dialect)
+        if not problems:
+            return f"No problems found, run the query with sql_db_query:\n{query}"
+        return ("Fix these problems and check the query again before running it:\n"
+                + "\n".join(f"- {problem}" for problem in problems)
+                + f"\n\nQuery:\n{query}")
+
+    async def _arun(self, query: str, run_manager: Optional[object] = None) -> str:
+        return await run_blocking(self._run, query)
+
+
+def with_local_query_checker(tools, db):
+    return [LocalQueryCheckerTool(db=db) if t.name == "sql_db_query_checker" else t for t in tools]
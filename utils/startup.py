@@ -0,0 +1,94 @@
+import functools
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Build the engine, prompts and schema cache in the background at start up, with the
+# health check failing until they are ready, so the first user doesn't wait for them
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "false").lower() == "true"
+HEALTH_PATH = os.environ.get("HEALTH_PATH", "/health")
+
+logger = logging.getLogger(__name__)
+
+
+def lazy(factory):
+    # Zero-argument factory called once, on first use, from any thread
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def get():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+
+    return get
+
+
+def import_modules(names):
+    for name in names:
+        importlib.import_module(name)
+
+
+class Warmup:
+    # Runs the start up steps concurrently in background threads. A failed step is
+    # logged and left to run again on first use, it doesn't keep the task unhealthy.
+
+    def __init__(self):
+        self.steps = {}
+        self.timings = {}
+        self.errors = {}
+        self.started = None
+        self.duration = None
+        self._done = threading.Event()
+
+    def add(self, name, fn):
+        self.steps[name] = fn
+
+    def _run_step(self, name):
+        start = time.perf_counter()
+        try:
+            self.steps[name]()
+        except Exception as e:
+            logger.exception("Warm-up step %s failed", name)
+            self.errors[name] = str(e)
+        self.timings[name] = round(time.perf_counter() - start, 3)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=len(self.steps) or 1, thread_name_prefix="warmup") as pool:
+            list(pool.map(self._run_step, self.steps))
+        self.duration = round(time.perf_counter() - self.started, 3)
+        logger.info("Warm-up finished in %.2fs: %s", self.duration,
+                    ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.timings.items()))
+        self._done.set()
+
+    def start(self):
+        self.started = time.perf_counter()
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def status(self):
+        return {"ready": self.ready, "duration": self.duration, "timings": self.timings, "errors": self.errors}
+
+
+def mount_health_endpoint(app, warmup=None, path=HEALTH_PATH):
+    # 503 until the warm-up has finished, when there is one. Registered ahead of
+    # Chainlit's catch-all route, like the metrics endpoint.
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def health_endpoint(request):
+        if warmup is None:
+            return JSONResponse({"ready": True})
+        return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+    app.router.routes.insert(0, Route(path, health_endpoint, methods=["GET"]))
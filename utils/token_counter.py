@@ -3,15 +3,36 @@ class TokenCounter:
         self.prompt_tokens = 0
         self.completion_tokens = 0
         self.total_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
 
     def update_tokens(self, usage):
-        self.prompt_tokens = usage.get('prompt_tokens', 0)
-        self.completion_tokens = usage.get('completion_tokens', 0)
-        self.total_tokens = usage.get('total_tokens', 0)
+        # Called once per LLM call, so the counts add up over the session
+        self.prompt_tokens += usage.get('prompt_tokens', 0)
+        self.completion_tokens += usage.get('completion_tokens', 0)
+        self.total_tokens += usage.get('total_tokens', 0)
+
+    def update_from_message(self, message):
+        # Invoked responses carry Bedrock usage in additional_kwargs, streamed ones in usage_metadata
+        usage = message.additional_kwargs.get('usage') or message.response_metadata.get('usage')
+        if not usage and getattr(message, 'usage_metadata', None):
+            usage = {
+                'prompt_tokens': message.usage_metadata.get('input_tokens', 0),
+                'completion_tokens': message.usage_metadata.get('output_tokens', 0),
+                'total_tokens': message.usage_metadata.get('total_tokens', 0),
+            }
+        self.update_tokens(usage or {})
+
+    def update_cache_usage(self, cache_read_tokens, cache_write_tokens):
+        # Bedrock prompt cache tokens, added up over the session
+        self.cache_read_tokens += cache_read_tokens
+        self.cache_write_tokens += cache_write_tokens
 
     def get_token_usage_content(self):
         return f"""
     Total Input Tokens:     {self.prompt_tokens}
     Total Output Tokens:    {self.completion_tokens}
     Total Tokens Combined:  {self.total_tokens}
+    Cache Read Tokens:      {self.cache_read_tokens}
+    Cache Write Tokens:     {self.cache_write_tokens}
 """